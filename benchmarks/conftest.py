@@ -0,0 +1,67 @@
+"""
+Provides a minimal "benchmark" fixture if pytest-benchmark is not
+installed, so the micro-benchmarks can run (with less detailed statistics)
+anywhere the tests can.
+"""
+import logging
+import time
+
+import pytest
+
+try:
+    import pytest_benchmark  # noqa: F401
+except ImportError:
+    pytest_benchmark = None
+
+_results = []
+
+
+class SimpleBenchmark(object):
+    """
+    Calls a function repeatedly for at least min_time seconds and records
+    the fastest and mean time per call.
+    """
+
+    def __init__(self, name, min_time=0.2, min_rounds=5):
+        self.name = name
+        self.min_time = min_time
+        self.min_rounds = min_rounds
+
+    def __call__(self, fn, *args, **kwargs):
+        result = fn(*args, **kwargs)
+        timings = []
+        deadline = time.perf_counter() + self.min_time
+        while len(timings) < self.min_rounds or time.perf_counter() < deadline:
+            start = time.perf_counter()
+            fn(*args, **kwargs)
+            timings.append(time.perf_counter() - start)
+        _results.append((self.name, min(timings), sum(timings) / len(timings), len(timings)))
+        return result
+
+
+if pytest_benchmark is None:
+    @pytest.fixture
+    def benchmark(request):
+        return SimpleBenchmark(request.node.name)
+
+    def pytest_terminal_summary(terminalreporter):
+        if not _results:
+            return
+        terminalreporter.section('benchmarks (install pytest-benchmark for more)')
+        terminalreporter.write_line('{0:<60} {1:>12} {2:>12} {3:>8}'.format(
+            'name', 'min (us)', 'mean (us)', 'rounds'))
+        for name, fastest, mean, rounds in _results:
+            terminalreporter.write_line('{0:<60} {1:>12.1f} {2:>12.1f} {3:>8}'.format(
+                name, fastest * 1e6, mean * 1e6, rounds))
+
+
+@pytest.fixture(autouse=True, scope='session')
+def quiet_logging():
+    """
+    Benchmarks measure message processing, not writing warnings to stderr.
+    """
+    logger = logging.getLogger('CIConsumer')
+    level = logger.level
+    logger.setLevel(logging.ERROR)
+    yield
+    logger.setLevel(level)
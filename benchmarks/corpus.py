@@ -0,0 +1,63 @@
+"""
+Messages for benchmarks, based on the fake messages used by tests.
+"""
+import copy
+import glob
+import json
+import os
+import random
+
+FAKE_MESSAGES_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'tests', 'fake_messages')
+
+# Topic of frequent messages the consumer does not handle.
+NOISE_TOPIC = '/topic/VirtualTopic.qe.ci.jenkins'
+
+
+def load_fake_messages():
+    """
+    Returns dict mapping fake message name to message data.
+    """
+    messages = {}
+    for path in sorted(glob.glob(os.path.join(FAKE_MESSAGES_DIR, '*.json'))):
+        name = os.path.splitext(os.path.basename(path))[0]
+        with open(path) as message_file:
+            messages[name] = json.load(message_file)
+    return messages
+
+
+def load_jsonl(path):
+    """
+    Yields messages from a JSONL file (e.g. written by benchmarks.loadgen).
+    """
+    with open(path) as messages_file:
+        for line in messages_file:
+            if line.strip():
+                yield json.loads(line)
+
+
+def noise_message():
+    return {
+        'topic': NOISE_TOPIC,
+        'headers': {'message-id': 'ID:noise'},
+        'body': {'msg': {'build': {'number': 1}, 'job': 'noise'}},
+    }
+
+
+def replay(count, noise_rate=0.2, seed=0):
+    """
+    Yields count messages: fake messages picked randomly and, with the given
+    rate, unhandled messages from a noisy topic.
+
+    Each message has a unique message ID.
+    """
+    rng = random.Random(seed)
+    messages = list(load_fake_messages().values())
+    for i in range(count):
+        if rng.random() < noise_rate:
+            msg = noise_message()
+        else:
+            msg = copy.deepcopy(rng.choice(messages))
+
+        msg.setdefault('headers', {})['message-id'] = 'ID:benchmark-{0}'.format(i)
+        yield msg
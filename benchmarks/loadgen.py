@@ -0,0 +1,389 @@
+"""
+Synthetic message load generator.
+
+Generates realistic messages of every supported format at a configurable
+rate and mix, and writes them to a JSONL file or passes them directly to
+CIConsumer.consume() (against a stub ResultsDB).
+
+Examples:
+
+    python -m benchmarks.loadgen --count 100000 --output messages.jsonl
+    python -m benchmarks.loadgen --count 5000 --rate 200 --consume
+"""
+import argparse
+import itertools
+import json
+import random
+import sys
+import time
+
+from benchmarks import throughput
+from benchmarks.stub_resultsdb import StubResultsDB
+
+CI_UMB_VERSIONS = ('0.1.0', '0.2.0', '0.2.1')
+
+ITEM_TYPES = (
+    'productmd-compose',
+    'product-build',
+    'component-version',
+    'container-image',
+    'redhat-container-image',
+    'redhat-module',
+    'redhat-advisory',
+    'brew-build',
+    'brew-build-group',
+    'product-scenario',
+)
+
+# Test run states, with the share of messages in each state.
+EVENTS = (('queued', 0.3), ('running', 0.3), ('complete', 0.35), ('error', 0.05))
+
+FORMATS = ('ci_umb', 'resultsdb', 'resultsdb_bulk', 'ci_metrics')
+DEFAULT_MIX = {'ci_umb': 0.7, 'resultsdb': 0.15, 'resultsdb_bulk': 0.05, 'ci_metrics': 0.1}
+
+NAMESPACE = 'baseos-ci'
+
+
+def parse_mix(value):
+    """
+    Parses message mix "format=weight,..." to dict.
+    """
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        if name not in FORMATS:
+            raise argparse.ArgumentTypeError(
+                'Unknown format "{0}", expected one of: {1}'.format(name, ', '.join(FORMATS)))
+        mix[name] = float(weight or 1)
+    return mix
+
+
+class MessageGenerator(object):
+    """
+    Generates random messages with given cardinality of fields.
+    """
+
+    def __init__(self, mix=None, items=100, run_urls=1000, payload_size=0,
+                 xunit_size=0, bulk_results=20, seed=0):
+        """
+        Args:
+            mix (dict) - Weight of each message format (see FORMATS)
+            items (int) - Number of distinct tested items
+            run_urls (int) - Number of distinct test run URLs
+            payload_size (int) - Size of additional data in each message
+            xunit_size (int) - Size of xunit data in CI messages (0 for a
+                URL to xunit file)
+            bulk_results (int) - Number of results in bulk messages
+            seed (int) - Seed for random values
+        """
+        mix = mix or DEFAULT_MIX
+        self.formats = list(mix)
+        self.weights = [mix[name] for name in self.formats]
+        self.items = items
+        self.run_urls = run_urls
+        self.payload_size = payload_size
+        self.xunit_size = xunit_size
+        self.bulk_results = bulk_results
+        self.random = random.Random(seed)
+        self.count = 0
+
+    def generate(self, count=None):
+        """
+        Yields count messages (or messages indefinitely if count is None).
+        """
+        messages = range(count) if count is not None else itertools.count()
+        for _ in messages:
+            yield self.message()
+
+    def message(self, msg_format=None):
+        msg_format = msg_format or self.random.choices(self.formats, self.weights)[0]
+        topic, body = getattr(self, '_' + msg_format)()
+        self.count += 1
+        return {
+            'topic': topic,
+            'headers': {
+                'message-id': 'ID:loadgen-{0}'.format(self.count),
+                'timestamp': str(int(time.time() * 1000)),
+                'destination': topic,
+            },
+            'body': {'msg': body},
+        }
+
+    def ci_umb_message(self, item_type, version, event='complete'):
+        """
+        Returns CI message with given artifact type, schema version and
+        test run state.
+        """
+        topic, body = self._ci_umb(item_type, version, event)
+        return {
+            'topic': topic,
+            'headers': {'message-id': 'ID:loadgen-{0}'.format(self.count)},
+            'body': {'msg': body},
+        }
+
+    def _item(self):
+        return self.random.randrange(self.items)
+
+    def _run_url(self):
+        return 'https://jenkins.example.com/job/ci-pipeline/{0}/'.format(
+            self.random.randrange(self.run_urls))
+
+    def _padding(self):
+        return 'x' * self.payload_size
+
+    def _ci_umb(self, item_type=None, version=None, event=None):
+        item_type = item_type or self.random.choice(ITEM_TYPES)
+        version = version or self.random.choice(CI_UMB_VERSIONS)
+        if event is None:
+            event = self.random.choices(
+                [name for name, _ in EVENTS], [weight for _, weight in EVENTS])[0]
+
+        run_url = self._run_url()
+        contact = {
+            'name': 'Example CI',
+            'team': 'example-team',
+            'email': 'ci@example.com',
+            'url': 'https://ci.example.com',
+            'irc': '#example-ci',
+        }
+        test = {
+            'namespace': NAMESPACE,
+            'type': 'tier1',
+            'category': self.random.choice(('functional', 'integration', 'static-analysis')),
+            'note': self._padding(),
+        }
+        if self.xunit_size:
+            test['xunit'] = '<testsuite>{0}</testsuite>'.format('x' * self.xunit_size)
+        else:
+            test['xunit'] = run_url + 'artifact/xunit.xml'
+
+        body = {
+            'version': version,
+            'artifact': self._artifact(item_type),
+            'run': {
+                'url': run_url,
+                'log': run_url + 'console',
+                'rebuild': run_url + 'rebuild/parametrized',
+            },
+            'system': [{
+                'os': 'RHEL-8.2.0-20200404.0',
+                'provider': 'openstack',
+                'architecture': 'x86_64',
+                'variant': 'BaseOS',
+            }],
+            'pipeline': {'id': 'pipeline-{0}'.format(self._item()), 'name': 'tier1'},
+        }
+
+        recipients = ['user1', 'user2']
+        result = self.random.choice(('passed', 'failed', 'info', 'needs_inspection'))
+        reason = 'Infrastructure failure'
+        if version == '0.1.0':
+            body.update(test)
+            body['ci'] = contact
+            body['status'] = result
+            body['recipients'] = recipients
+            body['reason'] = reason
+        else:
+            test['result'] = result
+            body['test'] = test
+            body['notification'] = {'recipients': recipients}
+            body['error'] = {'reason': reason}
+            if version == '0.2.0':
+                body['ci'] = contact
+            else:
+                body['contact'] = contact
+
+        topic = '/topic/VirtualTopic.eng.ci.{0}.{1}.test.{2}'.format(NAMESPACE, item_type, event)
+        return topic, body
+
+    def _artifact(self, item_type):
+        item = self._item()
+        nvr = 'package{0}-1.0-1.el8'.format(item)
+        artifacts = {
+            'productmd-compose': lambda: {
+                'id': 'RHEL-8.2.0-2020{0:04d}.0'.format(item),
+            },
+            'product-build': lambda: {
+                'name': 'product{0}'.format(item),
+                'version': '1.0',
+                'release': '1',
+            },
+            'component-version': lambda: {
+                'component': 'component{0}'.format(item),
+                'version': '1.0',
+            },
+            'container-image': lambda: {
+                'repository': 'registry.example.com/image{0}'.format(item),
+                'digest': 'sha256:{0:064x}'.format(item),
+                'nvr': 'image{0}-1.0-1'.format(item),
+            },
+            'redhat-container-image': lambda: {
+                'id': 'sha256:{0:064x}'.format(item),
+                'full_names': ['registry.example.com/image{0}:1.0'.format(item)],
+                'issuer': 'builder',
+                'component': 'image{0}-container'.format(item),
+                'namespace': 'example',
+                'scratch': False,
+                'nvr': 'image{0}-container-1.0-1'.format(item),
+                'source': 'git://example.com/image{0}#master'.format(item),
+                'task_id': item,
+                'build_id': item,
+            },
+            'redhat-module': lambda: {
+                'id': item,
+                'nsvc': 'module{0}:stream-1:20200101:c0ffee'.format(item),
+                'name': 'module{0}'.format(item),
+                'stream': 'stream-1',
+                'version': '20200101',
+                'context': 'c0ffee',
+                'issuer': 'builder',
+            },
+            'redhat-advisory': lambda: {
+                'id': 'RHBA-2020:{0:04d}'.format(item),
+                'numeric_id': item,
+            },
+            'brew-build': lambda: {
+                'id': item,
+                'nvr': nvr,
+                'component': 'package{0}'.format(item),
+                'scratch': self.random.random() < 0.1,
+                'issuer': 'developer',
+            },
+            'brew-build-group': lambda: {
+                'id': 'sha256:{0:064x}'.format(item),
+                'repository': 'https://example.com/repo/{0}'.format(item),
+                'builds': [{'nvr': nvr, 'id': item}],
+            },
+            'product-scenario': lambda: {
+                'id': 'scenario{0}'.format(item),
+                'products': [
+                    {'id': 'product{0}'.format(item), 'nvr': 'product{0}-1.0-1'.format(item)},
+                    {'id': 'product{0}-extra'.format(item)},
+                ],
+            },
+        }
+        artifact = artifacts[item_type]()
+        artifact['type'] = item_type
+        return artifact
+
+    def _result_data(self):
+        data = {
+            'item': 'package{0}-1.0-1.el8'.format(self._item()),
+            'type': 'koji_build',
+        }
+        if self.payload_size:
+            data['details'] = self._padding()
+        return data
+
+    def _resultsdb(self):
+        run_url = self._run_url()
+        body = {
+            'testcase': {
+                'name': 'example.test.{0}'.format(self.random.randrange(20)),
+                'ref_url': 'https://ci.example.com/tests',
+            },
+            'outcome': self.random.choice(('PASSED', 'FAILED')),
+            'ref_url': run_url,
+            'note': '',
+            'data': self._result_data(),
+        }
+        return '/topic/VirtualTopic.eng.example.result', body
+
+    def _resultsdb_bulk(self):
+        run_url = self._run_url()
+        body = {
+            'ref_url': run_url,
+            'results': {
+                'example.test.{0}'.format(i): {
+                    'outcome': self.random.choice(('PASSED', 'FAILED')),
+                    'ref_url': '{0}test/{1}'.format(run_url, i),
+                    'data': self._result_data(),
+                }
+                for i in range(self.bulk_results)
+            },
+        }
+        return '/topic/VirtualTopic.eng.example.bulk', body
+
+    def _ci_metrics(self):
+        item = self._item()
+        run_url = self._run_url()
+        body = {
+            'team': 'baseos',
+            'job_name': 'ci-package{0}-tier1'.format(item),
+            'jenkins_job_url': 'https://jenkins.example.com/job/ci-package{0}/'.format(item),
+            'jenkins_build_url': run_url,
+            'build_type': self.random.choice(('official', 'scratch')),
+            'brew_task_id': item,
+            'component': 'package{0}-1.0-1.el8'.format(item),
+            'recipients': 'user1,user2',
+            'CI_tier': 1,
+            'tests': [
+                {'executor': 'CI_OSP', 'executed': 10, 'failed': self.random.randrange(2)},
+                {'executor': 'beaker', 'executed': 5, 'failed': 0},
+            ],
+        }
+        return '/topic/VirtualTopic.eng.platformci.tier1.result', body
+
+
+def throttle(messages, rate):
+    """
+    Yields messages at given rate per second (0 for no limit).
+    """
+    start = time.time()
+    for i, msg in enumerate(messages):
+        if rate:
+            delay = start + i / rate - time.time()
+            if delay > 0:
+                time.sleep(delay)
+        yield msg
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--count', type=int, default=1000)
+    parser.add_argument('--rate', type=float, default=0,
+                        help='messages per second (0 for no limit)')
+    parser.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX,
+                        help='weights of formats, e.g. "ci_umb=7,resultsdb=2,ci_metrics=1"')
+    parser.add_argument('--items', type=int, default=100)
+    parser.add_argument('--run-urls', type=int, default=1000)
+    parser.add_argument('--payload-size', type=int, default=0)
+    parser.add_argument('--xunit-size', type=int, default=0)
+    parser.add_argument('--bulk-results', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    output = parser.add_mutually_exclusive_group()
+    output.add_argument('--output', help='JSONL file to write messages to (default stdout)')
+    output.add_argument('--consume', action='store_true',
+                        help='pass messages to CIConsumer.consume() with stub ResultsDB')
+    parser.add_argument('--latency', type=float, default=0,
+                        help='stub ResultsDB latency in seconds (with --consume)')
+    args = parser.parse_args(argv)
+
+    generator = MessageGenerator(
+        mix=args.mix,
+        items=args.items,
+        run_urls=args.run_urls,
+        payload_size=args.payload_size,
+        xunit_size=args.xunit_size,
+        bulk_results=args.bulk_results,
+        seed=args.seed)
+    messages = throttle(generator.generate(args.count), args.rate)
+
+    if args.consume:
+        with StubResultsDB(latency=args.latency) as stub:
+            results = throughput.run(messages, stub)
+        for key, value in sorted(results.items()):
+            print('{0}: {1:.6g}'.format(key, value))
+        return results
+
+    output_file = open(args.output, 'w') if args.output else sys.stdout
+    try:
+        for msg in messages:
+            output_file.write(json.dumps(msg) + '\n')
+    finally:
+        if args.output:
+            output_file.close()
+
+
+if __name__ == '__main__':
+    main()
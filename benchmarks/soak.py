@@ -0,0 +1,244 @@
+"""
+Soak benchmark: feeds generated messages through CIConsumer.consume() for a
+long time against a stub ResultsDB, sampling resource usage of the process
+to catch leaks.
+
+Reports growth of RSS, open file descriptors and pooled HTTP connections
+per hour, and the top allocators of memory (with tracemalloc).
+
+Example:
+
+    python -m benchmarks.soak --duration 4h --interval 1m --rate 50 \\
+        --output soak.json
+"""
+import argparse
+import collections
+import json
+import time
+import tracemalloc
+
+import psutil
+
+from benchmarks import loadgen, throughput
+from benchmarks.stub_resultsdb import StubResultsDB
+
+Sample = collections.namedtuple(
+    'Sample', ('elapsed', 'messages', 'rss', 'cpu_percent', 'fds', 'connections'))
+
+DURATION_UNITS = {'s': 1, 'm': 60, 'h': 3600}
+
+
+def parse_duration(value):
+    """
+    Parses duration in seconds with optional unit suffix ("90", "30m", "4h").
+    """
+    unit = DURATION_UNITS.get(value[-1:])
+    if unit is None:
+        return float(value)
+    return float(value[:-1]) * unit
+
+
+def slope(xs, ys):
+    """
+    Returns slope of least squares fit of ys over xs.
+    """
+    count = len(xs)
+    if count < 2:
+        return 0
+    mean_x = sum(xs) / count
+    mean_y = sum(ys) / count
+    variance = sum((x - mean_x) ** 2 for x in xs)
+    if not variance:
+        return 0
+    return sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / variance
+
+
+class ResourceSampler(object):
+    """
+    Samples resource usage of a process.
+    """
+
+    def __init__(self, port, process=None):
+        """
+        Args:
+            port (int) - Port of the ResultsDB server; established
+                connections to it are counted as pooled HTTP connections
+            process (psutil.Process) - Sampled process (default current)
+        """
+        self.port = port
+        self.process = process or psutil.Process()
+        # Process.connections() was renamed in psutil 6.0.
+        self._connections = getattr(
+            self.process, 'net_connections', None) or self.process.connections
+        self.process.cpu_percent()
+
+    def sample(self, elapsed, messages):
+        return Sample(
+            elapsed=elapsed,
+            messages=messages,
+            rss=self.process.memory_info().rss,
+            cpu_percent=self.process.cpu_percent(),
+            fds=self._fds(),
+            connections=self._pooled_connections(),
+        )
+
+    def _fds(self):
+        try:
+            return self.process.num_fds()
+        except AttributeError:
+            # Windows
+            return self.process.num_handles()
+
+    def _pooled_connections(self):
+        established = (
+            connection for connection in self._connections(kind='tcp')
+            if connection.status == psutil.CONN_ESTABLISHED)
+        return sum(
+            1 for connection in established
+            if connection.raddr and connection.raddr[1] == self.port)
+
+
+def growth(samples):
+    """
+    Returns dict with growth of sampled values per hour.
+    """
+    hours = [sample.elapsed / 3600 for sample in samples]
+    return {
+        'rss_bytes_per_hour': slope(hours, [sample.rss for sample in samples]),
+        'fds_per_hour': slope(hours, [sample.fds for sample in samples]),
+        'connections_per_hour': slope(hours, [sample.connections for sample in samples]),
+    }
+
+
+def top_allocators(snapshot, baseline, limit):
+    """
+    Returns lines describing code which allocated the most memory since the
+    baseline snapshot.
+    """
+    filters = [
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    ]
+    stats = snapshot.filter_traces(filters).compare_to(baseline.filter_traces(filters), 'lineno')
+    return [str(stat) for stat in stats[:limit]]
+
+
+def soak(generator, stub, duration, interval, rate=0, workers=0, trace=True, top=10):
+    """
+    Consumes generated messages for duration seconds and returns report
+    as dict.
+
+    Resource usage is sampled every interval seconds. If trace is set,
+    tracemalloc compares allocations at the end with allocations after the
+    first interval (to skip warm-up of caches and connection pools).
+    """
+    sampler = ResourceSampler(stub.port)
+    samples = []
+    baseline = None
+    started_tracing = trace and not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+
+    try:
+        with throughput.consumer_for(stub, workers=workers) as ci_consumer:
+            start = time.time()
+            next_sample = start
+            messages = 0
+            for msg in loadgen.throttle(generator.generate(), rate):
+                now = time.time()
+                if now >= next_sample:
+                    samples.append(sampler.sample(now - start, messages))
+                    next_sample += interval
+                    if trace and baseline is None and len(samples) == 2:
+                        baseline = tracemalloc.take_snapshot()
+                if now - start >= duration:
+                    break
+
+                ci_consumer.consume(msg)
+                messages += 1
+
+        allocators = []
+        if trace:
+            snapshot = tracemalloc.take_snapshot()
+            allocators = top_allocators(snapshot, baseline or snapshot, top)
+    finally:
+        if started_tracing:
+            tracemalloc.stop()
+
+    # Skip the first sample taken before any message was consumed.
+    steady = samples[1:] if len(samples) > 2 else samples
+    return {
+        'seconds': samples[-1].elapsed if samples else 0,
+        'messages': messages,
+        'samples': [sample._asdict() for sample in samples],
+        'growth': growth(steady),
+        'cpu_percent_mean': (
+            sum(sample.cpu_percent for sample in steady) / len(steady) if steady else 0),
+        'top_allocators': allocators,
+        'results_created': stub.results,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--duration', type=parse_duration, default=3600,
+                        help='how long to run, e.g. "90s", "30m" or "4h"')
+    parser.add_argument('--interval', type=parse_duration, default=60,
+                        help='how often to sample resource usage')
+    parser.add_argument('--rate', type=float, default=0,
+                        help='messages per second (0 for no limit)')
+    parser.add_argument('--workers', type=int, default=0,
+                        help='submission queue workers (0 posts from consumer)')
+    parser.add_argument('--latency', type=float, default=0,
+                        help='stub ResultsDB latency in seconds')
+    parser.add_argument('--error-rate', type=float, default=0,
+                        help='rate of stub ResultsDB HTTP 500 responses')
+    parser.add_argument('--mix', type=loadgen.parse_mix, default=loadgen.DEFAULT_MIX)
+    parser.add_argument('--items', type=int, default=100)
+    parser.add_argument('--run-urls', type=int, default=1000)
+    parser.add_argument('--payload-size', type=int, default=0)
+    parser.add_argument('--xunit-size', type=int, default=0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--top', type=int, default=10,
+                        help='number of top allocators to report')
+    parser.add_argument('--no-tracemalloc', dest='trace', action='store_false',
+                        help='do not trace memory allocations (lower overhead)')
+    parser.add_argument('--output', help='save report to JSON file')
+    args = parser.parse_args(argv)
+
+    generator = loadgen.MessageGenerator(
+        mix=args.mix,
+        items=args.items,
+        run_urls=args.run_urls,
+        payload_size=args.payload_size,
+        xunit_size=args.xunit_size,
+        seed=args.seed)
+    stub = StubResultsDB(latency=args.latency, error_rate=args.error_rate, seed=args.seed)
+    with stub:
+        report = soak(
+            generator, stub,
+            duration=args.duration,
+            interval=args.interval,
+            rate=args.rate,
+            workers=args.workers,
+            trace=args.trace,
+            top=args.top)
+
+    print('messages: {0} in {1:.0f} s'.format(report['messages'], report['seconds']))
+    print('cpu_percent_mean: {0:.1f}'.format(report['cpu_percent_mean']))
+    for key, value in sorted(report['growth'].items()):
+        print('{0}: {1:.6g}'.format(key, value))
+    if report['top_allocators']:
+        print('Top allocators:')
+        for line in report['top_allocators']:
+            print('  ' + line)
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(report, output_file, indent=2, sort_keys=True)
+
+    return report
+
+
+if __name__ == '__main__':
+    main()
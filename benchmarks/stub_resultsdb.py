@@ -0,0 +1,167 @@
+"""
+In-process stub of the ResultsDB v2.0 API (/results and /groups) with
+configurable latency and failure injection.
+"""
+import json
+import random
+import socketserver
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+API_PATH = '/api/v2.0'
+
+
+class _Server(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately; avoid delayed ACK stalls.
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        stub = self.server.stub
+        if not self.path.startswith(API_PATH + '/groups'):
+            self._reply(404, {'message': 'Not found'})
+            return
+
+        status = stub.inject('GET')
+        if status:
+            self._reply(status, {'message': 'Injected failure'})
+            return
+
+        self._reply(200, {'data': stub.find_groups(self.path)})
+
+    def do_POST(self):
+        stub = self.server.stub
+        length = int(self.headers.get('content-length', 0))
+        body = self.rfile.read(length)
+
+        if self.path != API_PATH + '/results':
+            self._reply(404, {'message': 'Not found'})
+            return
+
+        status = stub.inject('POST')
+        if status:
+            self._reply(status, {'message': 'Injected failure'})
+            return
+
+        try:
+            result = json.loads(body.decode('utf-8'))
+        except ValueError:
+            self._reply(400, {'message': 'Invalid JSON'})
+            return
+
+        stub.add_result(result)
+        self._reply(201, {'id': stub.results})
+
+    def _reply(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('content-type', 'application/json')
+        self.send_header('content-length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class StubResultsDB(object):
+    """
+    Stub ResultsDB server running in background threads.
+
+    Counts requests and created results.
+    """
+
+    def __init__(self, latency=0, error_rate=0, bad_request_rate=0, seed=None):
+        """
+        Args:
+            latency (float) - Seconds to wait before replying
+            error_rate (float) - Rate (0 to 1) of requests failing with HTTP 500
+            bad_request_rate (float) - Rate (0 to 1) of results rejected with
+                HTTP 400
+            seed (int) - Seed for random failures
+        """
+        self.latency = latency
+        self.error_rate = error_rate
+        self.bad_request_rate = bad_request_rate
+        self.requests = {'GET': 0, 'POST': 0}
+        self.errors = 0
+        self.rejected = 0
+        self.results = 0
+        self._groups = {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = _Server(('127.0.0.1', 0), _Handler)
+        self._server.stub = self
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+
+    @property
+    def port(self):
+        return self._server.server_port
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{0}{1}'.format(self.port, API_PATH)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def reset(self):
+        with self._lock:
+            self.requests = {'GET': 0, 'POST': 0}
+            self.errors = 0
+            self.rejected = 0
+            self.results = 0
+            self._groups.clear()
+
+    def inject(self, method):
+        """
+        Counts a request, waits the configured latency and returns error
+        status to reply with, or None.
+        """
+        if self.latency:
+            time.sleep(self.latency)
+
+        with self._lock:
+            self.requests[method] += 1
+            if self._random.random() < self.error_rate:
+                self.errors += 1
+                return 500
+            if method == 'POST' and self._random.random() < self.bad_request_rate:
+                self.rejected += 1
+                return 400
+        return None
+
+    def find_groups(self, path):
+        description = path.partition('description=')[2]
+        with self._lock:
+            group = self._groups.get(description)
+        return [group] if group else []
+
+    def add_result(self, result):
+        with self._lock:
+            self.results += 1
+            for group in result.get('groups') or []:
+                description = group.get('description')
+                if description and description not in self._groups:
+                    self._groups[description] = {
+                        'uuid': group.get('uuid') or str(uuid.uuid4()),
+                        'description': description,
+                    }
@@ -0,0 +1,129 @@
+"""
+Micro-benchmarks for message parsing and transformation.
+
+Run with:
+
+    python -m pytest benchmarks
+"""
+import copy
+
+import mock
+import pytest
+
+from benchmarks import corpus
+from resultsdbupdater import message, serializer, utils
+
+FAKE_MESSAGES = corpus.load_fake_messages()
+
+# Fake messages with each artifact type handled by handle_ci_umb().
+CI_UMB_MESSAGES = {
+    'productmd-compose': 'compose_message_v2',
+    'product-build': 'product_build',
+    'component-version': 'pelc_component_version',
+    'container-image': 'container_image_message',
+    'redhat-container-image': 'redhat-container-image.test.complete',
+    'redhat-module': 'redhat_module_message',
+    'redhat-advisory': 'redhat-advisory.test.complete',
+    'brew-build': 'platformci_success_message',
+    'brew-build-group': 'brew-build-group.test.complete',
+    'product-scenario': 'product-scenario.test.complete',
+}
+
+
+def fake_message(name, version=None):
+    msg_data = copy.deepcopy(FAKE_MESSAGES[name])
+    if version is not None:
+        msg_data['body']['msg']['version'] = version
+    return msg_data
+
+
+def bulk_message(count):
+    return {
+        'topic': '/topic/VirtualTopic.eng.ci.bulk',
+        'headers': {'message-id': 'ID:bulk'},
+        'body': {'msg': {
+            'ref_url': 'https://ci.example.com/job/1',
+            'results': {
+                'example.test.{0}'.format(i): {
+                    'outcome': 'PASSED',
+                    'ref_url': 'https://ci.example.com/job/1/test/{0}'.format(i),
+                    'data': {'item': 'package-1.0-1.el8', 'type': 'koji_build'},
+                }
+                for i in range(count)
+            },
+        }},
+    }
+
+
+def large_data():
+    return {
+        'item': 'package-1.0-1.el8',
+        'log': 'x' * 100000,
+        'builds': ['package-{0}-1.0-1.el8'.format(i) for i in range(1000)],
+        'products': [{'id': str(i), 'nvr': 'product-{0}'.format(i)} for i in range(200)],
+        'metadata': {'key{0}'.format(i): 'value' for i in range(100)},
+    }
+
+
+@pytest.mark.parametrize('version', ('0.1.0', '0.2.0', '0.2.1'))
+def test_create_message(benchmark, version):
+    msg_data = fake_message('compose_message_v2', version)
+    msg = benchmark(message.create_message, msg_data)
+    assert msg.version == version
+
+
+def test_message_get(benchmark):
+    msg = message.create_message(fake_message('redhat-advisory.test.complete'))
+    assert benchmark(msg.get, 'pipeline', 'stage', 'name', default=None) is not None
+
+
+def test_message_system(benchmark):
+    msg = message.create_message(fake_message('redhat-advisory.test.complete'))
+    benchmark(msg.system, 'provider', default=None)
+
+
+def test_message_contact_dict(benchmark):
+    msg = message.create_message(fake_message('redhat-advisory.test.complete'))
+    assert benchmark(lambda: msg.contact_dict)['ci_name']
+
+
+@pytest.mark.parametrize('item_type', sorted(CI_UMB_MESSAGES))
+def test_handle_ci_umb(benchmark, item_type):
+    msg = message.create_message(fake_message(CI_UMB_MESSAGES[item_type]))
+    assert msg.get('artifact', 'type') == item_type
+
+    with mock.patch('resultsdbupdater.utils.create_result') as mock_create_result:
+        benchmark(utils.handle_ci_umb, msg)
+    mock_create_result.assert_called()
+
+
+def test_json_serialize_data(benchmark):
+    data = large_data()
+    benchmark(utils.json_serialize_data, data)
+
+
+def test_crop_data(benchmark):
+    data = utils.json_serialize_data(large_data())
+    # Cropping is in place, later rounds measure the check only.
+    benchmark(utils.crop_data, mock.Mock(), data)
+    assert len(data['log']) == utils.MAX_RESULT_DATA_SIZE
+
+
+@pytest.mark.parametrize('backend', serializer.BACKENDS)
+def test_result_payload(benchmark, backend):
+    name, dumps = serializer.select_backend(backend)
+    if name != backend:
+        pytest.skip('{0} is not installed'.format(backend))
+
+    data = large_data()
+    with mock.patch('resultsdbupdater.serializer.dumps', dumps):
+        benchmark(utils.result_payload, mock.Mock(), 'testcase', 'PASSED', 'ref_url', data)
+
+
+@pytest.mark.parametrize('count', (10, 100, 1000))
+def test_handle_resultsdb_format_bulk(benchmark, count):
+    msg = message.create_message(bulk_message(count))
+
+    with mock.patch('resultsdbupdater.utils.write_results') as mock_write_results:
+        benchmark(utils.handle_resultsdb_format, msg)
+    assert len(mock_write_results.call_args[0][1]) == count
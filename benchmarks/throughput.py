@@ -0,0 +1,171 @@
+"""
+End-to-end throughput benchmark: replays messages through
+CIConsumer.consume() against a stub ResultsDB.
+
+Example:
+
+    python -m benchmarks.throughput --messages 5000 --latency 0.002 \\
+        --output benchmark.json --compare previous.json
+
+Generated messages (see benchmarks.loadgen) can be replayed with --input.
+"""
+import argparse
+import contextlib
+import datetime
+import itertools
+import json
+import logging
+import subprocess
+import time
+
+import mock
+
+from benchmarks import corpus
+from benchmarks.stub_resultsdb import StubResultsDB
+
+
+class FakeHub(object):
+    config = {}
+
+
+def percentile(values, rate):
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(rate * len(values)))]
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL
+        ).decode('utf-8').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+@contextlib.contextmanager
+def consumer_for(stub, workers=0, **config_overrides):
+    """
+    Yields CIConsumer posting results to the stub ResultsDB.
+    """
+    from resultsdbupdater import consumer, utils
+
+    overrides = dict(config_overrides, RESULTSDB_API_URL=stub.url, SUBMIT_WORKERS=workers)
+    with mock.patch.multiple('resultsdbupdater.config', **overrides):
+        utils.group_cache.clear()
+        ci_consumer = consumer.CIConsumer(FakeHub())
+        try:
+            yield ci_consumer
+        finally:
+            ci_consumer.stop()
+
+
+def run(messages, stub, workers=0):
+    """
+    Consumes messages and returns benchmark results as dict.
+    """
+    latencies = []
+    start = time.time()
+    with consumer_for(stub, workers=workers) as ci_consumer:
+        for msg in messages:
+            consume_start = time.time()
+            ci_consumer.consume(msg)
+            latencies.append(time.time() - consume_start)
+    duration = time.time() - start
+
+    count = len(latencies)
+    requests = sum(stub.requests.values())
+    return {
+        'messages': count,
+        'seconds': duration,
+        'messages_per_second': count / duration if duration else 0,
+        'latency_p50': percentile(latencies, 0.5),
+        'latency_p99': percentile(latencies, 0.99),
+        'requests': requests,
+        'requests_per_message': requests / count if count else 0,
+        'results_created': stub.results,
+        'errors_injected': stub.errors,
+        'results_rejected': stub.rejected,
+    }
+
+
+def compare(current, previous):
+    """
+    Returns lines comparing results with previously saved results.
+    """
+    lines = []
+    for key in ('messages_per_second', 'latency_p50', 'latency_p99', 'requests_per_message'):
+        before = previous['results'].get(key)
+        after = current['results'].get(key)
+        if before:
+            lines.append('{0}: {1:.6g} -> {2:.6g} ({3:+.1f}%)'.format(
+                key, before, after, (after - before) / before * 100))
+    return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--messages', type=int, default=2000)
+    parser.add_argument('--noise-rate', type=float, default=0.2,
+                        help='rate of unhandled messages from a noisy topic')
+    parser.add_argument('--workers', type=int, default=0,
+                        help='submission queue workers (0 posts from consumer)')
+    parser.add_argument('--latency', type=float, default=0,
+                        help='stub ResultsDB latency in seconds')
+    parser.add_argument('--error-rate', type=float, default=0,
+                        help='rate of stub ResultsDB HTTP 500 responses')
+    parser.add_argument('--bad-request-rate', type=float, default=0,
+                        help='rate of results rejected with HTTP 400')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--input',
+                        help='replay messages from JSONL file (see benchmarks.loadgen)')
+    parser.add_argument('--output', help='save results to JSON file')
+    parser.add_argument('--compare', help='compare with results saved in JSON file')
+    args = parser.parse_args(argv)
+
+    params = {
+        key: getattr(args, key)
+        for key in ('messages', 'noise_rate', 'workers', 'latency', 'error_rate',
+                    'bad_request_rate', 'seed', 'input')
+    }
+    stub = StubResultsDB(
+        latency=args.latency,
+        error_rate=args.error_rate,
+        bad_request_rate=args.bad_request_rate,
+        seed=args.seed)
+    with stub:
+        if args.input:
+            messages = list(itertools.islice(corpus.load_jsonl(args.input), args.messages))
+        else:
+            messages = list(corpus.replay(args.messages, args.noise_rate, args.seed))
+        results = run(messages, stub, workers=args.workers)
+
+    report = {
+        'commit': git_commit(),
+        'date': datetime.datetime.utcnow().isoformat(),
+        'params': params,
+        'results': results,
+    }
+
+    for key, value in sorted(results.items()):
+        print('{0}: {1:.6g}'.format(key, value))
+
+    if args.compare:
+        with open(args.compare) as previous_file:
+            previous = json.load(previous_file)
+        print('Compared with {0}:'.format(previous.get('commit')))
+        for line in compare(report, previous):
+            print('  ' + line)
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(report, output_file, indent=2, sort_keys=True)
+
+    return report
+
+
+if __name__ == '__main__':
+    # Don't measure logging of injected failures.
+    logging.getLogger('CIConsumer').setLevel(logging.CRITICAL)
+    main()
@@ -24,4 +24,122 @@ config = {
     # 'resultsdb-updater.resultsdb_pass': 'password',
     'resultsdb-updater.topics': [],
     'resultsdb-updater.requests_timeout': 15,
+    'resultsdb-updater.max_retries': 24,
+    # Stop sending requests for reset_timeout seconds if at least given
+    # rate of recent requests failed (0 disables the circuit breaker). With
+    # the circuit breaker enabled, failed requests are retried only up to
+    # circuit_breaker_max_retries times, so failures are detected in seconds.
+    # Requires spool_path, or submit_workers with retry_deadline (and the
+    # requests http_client), which post results rejected by the open circuit
+    # later; the service refuses to start otherwise.
+    'resultsdb-updater.circuit_breaker_failure_rate': 0,
+    'resultsdb-updater.circuit_breaker_window': 20,
+    'resultsdb-updater.circuit_breaker_min_calls': 5,
+    'resultsdb-updater.circuit_breaker_reset_timeout': 30,
+    'resultsdb-updater.circuit_breaker_max_retries': 3,
+    # Post results from background worker threads instead of the consumer
+    # thread (0 to disable). The full queue policy is 'block' or 'reject'.
+    'resultsdb-updater.submit_workers': 0,
+    'resultsdb-updater.submit_queue_size': 1000,
+    'resultsdb-updater.submit_queue_full_policy': 'block',
+    # Post up to batch_size results in a single request to a bulk endpoint
+    # (relative to resultsdb_api_url) if ResultsDB provides one. With
+    # submit_workers, results of messages received within batch_window
+    # seconds are posted together (batch_window requires bulk_results_path).
+    # 'resultsdb-updater.bulk_results_path': '/results/bulk',
+    'resultsdb-updater.batch_size': 100,
+    'resultsdb-updater.batch_window': 0,
+    # Maximum number of results of a single message posted in parallel.
+    'resultsdb-updater.post_concurrency': 1,
+    # HTTP client: 'requests' or 'asyncio' (requires aiohttp, installed with
+    # the "asyncio" extra). With the asyncio client and submit_workers set,
+    # results of up to submit_queue_size messages are posted concurrently
+    # from one thread.
+    'resultsdb-updater.http_client': 'requests',
+    'resultsdb-updater.async_max_connections': 100,
+    # Cache of ResultsDB groups looked up by description (ref_url of test
+    # runs); size 0 disables the cache. TTL is in seconds.
+    'resultsdb-updater.group_cache_size': 1000,
+    'resultsdb-updater.group_cache_ttl': 3600,
+    # Store results in a spool on a persistent volume and post them in
+    # order in the background (takes precedence over submit_workers). The
+    # fsync policy is 'always', 'normal' or 'never'.
+    # 'resultsdb-updater.spool_path': '/var/lib/resultsdb-updater/spool.db',
+    'resultsdb-updater.spool_fsync': 'always',
+    'resultsdb-updater.spool_retry_interval': 10,
+    # With submit_workers, retry failed results for up to retry_deadline
+    # seconds without blocking other messages (0 to disable). Results not
+    # posted in time are stored in retry_fallback_path, which can be later
+    # used as spool_path to post them. Both are ignored with the asyncio
+    # http_client, which retries failed requests itself.
+    'resultsdb-updater.retry_deadline': 0,
+    # 'resultsdb-updater.retry_fallback_path': '/var/lib/resultsdb-updater/failed.db',
+    # Skip messages redelivered by the broker if their results were already
+    # posted or queued; remembers dedup_cache_size last message IDs (0
+    # disables the cache), optionally stored in dedup_cache_path.
+    'resultsdb-updater.dedup_cache_size': 0,
+    # 'resultsdb-updater.dedup_cache_path': '/var/lib/resultsdb-updater/processed.db',
+    # Hold results of queued and running CI messages for supersede_window
+    # seconds and drop them if a later state of the same test run (same test
+    # case, item and run URL) arrives in the meantime (0 to disable). Held
+    # results are lost if the service is killed.
+    'resultsdb-updater.supersede_window': 0,
+    # Serve Prometheus metrics on http://<metrics_addr>:<metrics_port>/metrics
+    # 'resultsdb-updater.metrics_port': 8000,
+    # 'resultsdb-updater.metrics_addr': '0.0.0.0',
+    # Warn if the consumer receives messages more than given seconds after
+    # they were sent to the broker (0 to disable).
+    'resultsdb-updater.lag_warning_threshold': 0,
+    # Profile every profile_every-th message, from start or after receiving
+    # profile_signal (which toggles profiling), for up to profile_duration
+    # seconds (0 for no limit). Statistics are written to profile_path (and
+    # a text report to profile_path + '.txt') when profiling stops, and
+    # served on the metrics port at /profile. Results posted by
+    # submit_workers or the spool thread are profiled too, but not requests
+    # sent in parallel (post_concurrency) or by the asyncio http_client.
+    'resultsdb-updater.profile_enabled': False,
+    # 'resultsdb-updater.profile_signal': 'SIGUSR1',
+    'resultsdb-updater.profile_every': 1,
+    'resultsdb-updater.profile_duration': 0,
+    # 'resultsdb-updater.profile_path': '/etc/resultsdb/profile.stats',
+
+    # With debug log level, received messages and result payloads are logged
+    # cropped to log_payload_limit characters (0 for no limit), and only for
+    # every log_payload_every-th message or result.
+    'resultsdb-updater.log_payload_limit': 1024,
+    'resultsdb-updater.log_payload_every': 1,
+
+    # Write log messages from a background thread (log_async), as JSON
+    # objects with message ID, topic, handler and elapsed time fields
+    # (log_json), and drop repeated warnings with the same format logged
+    # within log_rate_limit seconds (0 to disable).
+    'resultsdb-updater.log_async': False,
+    'resultsdb-updater.log_json': False,
+    'resultsdb-updater.log_rate_limit': 0,
+
+    # Drop messages from topics matching a pattern in topic_deny, or not
+    # matching any pattern in topic_allow (if not empty), without parsing.
+    # Patterns match topics starting with the same "."-separated components,
+    # "*" matches any single component.
+    'resultsdb-updater.topic_allow': [],
+    'resultsdb-updater.topic_deny': [
+        # '/topic/VirtualTopic.qe.ci.jenkins',
+    ],
+    'resultsdb-updater.routing_cache_size': 1024,
+
+    # JSON library used to serialize result request bodies: "orjson",
+    # "ujson", "json" or "auto" to use the fastest one installed.
+    'resultsdb-updater.json_backend': 'auto',
+
+    # Mappings of additional artifact types in CI messages to result data
+    # (see resultsdbupdater/artifacts.py for the format).
+    # 'resultsdb-updater.artifact_mappings': {
+    #     'koji-build': [
+    #         {'key': 'item', 'path': 'artifact.nvr'},
+    #         {'key': 'type', 'value': 'koji-build'},
+    #         {'key': 'category', 'path': 'result.category'},
+    #         {'key': 'log', 'path': 'run.log'},
+    #         {'key': 'system_os', 'path': 'system.os', 'required': False},
+    #     ],
+    # },
 }
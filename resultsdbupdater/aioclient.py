@@ -0,0 +1,318 @@
+"""
+ResultsDB client based on asyncio, an alternative to the requests session
+for deployments handling many messages.
+
+All requests are sent from a single event loop running in a background
+thread, so the number of requests in flight is limited only by the
+connection pool size, not by number of threads.
+
+Requires aiohttp.
+"""
+import asyncio
+import concurrent.futures
+import ssl
+import threading
+import time
+
+from . import config, exceptions, metrics, session
+from .message import debug_payload
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+# Seconds AsyncSubmissionQueue.stop() waits for results being posted.
+STOP_TIMEOUT = 60
+
+_client = None
+_client_lock = threading.Lock()
+
+
+class AsyncResultsDBClient(object):
+    """
+    Sends requests to ResultsDB from an event loop in a background thread.
+
+    Coroutine methods must run in the client's event loop, other methods
+    can be called from any thread.
+    """
+
+    def __init__(self, api_url, auth=None, trusted_ca=None, timeout=15,
+                 max_connections=100):
+        """
+        Args:
+            api_url (string) - ResultsDB API URL
+            auth (tuple) - User and password for Basic authentication
+            trusted_ca (string or bool) - Path to CA bundle, True (or None)
+                to use default CA certificates, or False to disable
+                certificate verification (same as "verify" in requests)
+            timeout (float) - Timeout for requests in seconds
+            max_connections (int) - Maximum number of open connections
+        """
+        if aiohttp is None:
+            raise RuntimeError('The asyncio ResultsDB client requires aiohttp')
+
+        self.api_url = api_url
+        self.auth = aiohttp.BasicAuth(*auth) if auth else None
+        self.timeout = timeout
+        self.max_connections = max_connections
+
+        if trusted_ca is False:
+            self.ssl = False
+        elif trusted_ca is None or trusted_ca is True:
+            self.ssl = None
+        else:
+            self.ssl = ssl.create_default_context(cafile=trusted_ca)
+
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(
+            target=self.loop.run_forever, name='resultsdb-asyncio')
+        self.thread.daemon = True
+        self.thread.start()
+
+        self.http = self.run(self._create_http_session())
+
+    async def _create_http_session(self):
+        return aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.max_connections, ssl=self.ssl),
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+            headers={'User-Agent': config.USER_AGENT},
+        )
+
+    def run(self, coro):
+        """
+        Runs coroutine in the client's event loop and waits for the result.
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def schedule(self, coro):
+        """
+        Runs coroutine in the client's event loop without waiting.
+
+        Returns concurrent.futures.Future.
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def close(self):
+        self.run(self.http.close())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+    async def _request(self, method, url, **kwargs):
+        """
+        Sends request, retrying on connection errors and server errors the
+        same way as the requests session does.
+
+        Returns tuple (status, json_body). Raises aiohttp.ClientResponseError
+        on unexpected HTTP error status.
+        """
+        with session.circuit_breaker.guard():
+            with metrics.request_seconds.labels(method).time():
+                return await self._request_with_retries(method, url, **kwargs)
+
+    async def _request_with_retries(self, method, url, **kwargs):
+        retry = 0
+        while True:
+            try:
+                async with self.http.request(method, url, **kwargs) as response:
+                    metrics.observe_response(method, response.status)
+                    if response.status not in session.RETRY_STATUS or retry >= session.RETRIES:
+                        # Rejected result is reported by create_result().
+                        if response.status != 400 or method != 'POST':
+                            response.raise_for_status()
+                        try:
+                            body = await response.json(content_type=None)
+                        except ValueError:
+                            body = None
+                        return response.status, body
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if retry >= session.RETRIES:
+                    raise
+
+            retry += 1
+            metrics.retries.labels('http').inc()
+            await asyncio.sleep(session.backoff_time(retry))
+
+    async def create_result(self, log, payload):
+        """
+        Posts a serialized result (see utils.result_payload()).
+
+        Raises CreateResultError if ResultsDB rejects the result.
+        """
+        debug_payload(log, 'Requesting new result: %s', payload)
+
+        status, body = await self._request(
+            'POST',
+            '{0}/results'.format(self.api_url),
+            data=payload,
+            headers={'content-type': 'application/json'},
+            auth=self.auth,
+        )
+
+        log.debug('New result requested (HTTP %s)', status)
+
+        if status == 400:
+            raise exceptions.CreateResultError((body or {}).get('message'), payload)
+
+    async def create_results(self, log, payloads, posted=None):
+        """
+        Posts serialized results of a message concurrently.
+
+        The last result (e.g. overall result for the other results) is posted
+        only after all others are created.
+
+        Created results are appended to the posted list, if given.
+        """
+        if not payloads:
+            return
+
+        if posted is None:
+            posted = []
+
+        others = payloads[:-1]
+        outcomes = await asyncio.gather(
+            *(self.create_result(log, payload) for payload in others),
+            return_exceptions=True)
+
+        errors = []
+        for i, (payload, outcome) in enumerate(zip(others, outcomes), 1):
+            if isinstance(outcome, Exception):
+                errors.append(outcome)
+                log.error('Failed to post result %s of %s: %s', i, len(others), outcome)
+            else:
+                posted.append(payload)
+
+        if errors:
+            raise errors[0]
+
+        await self.create_result(log, payloads[-1])
+        posted.append(payloads[-1])
+
+    async def get_first_group(self, description):
+        _, body = await self._request(
+            'GET',
+            '{0}/groups'.format(self.api_url),
+            params={'description': description},
+        )
+        if body['data']:
+            return body['data'][0]
+
+        return {}
+
+
+class AsyncSubmissionQueue(object):
+    """
+    Posts results of messages in the background using the asyncio client,
+    without a pool of worker threads (see submission.SubmissionQueue).
+    """
+
+    def __init__(self, client, maxsize=0, full_policy='block', resolve_payloads=None):
+        """
+        Args:
+            client (AsyncResultsDBClient) - Client to post results with
+            maxsize (int) - Maximum number of messages being posted
+                (0 is unlimited)
+            full_policy (string) - 'block' to wait until results of another
+                message are posted, 'reject' to raise SubmissionQueueFull
+            resolve_payloads (callable) - Serializes pending payloads of a
+                message in place (see utils.resolve_payloads()); called in
+                a thread pool since it can send blocking requests
+        """
+        if full_policy not in config.SUBMIT_QUEUE_FULL_POLICIES:
+            raise RuntimeError(
+                'Unknown submission queue full policy "{0}", expected one of: {1}'
+                .format(full_policy, ', '.join(config.SUBMIT_QUEUE_FULL_POLICIES)))
+
+        self.client = client
+        self.maxsize = maxsize
+        self.full_policy = full_policy
+        self.resolve_payloads = resolve_payloads
+        self.slots = threading.BoundedSemaphore(maxsize) if maxsize else None
+        # Futures of messages being posted, with time they were queued
+        self.pending = {}
+        self.lock = threading.Lock()
+
+    def put(self, log, payloads, received=None):
+        if self.slots is not None:
+            if not self.slots.acquire(self.full_policy == 'block'):
+                raise exceptions.SubmissionQueueFull(self.maxsize)
+
+        queued = time.time()
+        future = self.client.schedule(self._submit(log, payloads, received or queued))
+        with self.lock:
+            self.pending[future] = queued
+        future.add_done_callback(self._done)
+
+    def depth(self):
+        return len(self.pending)
+
+    def oldest_age(self):
+        with self.lock:
+            queued = list(self.pending.values())
+        return time.time() - min(queued) if queued else 0
+
+    def stop(self, timeout=STOP_TIMEOUT):
+        """
+        Waits until queued results are posted, at most timeout seconds.
+
+        Results not posted in time are dropped.
+        """
+        with self.lock:
+            pending = list(self.pending)
+
+        _, not_done = concurrent.futures.wait(pending, timeout)
+        if not_done:
+            config.LOGGER.error(
+                'Dropping results of %s messages not posted in %s seconds',
+                len(not_done), timeout)
+            for future in not_done:
+                future.cancel()
+
+    def _done(self, future):
+        with self.lock:
+            self.pending.pop(future, None)
+
+        if self.slots is not None:
+            self.slots.release()
+
+    async def _submit(self, log, payloads, received):
+        try:
+            if self.resolve_payloads is not None:
+                await self.client.loop.run_in_executor(None, self.resolve_payloads, payloads)
+            await self.client.create_results(log, payloads)
+            metrics.ack_seconds.observe(time.time() - received)
+        except (exceptions.CreateResultError, exceptions.CircuitOpenError) as e:
+            log.error('Failed to process message: %s', e)
+        except Exception:
+            log.exception('Unexpected exception')
+
+
+def get_client():
+    """
+    Returns shared AsyncResultsDBClient, created on first call.
+    """
+    global _client
+
+    with _client_lock:
+        if _client is None:
+            _client = AsyncResultsDBClient(
+                config.RESULTSDB_API_URL,
+                auth=config.RESULTSDB_AUTH,
+                trusted_ca=config.TRUSTED_CA,
+                timeout=config.TIMEOUT,
+                max_connections=config.ASYNC_MAX_CONNECTIONS)
+        return _client
+
+
+def close_client():
+    """
+    Closes the shared AsyncResultsDBClient, if created; the next
+    get_client() call creates a new one.
+    """
+    global _client
+
+    with _client_lock:
+        client, _client = _client, None
+
+    if client is not None:
+        client.close()
@@ -0,0 +1,401 @@
+"""
+Mappings of artifacts in CI messages to result data.
+
+A mapping of an artifact type is a list of fields, each described with a
+dict:
+
+    key - Key in result data
+    path - Dotted path of the value in the message, e.g. "artifact.nvr",
+        "run.log", "system.os" (the first system if there are multiple),
+        "result.category" (test result fields, see message.Result) or
+        "data.item" (value already in result data); list of paths means
+        the first non-empty value is used
+    args - List of paths (or dicts with path, required and default) whose
+        values are passed as list to format or transform (instead of path)
+    value - Constant value (instead of path)
+    required - Whether a missing value rejects the message (default True)
+    default - Value if not required and missing (default None)
+    format - Format string applied on the value (args are positional)
+    transform - Name of function in TRANSFORMS applied on the value
+
+Fields are extracted in the listed order. Keys with None value are omitted
+from result data if the mapping is a dict with "fields" and "omit_none".
+
+Mappings are compiled to an extractor function per artifact type. More
+artifact types can be added (or built-in ones replaced) with the
+"resultsdb-updater.artifact_mappings" option.
+"""
+import re
+
+from . import config
+from . import exceptions
+from . import serializer
+
+# The pagure.io/messages spec defines the NSVC delimited with ':' and the stream name can
+# contain '-', which MBS changes to '_' when importing to koji.
+# See https://github.com/release-engineering/resultsdb-updater/pull/73
+NSVC_REGEX = re.compile('^(.*):(.*):(.*):(.*)')
+
+
+def _scratch(scratch, item_type):
+    # scratch is supposed to be a bool but some messages in the wild
+    # use a string instead
+    if isinstance(scratch, bool):
+        return scratch
+
+    try:
+        return scratch.lower() == 'true'
+    except AttributeError:
+        return False
+
+
+def _scratch_type(scratch, item_type):
+    # we need to differentiate between scratch and non-scratch builds
+    return item_type + '_scratch' if scratch else item_type
+
+
+def _nsvc(nsvc, item_type):
+    try:
+        name, stream, version, context = NSVC_REGEX.match(nsvc).groups()
+    except AttributeError:
+        raise exceptions.InvalidMessageError('Invalid nsvc "%s" encountered' % nsvc)
+
+    stream = stream.replace('-', '_')
+    return '{}-{}-{}.{}'.format(name, stream, version, context)
+
+
+def _scenario_item(args, item_type):
+    product_scenario, products = args
+    item = [product.get('nvr', product['id']) for product in products]
+    item.insert(0, product_scenario)
+    return item
+
+
+def _json_each(values, item_type):
+    return [serializer.dumps_value(value) for value in values]
+
+
+# Transforms available to mappings, called with (value, item_type).
+TRANSFORMS = {
+    'scratch': _scratch,
+    'scratch_type': _scratch_type,
+    'nsvc': _nsvc,
+    'scenario_item': _scenario_item,
+    'json_each': _json_each,
+}
+
+
+def _optional(path, default=None):
+    return {'path': path, 'required': False, 'default': default}
+
+
+ARTIFACT_MAPPINGS = {
+    'productmd-compose': {
+        'omit_none': True,
+        'fields': [
+            {'key': 'system_architecture', 'path': 'system.architecture'},
+            {'key': 'system_variant', 'path': 'system.variant', 'required': False},
+            # Field compose_id in artifacts is deprecated.
+            {'key': 'productmd.compose.id', 'path': ['artifact.id', 'artifact.compose_id']},
+            {'key': 'item', 'format': '{0}/{1}/{2}', 'args': [
+                'data.productmd.compose.id',
+                _optional('data.system_variant', 'unknown'),
+                'data.system_architecture',
+            ]},
+            {'key': 'log', 'path': 'run.log'},
+            {'key': 'type', 'value': 'productmd-compose'},
+            {'key': 'system_provider', 'path': 'system.provider'},
+            {'key': 'category', 'path': 'result.category'},
+        ],
+    },
+    'product-build': {
+        'omit_none': True,
+        'fields': [
+            {'key': 'product', 'path': 'artifact.name'},
+            {'key': 'version', 'path': 'artifact.version'},
+            {'key': 'release', 'path': 'artifact.release'},
+            {'key': 'item', 'format': '{0}-{1}-{2}',
+             'args': ['data.product', 'data.version', 'data.release']},
+            {'key': 'log', 'path': 'run.log'},
+            {'key': 'type', 'value': 'product-build'},
+            {'key': 'system_architecture', 'path': 'system.architecture'},
+            {'key': 'category', 'path': 'result.category'},
+        ],
+    },
+    'component-version': {
+        'omit_none': True,
+        'fields': [
+            {'key': 'component', 'path': 'artifact.component'},
+            {'key': 'version', 'path': 'artifact.version'},
+            {'key': 'item', 'format': '{0}-{1}', 'args': ['data.component', 'data.version']},
+            {'key': 'log', 'path': 'run.log'},
+            {'key': 'type', 'value': 'component-version'},
+            {'key': 'category', 'path': 'result.category'},
+        ],
+    },
+    'container-image': {
+        'omit_none': True,
+        'fields': [
+            {'key': 'repository', 'path': 'artifact.repository'},
+            {'key': 'digest', 'path': 'artifact.digest'},
+            {'key': 'item', 'format': '{0}@{1}', 'args': ['data.repository', 'data.digest']},
+            {'key': 'log', 'path': 'run.log'},
+            {'key': 'rebuild', 'path': 'run.rebuild', 'required': False},
+            {'key': 'xunit', 'path': 'result.xunit'},
+            {'key': 'type', 'value': 'container-image'},
+            {'key': 'format', 'path': 'artifact.format', 'required': False},
+            {'key': 'pull_ref', 'path': 'artifact.pull_ref', 'required': False},
+            {'key': 'scratch', 'path': 'artifact.scratch', 'required': False},
+            {'key': 'nvr', 'path': 'artifact.nvr', 'required': False},
+            {'key': 'issuer', 'path': 'artifact.issuer', 'required': False},
+            {'key': 'system_os', 'path': 'system.os', 'required': False},
+            {'key': 'system_provider', 'path': 'system.provider', 'required': False},
+            {'key': 'system_architecture', 'path': 'system.architecture', 'required': False},
+            {'key': 'category', 'path': 'result.category'},
+        ],
+    },
+    'redhat-container-image': [
+        {'key': 'item', 'path': 'artifact.id'},
+        {'key': 'type', 'value': 'redhat-container-image'},
+        {'key': 'brew_task_id', 'path': 'artifact.task_id', 'required': False},
+        {'key': 'brew_build_id', 'path': 'artifact.build_id', 'required': False},
+        {'key': 'category', 'path': 'result.category'},
+        {'key': 'full_names', 'path': 'artifact.full_names'},
+        {'key': 'registry_url', 'path': 'artifact.registry_url', 'required': False},
+        {'key': 'tag', 'path': 'artifact.tag', 'required': False},
+        {'key': 'issuer', 'path': 'artifact.issuer'},
+        {'key': 'component', 'path': 'artifact.component'},
+        {'key': 'name', 'path': 'artifact.name', 'required': False},
+        {'key': 'namespace', 'path': 'artifact.namespace'},
+        {'key': 'scratch', 'path': 'artifact.scratch'},
+        {'key': 'nvr', 'path': 'artifact.nvr'},
+        {'key': 'source', 'path': 'artifact.source'},
+        {'key': 'rebuild', 'path': 'run.rebuild', 'required': False},
+        {'key': 'log', 'path': 'run.log'},
+    ],
+    'redhat-module': [
+        {'key': 'item', 'path': 'artifact.nsvc', 'transform': 'nsvc'},
+        {'key': 'type', 'value': 'redhat-module'},
+        {'key': 'mbs_id', 'path': 'artifact.id', 'required': False},
+        {'key': 'category', 'path': 'result.category'},
+        {'key': 'context', 'path': 'artifact.context'},
+        {'key': 'name', 'path': 'artifact.name'},
+        {'key': 'nsvc', 'path': 'data.item'},
+        {'key': 'stream', 'path': 'artifact.stream'},
+        {'key': 'version', 'path': 'artifact.version'},
+        {'key': 'issuer', 'path': 'artifact.issuer', 'required': False},
+        {'key': 'rebuild', 'path': 'run.rebuild', 'required': False},
+        {'key': 'log', 'path': 'run.log'},
+        {'key': 'system_os', 'path': 'system.os', 'required': False},
+        {'key': 'system_provider', 'path': 'system.provider', 'required': False},
+    ],
+    'redhat-advisory': [
+        {'key': 'item', 'path': 'artifact.id'},
+        {'key': 'type', 'value': 'redhat-advisory'},
+        {'key': 'category', 'path': 'result.category'},
+        {'key': 'numeric_id', 'path': 'artifact.numeric_id', 'required': False},
+        {'key': 'pipeline_id', 'path': 'pipeline.id'},
+        {'key': 'pipeline_name', 'path': 'pipeline.name'},
+        {'key': 'pipeline_build', 'path': 'pipeline.build', 'required': False},
+        {'key': 'pipeline_stage', 'path': 'pipeline.stage.name', 'required': False},
+        {'key': 'log', 'path': 'run.log'},
+        {'key': 'log_raw', 'path': 'run.log_raw', 'required': False},
+        {'key': 'log_stream', 'path': 'run.log_stream', 'required': False},
+        {'key': 'system_os', 'path': 'system.os', 'required': False},
+        {'key': 'system_provider', 'path': 'system.provider', 'required': False},
+    ],
+    'brew-build': [
+        {'key': 'item', 'path': 'artifact.nvr'},
+        {'key': 'component', 'path': 'artifact.component'},
+        {'key': 'scratch', 'path': 'artifact.scratch', 'required': False, 'default': '',
+         'transform': 'scratch'},
+        {'key': 'brew_task_id', 'path': 'artifact.id', 'required': False},
+        {'key': 'type', 'path': 'data.scratch', 'transform': 'scratch_type'},
+        {'key': 'category', 'path': 'result.category'},
+        {'key': 'issuer', 'path': 'artifact.issuer', 'required': False},
+        {'key': 'rebuild', 'path': 'run.rebuild', 'required': False},
+        {'key': 'log', 'path': 'run.log'},
+        {'key': 'system_os', 'path': 'system.os', 'required': False},
+        {'key': 'system_provider', 'path': 'system.provider', 'required': False},
+    ],
+    'brew-build-group': [
+        {'key': 'item', 'path': 'artifact.id'},
+        {'key': 'repository', 'path': 'artifact.repository'},
+        {'key': 'builds', 'path': 'artifact.builds'},
+        {'key': 'type', 'value': 'brew-build-group'},
+        {'key': 'category', 'path': 'result.category'},
+        {'key': 'rebuild', 'path': 'run.rebuild', 'required': False},
+        {'key': 'log', 'path': 'run.log'},
+        {'key': 'system_os', 'path': 'system.os', 'required': False},
+        {'key': 'system_provider', 'path': 'system.provider', 'required': False},
+    ],
+    'product-scenario': [
+        {'key': 'item', 'args': ['artifact.id', 'artifact.products'],
+         'transform': 'scenario_item'},
+        {'key': 'type', 'value': 'product-scenario'},
+        {'key': 'rebuild', 'path': 'run.rebuild', 'required': False},
+        {'key': 'log', 'path': 'run.log'},
+        {'key': 'system_os', 'path': 'system.os', 'required': False},
+        {'key': 'system_provider', 'path': 'system.provider', 'required': False},
+        {'key': 'products', 'path': 'artifact.products', 'transform': 'json_each'},
+    ],
+}
+
+
+def _compile_path(path, required=True, default=None):
+    """
+    Returns function (msg, data) -> value at the path.
+    """
+    root, _, name = path.partition('.')
+
+    if root == 'data':
+        def get(msg, data):
+            value = data.get(name)
+            return default if value is None else value
+
+    elif root == 'system':
+        if required:
+            def get(msg, data):
+                return msg.system(name)
+        else:
+            def get(msg, data):
+                return msg.system(name, default=default)
+
+    elif root == 'result':
+        def get(msg, data):
+            return getattr(msg.result, name)
+
+    else:
+        fields = tuple(path.split('.'))
+        if required:
+            def get(msg, data):
+                return msg.get(*fields)
+        else:
+            def get(msg, data):
+                return msg.get(*fields, default=default)
+
+    return get
+
+
+def _compile_arg(arg):
+    if isinstance(arg, dict):
+        return _compile_path(
+            arg['path'], arg.get('required', True), arg.get('default'))
+    return _compile_path(arg)
+
+
+def _compile_field(item_type, field):
+    """
+    Returns function (msg, data) -> value of the field.
+    """
+    required = field.get('required', True)
+    default = field.get('default')
+
+    if 'value' in field:
+        value = field['value']
+
+        def get(msg, data):
+            return value
+
+    elif 'args' in field:
+        getters = [_compile_arg(arg) for arg in field['args']]
+
+        def get(msg, data):
+            return [getter(msg, data) for getter in getters]
+
+    elif isinstance(field['path'], list):
+        # The first non-empty value; only the last path can be required.
+        getters = [_compile_path(path, required=False) for path in field['path'][:-1]]
+        getters.append(_compile_path(field['path'][-1], required, default))
+
+        def get(msg, data):
+            for getter in getters:
+                value = getter(msg, data)
+                if value:
+                    return value
+            return value
+
+    else:
+        get = _compile_path(field['path'], required, default)
+
+    if 'format' in field:
+        format_string = field['format']
+        get_value = get
+        if 'args' in field:
+            def get(msg, data):
+                return format_string.format(*get_value(msg, data))
+        else:
+            def get(msg, data):
+                return format_string.format(get_value(msg, data))
+
+    if 'transform' in field:
+        try:
+            transform = TRANSFORMS[field['transform']]
+        except KeyError:
+            raise RuntimeError(
+                'Unknown transform "{0}" in mapping of artifact type "{1}"'
+                .format(field['transform'], item_type))
+        get_raw = get
+
+        def get(msg, data):
+            return transform(get_raw(msg, data), item_type)
+
+    return get
+
+
+def compile_mapping(item_type, mapping):
+    """
+    Returns function (msg) -> result data extracted according to the mapping.
+    """
+    if isinstance(mapping, dict):
+        fields = mapping['fields']
+        omit_none = mapping.get('omit_none', False)
+    else:
+        fields = mapping
+        omit_none = False
+
+    getters = [(field['key'], _compile_field(item_type, field)) for field in fields]
+
+    def extract(msg):
+        data = {}
+        for key, getter in getters:
+            data[key] = getter(msg, data)
+
+        if omit_none:
+            return {key: value for key, value in data.items() if value is not None}
+        return data
+
+    return extract
+
+
+def compile_mappings(mappings):
+    """
+    Returns dict mapping artifact type to extractor function.
+    """
+    return {
+        item_type: compile_mapping(item_type, mapping)
+        for item_type, mapping in mappings.items()
+    }
+
+
+def _configured_mappings():
+    mappings = dict(ARTIFACT_MAPPINGS)
+    mappings.update(config.ARTIFACT_MAPPINGS)
+    return mappings
+
+
+extractors = compile_mappings(_configured_mappings())
+
+
+def extract_result_data(msg, item_type):
+    """
+    Returns result data for the artifact in the message.
+
+    Raises InvalidMessageError for unknown artifact type.
+    """
+    try:
+        extract = extractors[item_type]
+    except (KeyError, TypeError):
+        raise exceptions.InvalidMessageError('Unknown artifact type "%s"' % item_type)
+
+    return extract(msg)
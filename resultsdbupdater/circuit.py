@@ -0,0 +1,133 @@
+import collections
+import contextlib
+import threading
+import time
+
+from . import config
+from .exceptions import CircuitOpenError
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+
+class CircuitBreaker(object):
+    """
+    Stops sending requests to a failing service for a while.
+
+    The circuit opens if the failure rate of recent calls reaches the
+    threshold. While open, calls fail immediately with CircuitOpenError.
+    After reset_timeout seconds, a single probe call is allowed (half-open
+    state): if it succeeds the circuit closes, otherwise it opens again.
+    """
+
+    def __init__(self, failure_rate, window=20, min_calls=5, reset_timeout=30,
+                 is_failure=None):
+        """
+        Args:
+            failure_rate (float) - Failure rate (0 to 1) of recent calls
+                opening the circuit (0 disables the circuit breaker)
+            window (int) - Number of recent calls to compute failure rate from
+            min_calls (int) - Minimum number of recent calls to open circuit
+            reset_timeout (float) - Seconds until next probe call
+            is_failure (callable) - Returns True if given exception means
+                the service is failing (by default any exception)
+        """
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.reset_timeout = reset_timeout
+        self.is_failure = is_failure or (lambda error: True)
+
+        self.state = CLOSED
+        self.opened_count = 0
+        self.rejected_count = 0
+
+        self._calls = collections.deque(maxlen=window)
+        self._opened_at = 0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.failure_rate > 0
+
+    def allow(self):
+        """
+        Raises CircuitOpenError if a call is not allowed now.
+        """
+        if not self.enabled:
+            return
+
+        with self._lock:
+            if self.state == CLOSED:
+                return
+
+            if self.state == OPEN and time.time() - self._opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+                self._probing = False
+
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return
+
+            self.rejected_count += 1
+            retry_after = max(0, self._opened_at + self.reset_timeout - time.time())
+
+        raise CircuitOpenError(retry_after)
+
+    def record(self, success):
+        if not self.enabled:
+            return
+
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probing = False
+                if success:
+                    self._close()
+                else:
+                    self._open()
+                return
+
+            if self.state == OPEN:
+                # Result of a call started before the circuit opened.
+                return
+
+            self._calls.append(success)
+            calls = len(self._calls)
+            failures = self._calls.count(False)
+            if calls >= self.min_calls and failures >= self.failure_rate * calls:
+                self._open()
+
+    @contextlib.contextmanager
+    def guard(self):
+        """
+        Context manager for a call protected by the circuit breaker.
+        """
+        self.allow()
+        try:
+            yield
+        except Exception as e:
+            self.record(not self.is_failure(e))
+            raise
+        else:
+            self.record(True)
+
+    def stats(self):
+        return {
+            'state': self.state,
+            'opened': self.opened_count,
+            'rejected': self.rejected_count,
+        }
+
+    def _open(self):
+        if self.state != OPEN:
+            config.LOGGER.warning(
+                'ResultsDB is failing, stopping requests for %s seconds', self.reset_timeout)
+        self.state = OPEN
+        self.opened_count += 1
+        self._opened_at = time.time()
+
+    def _close(self):
+        config.LOGGER.info('ResultsDB recovered, resuming requests')
+        self.state = CLOSED
+        self._calls.clear()
@@ -2,16 +2,156 @@ import logging
 
 import fedmsg
 
+from .logs import configure_logging
+
 CONFIG = fedmsg.config.load_config()
 
 RESULTSDB_API_URL = CONFIG.get('resultsdb-updater.resultsdb_api_url')
 TRUSTED_CA = CONFIG.get('resultsdb-updater.resultsdb_api_ca')
 TIMEOUT = CONFIG.get('resultsdb-updater.requests_timeout', 15)
+# Number of retries for failed requests (with exponential backoff).
+MAX_RETRIES = CONFIG.get('resultsdb-updater.max_retries', 24)
+
+# Circuit breaker stops sending requests to ResultsDB for reset_timeout
+# seconds if the failure rate of last window requests (at least min_calls)
+# reaches failure_rate (0 disables the circuit breaker). With the circuit
+# breaker enabled, failed requests are retried at most
+# circuit_breaker_max_retries times (instead of max_retries). The circuit
+# breaker requires SPOOL_PATH, or SUBMIT_WORKERS with RETRY_DEADLINE, so
+# rejected results are posted later.
+CIRCUIT_BREAKER_FAILURE_RATE = CONFIG.get('resultsdb-updater.circuit_breaker_failure_rate', 0)
+CIRCUIT_BREAKER_WINDOW = CONFIG.get('resultsdb-updater.circuit_breaker_window', 20)
+CIRCUIT_BREAKER_MIN_CALLS = CONFIG.get('resultsdb-updater.circuit_breaker_min_calls', 5)
+CIRCUIT_BREAKER_RESET_TIMEOUT = CONFIG.get(
+    'resultsdb-updater.circuit_breaker_reset_timeout', 30)
+CIRCUIT_BREAKER_MAX_RETRIES = CONFIG.get('resultsdb-updater.circuit_breaker_max_retries', 3)
+
+# Number of threads posting results to ResultsDB in background. If zero,
+# results are posted directly while consuming messages.
+SUBMIT_WORKERS = CONFIG.get('resultsdb-updater.submit_workers', 0)
+SUBMIT_QUEUE_SIZE = CONFIG.get('resultsdb-updater.submit_queue_size', 1000)
+# What to do if the submission queue is full: 'block' or 'reject'
+SUBMIT_QUEUE_FULL_POLICIES = ('block', 'reject')
+SUBMIT_QUEUE_FULL_POLICY = CONFIG.get(
+    'resultsdb-updater.submit_queue_full_policy', 'block')
+
+# Path (relative to RESULTSDB_API_URL) accepting a list of results in a
+# single POST request. If not set, each result is posted separately.
+BULK_RESULTS_PATH = CONFIG.get('resultsdb-updater.bulk_results_path')
+# Maximum number of results posted in a single bulk request.
+BATCH_SIZE = CONFIG.get('resultsdb-updater.batch_size', 100)
+# Seconds a submission worker waits for results of other messages to post
+# them together in bulk (0 to disable). Ignored without BULK_RESULTS_PATH.
+BATCH_WINDOW = CONFIG.get('resultsdb-updater.batch_window', 0)
+
+# Maximum number of results of a message posted in parallel.
+POST_CONCURRENCY = CONFIG.get('resultsdb-updater.post_concurrency', 1)
+
+# HTTP client for ResultsDB requests: 'requests' or 'asyncio' (requires
+# aiohttp; recommended for high volume deployments with submit_workers).
+HTTP_CLIENT = CONFIG.get('resultsdb-updater.http_client', 'requests')
+# Maximum number of connections opened by the asyncio client.
+ASYNC_MAX_CONNECTIONS = CONFIG.get('resultsdb-updater.async_max_connections', 100)
+
+# Maximum number of cached groups (0 to disable the cache) and seconds
+# after which a cached group is looked up again.
+GROUP_CACHE_SIZE = CONFIG.get('resultsdb-updater.group_cache_size', 1000)
+GROUP_CACHE_TTL = CONFIG.get('resultsdb-updater.group_cache_ttl', 3600)
+
+# Path to SQLite database storing results until they are posted. If set,
+# results are posted in order from a background thread.
+SPOOL_PATH = CONFIG.get('resultsdb-updater.spool_path')
+# When to sync the spool to disk: 'always', 'normal' or 'never'
+SPOOL_FSYNC = CONFIG.get('resultsdb-updater.spool_fsync', 'always')
+# Seconds to wait before posting results again after failure.
+SPOOL_RETRY_INTERVAL = CONFIG.get('resultsdb-updater.spool_retry_interval', 10)
+
+# Seconds submission workers retry posting results of a message, waiting
+# random backoff time between attempts without blocking other messages
+# (0 to retry failed requests in the HTTP client instead).
+RETRY_DEADLINE = CONFIG.get('resultsdb-updater.retry_deadline', 0)
+# Spool (see SPOOL_PATH) for results not posted until the retry deadline.
+# If not set, such results are dropped.
+RETRY_FALLBACK_PATH = CONFIG.get('resultsdb-updater.retry_fallback_path')
+
+# Number of IDs of processed messages to remember, so messages redelivered
+# by the broker are skipped (0 disables the cache).
+DEDUP_CACHE_SIZE = CONFIG.get('resultsdb-updater.dedup_cache_size', 0)
+# Path to a file remembering processed message IDs across restarts.
+DEDUP_CACHE_PATH = CONFIG.get('resultsdb-updater.dedup_cache_path')
+
+# Seconds to hold results of queued and running CI messages; a later state
+# of the same test run received in the meantime replaces the held result
+# (0 posts all results).
+SUPERSEDE_WINDOW = CONFIG.get('resultsdb-updater.supersede_window', 0)
+
+# Port to serve metrics on (http://<metrics_addr>:<metrics_port>/metrics) in
+# the Prometheus text format; disabled if not set.
+METRICS_PORT = CONFIG.get('resultsdb-updater.metrics_port')
+METRICS_ADDR = CONFIG.get('resultsdb-updater.metrics_addr', '')
+
+# Warn if messages are received more than given seconds after they were sent
+# to the broker (0 disables the warning).
+LAG_WARNING_THRESHOLD = CONFIG.get('resultsdb-updater.lag_warning_threshold', 0)
+
+# Profile every Nth consumed message with cProfile, from start (if enabled)
+# or after receiving the signal (e.g. 'SIGUSR1'), which toggles profiling.
+# Posting results from submission worker or spool threads is sampled too,
+# but not requests sent in parallel (see POST_CONCURRENCY) or by the asyncio
+# HTTP client.
+# Profiling stops after duration seconds (0 for no limit). Statistics are
+# written to path when profiling stops and served on the metrics port
+# (/profile).
+PROFILE_ENABLED = CONFIG.get('resultsdb-updater.profile_enabled', False)
+PROFILE_SIGNAL = CONFIG.get('resultsdb-updater.profile_signal')
+PROFILE_EVERY = CONFIG.get('resultsdb-updater.profile_every', 1)
+PROFILE_DURATION = CONFIG.get('resultsdb-updater.profile_duration', 0)
+PROFILE_PATH = CONFIG.get('resultsdb-updater.profile_path')
+
+# Received messages and result payloads are logged at debug level cropped to
+# given number of characters (0 for no limit), and only for every Nth
+# message or result.
+LOG_PAYLOAD_LIMIT = CONFIG.get('resultsdb-updater.log_payload_limit', 1024)
+LOG_PAYLOAD_EVERY = CONFIG.get('resultsdb-updater.log_payload_every', 1)
+
+# Mappings of additional CI message artifact types to result data, see
+# artifacts.py for the format (built-in mappings with the same artifact type
+# are replaced).
+ARTIFACT_MAPPINGS = CONFIG.get('resultsdb-updater.artifact_mappings', {})
+
+# Messages from topics matching a pattern in topic_deny, or not matching any
+# pattern in topic_allow (if not empty), are dropped without parsing. A
+# pattern matches topics starting with the same components separated by "."
+# ("*" matches any single component).
+TOPIC_ALLOW = CONFIG.get('resultsdb-updater.topic_allow', [])
+TOPIC_DENY = CONFIG.get('resultsdb-updater.topic_deny', [])
+# Maximum number of cached topic and message format decisions.
+ROUTING_CACHE_SIZE = CONFIG.get('resultsdb-updater.routing_cache_size', 1024)
+
+# JSON library to serialize result request bodies with: "orjson", "ujson",
+# "json" or "auto" for the fastest one installed (result data values are
+# always serialized with "json").
+JSON_BACKEND = CONFIG.get('resultsdb-updater.json_backend', 'auto')
+
+# Write log messages from a background thread, so the consumer does not block
+# on writing to stderr.
+LOG_ASYNC = CONFIG.get('resultsdb-updater.log_async', False)
+# Log JSON objects with fields for message ID, topic, handler and time since
+# the message was received.
+LOG_JSON = CONFIG.get('resultsdb-updater.log_json', False)
+# Drop repeated warnings with the same format logged within given seconds (0
+# disables the rate limit). The next logged one includes the number of
+# dropped warnings.
+LOG_RATE_LIMIT = CONFIG.get('resultsdb-updater.log_rate_limit', 0)
 
 LOGGER = logging.getLogger('CIConsumer')
 log_format = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-logging.basicConfig(
-    format=log_format, level=CONFIG.get('resultsdb-updater.log_level'))
+LOG_LISTENER = configure_logging(
+    log_format,
+    level=CONFIG.get('resultsdb-updater.log_level'),
+    json_format=LOG_JSON,
+    use_queue=LOG_ASYNC,
+    rate_limit=LOG_RATE_LIMIT)
 
 USER_AGENT = 'resultsdb_updater'
 
@@ -49,6 +189,32 @@ def get_http_auth(user, password, url):
     return auth
 
 
+def check_circuit_breaker(failure_rate, spool_path, submit_workers, retry_deadline,
+                          http_client):
+    """Verify results rejected by the circuit breaker are posted later
+
+    Results rejected while the circuit is open are posted again only from
+    the spool or by submission workers with a retry deadline, otherwise
+    they would be lost.
+
+    Raises:
+        RuntimeError, if the circuit breaker is enabled without the spool or
+        retrying submission workers
+    """
+    if not failure_rate or spool_path:
+        return
+
+    if submit_workers and retry_deadline and http_client == 'requests':
+        return
+
+    raise RuntimeError(
+        'Circuit breaker requires spool_path, or submit_workers with '
+        'retry_deadline and the requests HTTP client!')
+
+
+check_circuit_breaker(
+    CIRCUIT_BREAKER_FAILURE_RATE, SPOOL_PATH, SUBMIT_WORKERS, RETRY_DEADLINE, HTTP_CLIENT)
+
 RESULTSDB_AUTH = get_http_auth(
     CONFIG.get('resultsdb-updater.resultsdb_user'),
     CONFIG.get('resultsdb-updater.resultsdb_pass'),
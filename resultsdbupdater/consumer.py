@@ -1,20 +1,68 @@
+import logging
+import time
+
 import fedmsg.consumers
 import fedmsg.config
 
-from . import config, exceptions, utils
+from . import aioclient, config, exceptions, metrics, routing, session, utils
 
-from .message import create_message
+from .circuit import CLOSED
+from .dedup import create_dedup_cache
+from .lag import create_lag_monitor
+from .message import LoggedPayload, PrefixLogger, create_message, debug_payload
+from .profiling import create_profiler
+from .submission import create_submission_queue
+from .supersede import create_supersede_buffer
 
 CONFIG = fedmsg.config.load_config()
 TOPICS = CONFIG.get('resultsdb-updater.topics', [])
 
 
+def _message_log(msg_data):
+    """
+    Returns logger for a message which is dropped before it is parsed (see
+    Message.log).
+    """
+    try:
+        msg_id = msg_data.get('headers', {}).get('message-id')
+    except Exception:
+        msg_id = 'ID:UNKNOWN'
+    return PrefixLogger(msg_id, config.LOGGER, {'topic': msg_data.get('topic')})
+
+
 class CIConsumer(fedmsg.consumers.FedmsgConsumer):
     topic = TOPICS
     config_key = 'ciconsumer'
 
     def __init__(self, *args, **kw):
         super(CIConsumer, self).__init__(*args, **kw)
+        self.profiler = create_profiler()
+        self.submission_queue = create_submission_queue(self.profiler)
+        self.dedup_cache = create_dedup_cache()
+        self.supersede_buffer = create_supersede_buffer(self._submit_held)
+        self.lag_monitor = create_lag_monitor()
+        self.router = routing.create_router()
+        if self.profiler is not None:
+            metrics.pages['/profile'] = self.profiler.report
+        self._register_metrics()
+        self.metrics_server = None
+        if config.METRICS_PORT:
+            self.metrics_server = metrics.start_http_server(
+                config.METRICS_PORT, config.METRICS_ADDR)
+
+    def stop(self):
+        if self.profiler is not None:
+            self.profiler.disable()
+        if self.metrics_server is not None:
+            self.metrics_server.shutdown()
+        if self.supersede_buffer is not None:
+            self.supersede_buffer.stop()
+        if self.submission_queue:
+            self.submission_queue.stop()
+        aioclient.close_client()
+        if self.dedup_cache is not None:
+            self.dedup_cache.close()
+        super(CIConsumer, self).stop()
 
     def validate(self, message):
         """
@@ -30,56 +78,154 @@ class CIConsumer(fedmsg.consumers.FedmsgConsumer):
             config.LOGGER.exception('Failed to validate message: %s', message)
             raise RuntimeWarning('Unexpected exception during message validation')
 
-    def _consume_helper(self, msg):
+    def _register_metrics(self):
+        circuit_breaker = session.circuit_breaker
+        metrics.circuit_state.set_function(
+            lambda: int(circuit_breaker.stats()['state'] != CLOSED))
+        metrics.circuit_opened.set_function(lambda: circuit_breaker.stats()['opened'])
+        metrics.circuit_rejected.set_function(lambda: circuit_breaker.stats()['rejected'])
+        metrics.group_cache_hits.set_function(lambda: utils.group_cache.hits)
+        metrics.group_cache_misses.set_function(lambda: utils.group_cache.misses)
+
+        submission_queue = self.submission_queue
+        if submission_queue:
+            metrics.queue_depth.set_function(submission_queue.depth)
+            metrics.queue_oldest_age.set_function(submission_queue.oldest_age)
+        else:
+            metrics.queue_depth.set_function(lambda: 0)
+            metrics.queue_oldest_age.set_function(lambda: 0)
+
+        dedup_cache = self.dedup_cache
+        if dedup_cache is not None:
+            metrics.skipped_messages.set_function(lambda: dedup_cache.skipped)
+
+        supersede_buffer = self.supersede_buffer
+        if supersede_buffer is not None:
+            metrics.superseded_results.set_function(lambda: supersede_buffer.superseded)
+
+    def _handle(self, name, handler, msg, *args):
+        msg.log.extra['handler'] = name
+        metrics.messages_handled.labels(name).inc()
+        with metrics.handle_seconds.labels(name).time():
+            handler(msg, *args)
+
+    def _submit_held(self, log, payloads):
+        """
+        Posts or queues results released from the supersede buffer.
+        """
+        received = log.extra.get('received')
+        try:
+            if self.submission_queue:
+                self.submission_queue.put(log, payloads, received)
+            else:
+                utils.post_results(log, payloads)
+                if received is not None:
+                    metrics.ack_seconds.observe(time.time() - received)
+        except (exceptions.CreateResultError,
+                exceptions.SubmissionQueueFull,
+                exceptions.CircuitOpenError) as e:
+            log.error('Failed to post held result: %s', e)
+        except Exception:
+            log.exception('Unexpected exception')
+
+    def _consume_helper(self, msg, kind=None):
+        """
+        Returns True if the message was handled.
+
+        Args:
+            msg (Message) - Received message
+            kind (string) - Message kind (see routing), recognized from the
+                message if not set
+        """
         # Some of the messages here can be empty strings, so only process
         # them if they are dicts to avoid tracebacks
         if not isinstance(msg.body, dict):
             msg.log.debug("Dropping non-dict message.")
             return
 
-        # First, look by topic to see if the message is one of the old formats
-        # we want to handle for legacy reasons.
-        if msg.topic == '/topic/VirtualTopic.eng.platformci.tier1.result':
-            utils.handle_ci_metrics(msg)
-            return
+        if kind is None:
+            kind = self.router.classify(msg.topic, frozenset(msg.body))
 
-        # The following stanzas consider if the actual message body
-        # matches one of a few patterns we support.  Start by
-        # extracting the keys borne in the message.
-        actual_keys = set(msg.body.keys())
-
-        # Next, detect if the message bears the primary format we support.
-        # The "FACTORY 2.0 CI UMB messages"
-        # See: https://pagure.io/fedora-ci/messages
-        ci_umb_keys = set(['run', 'artifact'])
-        contact_umb_keys = set(['ci', 'contact'])
-        if actual_keys.issuperset(ci_umb_keys) and not actual_keys.isdisjoint(contact_umb_keys):
-            utils.handle_ci_umb(msg)
-            return
+        if kind == routing.CI_METRICS:
+            self._handle('handle_ci_metrics', utils.handle_ci_metrics, msg)
+        elif kind == routing.CI_UMB:
+            self._handle('handle_ci_umb', utils.handle_ci_umb, msg, self.supersede_buffer)
+        elif kind in (routing.RESULTSDB_SINGLE, routing.RESULTSDB_BULK):
+            self._handle('handle_resultsdb_format', utils.handle_resultsdb_format, msg)
+        else:
+            self._unhandled(msg.topic, msg.msg_data, msg.log)
+            return False
 
-        # Next, detect if the message bears the secondary format we support:
-        # The "resultsdb" format.
-        # https://mojo.redhat.com/docs/DOC-1131637
-        single_keys = set(['data', 'outcome', 'ref_url', 'testcase'])
-        bulk_keys = set(['results', 'ref_url'])
-        if actual_keys.issuperset(single_keys) or actual_keys.issuperset(bulk_keys):
-            utils.handle_resultsdb_format(msg)
-            return
+        return True
+
+    def _unhandled(self, topic, msg_data, log=None):
+        """
+        Counts and logs an unhandled message.
 
-        if msg.topic != '/topic/VirtualTopic.qe.ci.jenkins':
+        If the message was not parsed, its logger is created only if the
+        message is logged.
+        """
+        metrics.messages_handled.labels('unhandled').inc()
+        if topic != '/topic/VirtualTopic.qe.ci.jenkins':
             # Mute unhandled message warnings when the message came from
             # VirtualTopic.qe.ci.jenkins since there will be many
-            msg.log.warning('Received unhandled message %r', msg)
+            if log is None:
+                log = _message_log(msg_data)
+            log.warning('Received unhandled message %s', LoggedPayload(msg_data))
 
     def consume(self, msg_data):
+        if self.profiler is not None:
+            self.profiler.run(self._consume, msg_data)
+        else:
+            self._consume(msg_data)
+
+    def _consume(self, msg_data):
         try:
-            config.LOGGER.debug('Message received: %s', msg_data)
-            msg = create_message(msg_data)
-            msg.log.debug('%s', msg)
+            received = time.time()
+            metrics.messages_received.inc()
+
+            # Drop denied and unhandled messages before parsing them.
+            kind = self.router.route(msg_data)
+            if kind == routing.DENIED:
+                metrics.filtered_messages.inc()
+                return
+            if kind == routing.INVALID:
+                if config.LOGGER.isEnabledFor(logging.DEBUG):
+                    _message_log(msg_data).debug('Dropping non-dict message.')
+                return
+            if kind == routing.UNHANDLED:
+                self._unhandled(msg_data.get('topic'), msg_data)
+                return
+
+            with metrics.parse_seconds.time():
+                msg = create_message(msg_data)
+            msg.log.extra['received'] = received
+            debug_payload(msg.log, 'Message received: %s', msg_data)
+            self.lag_monitor.observe(msg, received)
 
-            self._consume_helper(msg)
+            if self.dedup_cache is not None and self.dedup_cache.seen(msg.msg_id):
+                msg.log.info('Skipping already processed message')
+                return
+
+            # Results held by the supersede buffer are not collected.
+            with utils.collect_results() as payloads:
+                self._consume_helper(msg, kind)
+            if payloads and self.submission_queue:
+                # Leave looking up groups and posting results to the
+                # submission queue workers.
+                self.submission_queue.put(msg.log, payloads, received)
+            elif payloads:
+                utils.post_results(msg.log, payloads)
+                metrics.ack_seconds.observe(time.time() - received)
+
+            if self.dedup_cache is not None:
+                self.dedup_cache.add(msg.msg_id)
         except exceptions.CreateResultError as e:
             msg.log.error('Failed to process message: %s', e)
+        except exceptions.SubmissionQueueFull as e:
+            msg.log.error('Failed to queue results: %s', e)
+        except exceptions.CircuitOpenError as e:
+            msg.log.error('Failed to process message: %s', e)
         except exceptions.InvalidMessageError as e:
             msg.log.warning('Invalid message rejected: %s', e)
         except Exception:
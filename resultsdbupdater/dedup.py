@@ -0,0 +1,108 @@
+"""
+Cache of IDs of processed messages.
+
+The broker redelivers messages after a NACK or when a consumer restarts.
+Remembering IDs of messages whose results were already posted (or queued
+for posting) avoids creating duplicate results in ResultsDB.
+"""
+import collections
+import sqlite3
+import threading
+import time
+
+from . import config
+
+UNKNOWN_MSG_ID = 'ID:UNKNOWN'
+
+
+class DedupCache(object):
+    """
+    Bounded set of processed message IDs, dropping the oldest IDs first.
+
+    If path is set, IDs are also stored in an SQLite database so they are
+    remembered after restart.
+
+    Counts skipped messages for monitoring.
+    """
+
+    def __init__(self, maxsize, path=None):
+        """
+        Args:
+            maxsize (int) - Maximum number of remembered message IDs
+            path (string) - Path to the SQLite database file (optional)
+        """
+        self.maxsize = maxsize
+        self.path = path
+        self.skipped = 0
+        self._ids = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute('PRAGMA synchronous=NORMAL')
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS processed ('
+                ' msg_id TEXT PRIMARY KEY,'
+                ' created REAL NOT NULL)')
+            rows = self._db.execute(
+                'SELECT msg_id FROM (SELECT rowid, msg_id FROM processed'
+                ' ORDER BY rowid DESC LIMIT ?) ORDER BY rowid', (maxsize,))
+            for msg_id, in rows:
+                self._ids[msg_id] = None
+
+    def __len__(self):
+        return len(self._ids)
+
+    def seen(self, msg_id):
+        """
+        Returns True if the message was already processed and counts it as
+        skipped.
+        """
+        if msg_id == UNKNOWN_MSG_ID:
+            return False
+
+        with self._lock:
+            if msg_id not in self._ids:
+                return False
+
+            self._ids.move_to_end(msg_id)
+            self.skipped += 1
+            return True
+
+    def add(self, msg_id):
+        """
+        Remembers a processed message.
+        """
+        if msg_id == UNKNOWN_MSG_ID:
+            return
+
+        with self._lock:
+            self._ids[msg_id] = None
+            self._ids.move_to_end(msg_id)
+            while len(self._ids) > self.maxsize:
+                self._ids.popitem(last=False)
+
+            if self._db is not None:
+                cursor = self._db.execute(
+                    'INSERT OR REPLACE INTO processed (msg_id, created) VALUES (?, ?)',
+                    (msg_id, time.time()))
+                self._db.execute(
+                    'DELETE FROM processed WHERE rowid <= ?',
+                    (cursor.lastrowid - self.maxsize,))
+
+    def close(self):
+        if self._db is not None:
+            with self._lock:
+                self._db.close()
+
+
+def create_dedup_cache():
+    """
+    Returns DedupCache as configured or None if disabled.
+    """
+    if not config.DEDUP_CACHE_SIZE:
+        return None
+
+    return DedupCache(config.DEDUP_CACHE_SIZE, path=config.DEDUP_CACHE_PATH)
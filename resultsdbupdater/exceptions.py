@@ -44,3 +44,22 @@ class CreateResultError(RuntimeError):
 
     def __str__(self):
         return 'Failed to create result: {0}; Payload: {1}'.format(self.msg, self.payload)
+
+
+class SubmissionQueueFull(RuntimeError):
+    def __init__(self, maxsize):
+        super(SubmissionQueueFull, self).__init__()
+        self.maxsize = maxsize
+
+    def __str__(self):
+        return 'Submission queue is full ({0} messages)'.format(self.maxsize)
+
+
+class CircuitOpenError(RuntimeError):
+    def __init__(self, retry_after):
+        super(CircuitOpenError, self).__init__()
+        self.retry_after = retry_after
+
+    def __str__(self):
+        return 'ResultsDB is unavailable, next attempt in {0:.0f} seconds'.format(
+            self.retry_after)
@@ -0,0 +1,60 @@
+"""
+Measures how far behind the message bus the consumer is.
+"""
+import threading
+
+from . import config, metrics
+
+
+class LagMonitor(object):
+    """
+    Records time between sending a message to the broker and receiving it,
+    and warns when the lag exceeds a threshold.
+    """
+
+    def __init__(self, warning_threshold=0):
+        """
+        Args:
+            warning_threshold (float) - Lag in seconds to warn about (0
+                disables the warning)
+        """
+        self.warning_threshold = warning_threshold
+        self.lagging = False
+        self._lock = threading.Lock()
+
+    def observe(self, msg, received):
+        """
+        Records lag of a message received at given time.
+
+        Returns the lag in seconds, or None if the message has no timestamp.
+        """
+        sent = msg.timestamp
+        if sent is None:
+            return None
+
+        # Clocks of the broker and consumer may differ slightly.
+        lag = max(0, received - sent)
+        metrics.bus_lag_seconds.observe(lag)
+        metrics.bus_lag.set(lag)
+
+        if self.warning_threshold:
+            self._check(msg, lag)
+
+        return lag
+
+    def _check(self, msg, lag):
+        with self._lock:
+            lagging = lag > self.warning_threshold
+            changed = lagging != self.lagging
+            self.lagging = lagging
+
+        if changed and lagging:
+            msg.log.warning(
+                'Consumer is %.1f seconds behind the message bus (threshold %s seconds)',
+                lag, self.warning_threshold)
+        elif changed:
+            msg.log.info('Consumer caught up with the message bus (%.1f seconds behind)', lag)
+
+
+def create_lag_monitor():
+    return LagMonitor(config.LAG_WARNING_THRESHOLD)
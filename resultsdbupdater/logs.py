@@ -0,0 +1,148 @@
+"""
+Log pipeline: optional background thread writing log records, JSON format
+and rate limiting of repeated warnings.
+"""
+import atexit
+import collections
+import json
+import logging
+import logging.handlers
+import queue
+import threading
+
+# Log record attributes added as fields in JSON format (see
+# message.PrefixLogger and consumer).
+JSON_FIELDS = ('msg_id', 'topic', 'handler', 'suppressed')
+
+# Maximum number of distinct rate-limited log messages to remember.
+RATE_LIMIT_MAX_KEYS = 1000
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats log records as JSON objects, one per line.
+
+    Adds message ID, topic and handler name if available and the time
+    elapsed since the message was received (in seconds).
+    """
+
+    def format(self, record):
+        data = collections.OrderedDict((
+            ('time', self.formatTime(record)),
+            ('logger', record.name),
+            ('level', record.levelname),
+            ('message', record.getMessage()),
+        ))
+
+        for field in JSON_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                data[field] = value
+
+        received = getattr(record, 'received', None)
+        if received is not None:
+            data['elapsed'] = round(record.created - received, 6)
+
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data['exception'] = record.exc_text
+
+        return json.dumps(data, default=str)
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Drops repeated log messages of given level with the same format (e.g.
+    the same warning for different messages) logged within interval seconds
+    since the last one passed. Log messages of other levels always pass.
+
+    Next passed log message is amended with the number of dropped ones.
+    """
+
+    def __init__(self, interval, level=logging.WARNING):
+        """
+        Args:
+            interval (float) - Seconds to drop repeated log messages for
+            level (int) - Level of rate-limited log messages
+        """
+        super(RateLimitFilter, self).__init__()
+        self.interval = interval
+        self.level = level
+        self._last = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno != self.level:
+            return True
+
+        key = (record.name, record.levelno, self._template(record))
+        with self._lock:
+            last = self._last.get(key)
+            if last is not None and record.created - last[0] < self.interval:
+                last[1] += 1
+                return False
+
+            self._last[key] = [record.created, 0]
+            self._last.move_to_end(key)
+            while len(self._last) > RATE_LIMIT_MAX_KEYS:
+                self._last.popitem(last=False)
+
+        suppressed = last[1] if last is not None else 0
+        if suppressed:
+            record.suppressed = suppressed
+            record.msg = '{0} ({1} similar messages suppressed)'.format(record.msg, suppressed)
+        return True
+
+    @staticmethod
+    def _template(record):
+        template = str(record.msg)
+        msg_id = getattr(record, 'msg_id', None)
+        if msg_id is not None:
+            prefix = '[{0}]: '.format(msg_id)
+            if template.startswith(prefix):
+                return template[len(prefix):]
+        return template
+
+
+def configure_logging(log_format, level=None, json_format=False, use_queue=False,
+                      rate_limit=0, logger=None, stream=None):
+    """
+    Adds handler writing to stderr to the logger (root logger by default)
+    unless it already has handlers.
+
+    Args:
+        log_format (string) - Format of log messages (unless json_format)
+        level (string or int) - Log level to set (optional)
+        json_format (bool) - Format log messages as JSON (see JsonFormatter)
+        use_queue (bool) - Write log messages from a background thread so
+            logging does not block on I/O
+        rate_limit (float) - Seconds to drop repeated warnings for (see
+            RateLimitFilter, 0 to disable)
+
+    Returns:
+        QueueListener writing log messages if use_queue is set, otherwise
+        None
+    """
+    logger = logger or logging.getLogger()
+    if logger.handlers:
+        return None
+
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(JsonFormatter() if json_format else logging.Formatter(log_format))
+
+    listener = None
+    if use_queue:
+        listener = logging.handlers.QueueListener(queue.Queue(), handler)
+        listener.start()
+        atexit.register(listener.stop)
+        handler = logging.handlers.QueueHandler(listener.queue)
+
+    if rate_limit:
+        handler.addFilter(RateLimitFilter(rate_limit))
+
+    logger.addHandler(handler)
+    if level is not None:
+        logger.setLevel(level)
+
+    return listener
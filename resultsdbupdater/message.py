@@ -1,10 +1,17 @@
-import semantic_version
+import functools
+import itertools
+import logging
+import reprlib
 
 from . import config
 from . import exceptions
+from . import metrics
 
 REQUIRED_FIELD = object()
 
+# Marks a missing field in the cache of field lookups.
+_MISSING = object()
+
 
 def get_body(msg):
     return msg.get('body', {}).get('msg')
@@ -18,6 +25,7 @@ class Result(object):
     """
     Provides test result data from message.
     """
+    __slots__ = ('msg',)
 
     def __init__(self, msg):
         """
@@ -67,6 +75,8 @@ class Result(object):
 
 
 class ResultV2(Result):
+    __slots__ = ()
+
     def get(self, *args, **kwargs):
         return self.msg.get('test', *args, **kwargs)
 
@@ -82,38 +92,82 @@ class ResultV2(Result):
         return None
 
 
-class PrefixLogger(object):
+class PrefixLogger(logging.LoggerAdapter):
     """
-    Wrapper around a logger, adds custom prefix to messages.
+    Logger adapter which adds message ID prefix to log messages.
+
+    The prefix is formatted only if the log level is enabled. The message ID
+    and extra fields (e.g. topic) are also passed to log records as
+    attributes.
     """
 
-    def __init__(self, prefix, log):
+    def __init__(self, prefix, log, extra=None):
+        super(PrefixLogger, self).__init__(log, dict(extra or {}, msg_id=prefix))
         self.prefix = prefix
-        self.log = log
 
-    def info(self, msg, *args):
-        self.log.info(self._prefixed(msg), *args)
+    def process(self, msg, kwargs):
+        extra = kwargs.get('extra')
+        kwargs['extra'] = dict(self.extra, **extra) if extra else self.extra
+        return '[{0}]: {1}'.format(self.prefix, msg), kwargs
+
+
+class LoggedPayload(object):
+    """
+    Message or result payload converted to text only when logged, cropped to
+    config.LOG_PAYLOAD_LIMIT characters.
+    """
+    __slots__ = ('payload',)
 
-    def warning(self, msg, *args):
-        self.log.warning(self._prefixed(msg), *args)
+    def __init__(self, payload):
+        self.payload = payload
 
-    def error(self, msg, *args):
-        self.log.error(self._prefixed(msg), *args)
+    def __str__(self):
+        limit = config.LOG_PAYLOAD_LIMIT
+        if not limit:
+            return str(self.payload)
 
-    def exception(self, msg, *args):
-        self.log.exception(self._prefixed(msg), *args)
+        if isinstance(self.payload, str):
+            text = self.payload
+        else:
+            # Avoid converting whole large payload to text.
+            _payload_repr.maxstring = _payload_repr.maxother = limit
+            text = _payload_repr.repr(self.payload)
 
-    def debug(self, msg, *args):
-        self.log.debug(self._prefixed(msg), *args)
+        if len(text) <= limit:
+            return text
+        return '{0}... ({1} characters cropped)'.format(text[:limit], len(text) - limit)
+
+
+_payload_repr = reprlib.Repr()
+_payload_repr.maxlevel = 10
+_payload_repr.maxdict = _payload_repr.maxlist = _payload_repr.maxtuple = 100
+
+_payload_counter = itertools.count()
+
+
+def debug_payload(log, msg, payload):
+    """
+    Logs a message or result payload at debug level, cropped (see
+    LoggedPayload) and only for every config.LOG_PAYLOAD_EVERY-th payload.
+    """
+    if not log.isEnabledFor(logging.DEBUG):
+        return
 
-    def _prefixed(self, msg):
-        return '[{0}]: {1}'.format(self.prefix, msg)
+    if next(_payload_counter) % max(1, config.LOG_PAYLOAD_EVERY) == 0:
+        log.debug(msg, LoggedPayload(payload))
 
 
 class Message(object):
     """
     Provides message data.
+
+    Body, result, system and field lookups are resolved only once.
     """
+    __slots__ = ('msg_data', 'log', 'msg_id', '_body', '_result', '_system', '_fields')
+
+    # Field with contact information.
+    contact_field = 'ci'
+    result_class = Result
 
     def __init__(self, msg_data):
         """
@@ -121,21 +175,24 @@ class Message(object):
             msg (dict) - Message data
         """
         self.msg_data = msg_data
-        self.log = PrefixLogger(self.msg_id, config.LOGGER)
+        try:
+            self.msg_id = self.header('message-id')
+        except Exception:
+            self.msg_id = 'ID:UNKNOWN'
+        self.log = PrefixLogger(self.msg_id, config.LOGGER, {'topic': self.topic})
+        self._body = _MISSING
+        self._result = None
+        self._system = None
+        self._fields = {}
 
     def __repr__(self):
         return repr(self.msg_data)
 
     @property
     def body(self):
-        return get_body(self.msg_data)
-
-    @property
-    def msg_id(self):
-        try:
-            return self.header('message-id')
-        except Exception:
-            return 'ID:UNKNOWN'
+        if self._body is _MISSING:
+            self._body = get_body(self.msg_data)
+        return self._body
 
     @property
     def topic(self):
@@ -148,48 +205,77 @@ class Message(object):
     def header(self, name):
         return self.msg_data.get('headers', {}).get(name)
 
-    def _get(self, *args, **kwargs):
-        value = kwargs.get('value')
-        default = kwargs.get('default')
+    @property
+    def timestamp(self):
+        """
+        Returns time the message was sent to the broker (seconds since
+        epoch) or None if unknown.
+        """
+        # Broker timestamp is in milliseconds, zero if not set.
+        try:
+            timestamp = float(self.header('timestamp') or 0) / 1000
+        except (TypeError, ValueError):
+            timestamp = 0
 
+        if not timestamp:
+            timestamp = self.msg_data.get('timestamp')
+
+        return timestamp or None
+
+    @staticmethod
+    def _lookup(value, args):
         for arg in args:
             if not isinstance(value, dict):
-                return default
-            value = value.get(arg, default)
+                return _MISSING
+            value = value.get(arg, _MISSING)
+            if value is _MISSING:
+                return _MISSING
 
         return value
 
     def get(self, *args, **kwargs):
-        default = kwargs.get('default', REQUIRED_FIELD)
-
-        value = self._get(*args, value=self.body, default=default)
+        try:
+            value = self._fields[args]
+        except KeyError:
+            value = self._fields[args] = self._lookup(self.body, args)
 
-        if value is REQUIRED_FIELD:
-            raise exceptions.MissingMessageField(*args)
+        if value is _MISSING:
+            default = kwargs.get('default', REQUIRED_FIELD)
+            if default is REQUIRED_FIELD:
+                raise exceptions.MissingMessageField(*args)
+            return default
 
         return value
 
     def contact(self, field, default=REQUIRED_FIELD):
-        return self.get('ci', field, default=default)
+        return self.get(self.contact_field, field, default=default)
 
     def system(self, field, default=REQUIRED_FIELD):
-        system = self.get('system', default={})
+        system = self._system
+        if system is None:
+            system = self.get('system', default={})
 
-        # Oddly, sometimes people pass us a sytem dict but other times a
-        # list of one system dict.  Try to handle those two situation here.
-        if isinstance(system, list):
-            system = system[0] if system else {}
+            # Oddly, sometimes people pass us a sytem dict but other times a
+            # list of one system dict.  Try to handle those two situation here.
+            if isinstance(system, list):
+                system = system[0] if system else {}
 
-        value = self._get(field, value=system, default=default)
+            self._system = system
 
-        if value is REQUIRED_FIELD:
-            raise exceptions.MissingMessageField('system', field)
+        value = self._lookup(system, (field,))
+
+        if value is _MISSING:
+            if default is REQUIRED_FIELD:
+                raise exceptions.MissingMessageField('system', field)
+            return default
 
         return value
 
     @property
     def result(self):
-        return Result(self)
+        if self._result is None:
+            self._result = self.result_class(self)
+        return self._result
 
     @property
     def contact_dict(self):
@@ -211,9 +297,9 @@ class Message(object):
 
 
 class MessageV2(Message):
-    @property
-    def result(self):
-        return ResultV2(self)
+    __slots__ = ()
+
+    result_class = ResultV2
 
     @property
     def recipients(self):
@@ -225,22 +311,66 @@ class MessageV2(Message):
 
 
 class MessageV2_1(MessageV2):
-    def contact(self, field, default=REQUIRED_FIELD):
-        return self.get('contact', field, default=default)
+    __slots__ = ()
+
+    contact_field = 'contact'
+
+
+# Message classes for message versions less than given version (newer
+# versions use MessageV2_1).
+VERSION_CLASSES = (
+    ('<0.2.0', Message),
+    ('<0.2.1', MessageV2),
+)
+
+# Maximum number of distinct message versions to remember message class for.
+VERSION_CACHE_SIZE = 64
+
+_version_specs = None
+
+
+def _compile_version_specs():
+    global _version_specs
+    if _version_specs is None:
+        # Imported only when needed, usually for the first few messages.
+        import semantic_version
+        _version_specs = (
+            semantic_version.Version,
+            tuple(
+                (semantic_version.SimpleSpec(spec), message_class)
+                for spec, message_class in VERSION_CLASSES),
+        )
+    return _version_specs
+
+
+@functools.lru_cache(maxsize=VERSION_CACHE_SIZE)
+def message_class(version):
+    """
+    Returns Message class for the message version.
+
+    Raises an exception if the version cannot be parsed (failures are not
+    cached).
+    """
+    version_class, specs = _compile_version_specs()
+    parsed_version = version_class(version)
+    for spec, spec_class in specs:
+        if spec.match(parsed_version):
+            return spec_class
+
+    return MessageV2_1
 
 
 def create_message(msg_data):
     try:
         version = get_version(msg_data)
+    except AttributeError:
+        # Message body is not a dict, there is no version to parse.
+        return Message(msg_data)
 
-        if semantic_version.match('<0.2.0', version):
-            return Message(msg_data)
-
-        if semantic_version.match('<0.2.1', version):
-            return MessageV2(msg_data)
-
-        return MessageV2_1(msg_data)
-    except Exception:
+    try:
+        return message_class(version)(msg_data)
+    except (TypeError, ValueError):
+        metrics.version_parse_failures.inc()
         msg = Message(msg_data)
         msg.log.exception('Failed to parse message version')
         return msg
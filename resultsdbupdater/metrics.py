@@ -0,0 +1,199 @@
+"""
+Metrics of the consumer pipeline, exposed over HTTP in the Prometheus text
+format.
+
+Metrics are always collected (cheaply, in memory); the HTTP endpoint is
+started only if configured (see config.METRICS_PORT).
+"""
+import http.server
+import socketserver
+import threading
+
+import prometheus_client
+from prometheus_client.core import CounterMetricFamily
+
+# Upper bounds of histogram buckets in seconds.
+DEFAULT_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+CONTENT_TYPE = prometheus_client.CONTENT_TYPE_LATEST
+
+registry = prometheus_client.CollectorRegistry()
+
+
+class FunctionCounter(object):
+    """
+    Counter computed by a function returning a count kept elsewhere (e.g.
+    CircuitBreaker.stats()) when collected.
+    """
+
+    def __init__(self, name, documentation, registry=registry):
+        self.name = name
+        self.documentation = documentation
+        self._function = None
+        registry.register(self)
+
+    def set_function(self, fn):
+        self._function = fn
+
+    def describe(self):
+        return [CounterMetricFamily(self.name, self.documentation)]
+
+    def collect(self):
+        family = CounterMetricFamily(self.name, self.documentation)
+        if self._function is not None:
+            family.add_metric([], self._function())
+        return [family]
+
+
+def sample(name, **labels):
+    """
+    Returns current value of a sample (e.g. "<histogram>_count") or 0.
+    """
+    value = registry.get_sample_value(name, labels)
+    return value if value is not None else 0
+
+
+def _counter(name, documentation, labelnames=()):
+    return prometheus_client.Counter(name, documentation, labelnames, registry=registry)
+
+
+def _gauge(name, documentation):
+    return prometheus_client.Gauge(name, documentation, registry=registry)
+
+
+def _histogram(name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+    return prometheus_client.Histogram(
+        name, documentation, labelnames, registry=registry, buckets=buckets)
+
+
+messages_received = _counter(
+    'resultsdb_updater_messages_received_total',
+    'Messages received from the message bus.')
+filtered_messages = _counter(
+    'resultsdb_updater_messages_filtered_total',
+    'Messages dropped by the topic allow/deny lists.')
+messages_handled = _counter(
+    'resultsdb_updater_messages_handled_total',
+    'Messages by handler (or "unhandled").',
+    ['handler'])
+artifact_messages = _counter(
+    'resultsdb_updater_artifact_messages_total',
+    'CI messages by artifact type.',
+    ['artifact_type'])
+version_parse_failures = _counter(
+    'resultsdb_updater_version_parse_failures_total',
+    'Messages with a version that cannot be parsed (handled as version 0.1.0).')
+parse_seconds = _histogram(
+    'resultsdb_updater_parse_seconds',
+    'Time to parse a received message.')
+handle_seconds = _histogram(
+    'resultsdb_updater_handle_seconds',
+    'Time to transform a message to results, without looking up groups and '
+    'posting the results.',
+    ['handler'])
+request_seconds = _histogram(
+    'resultsdb_updater_request_seconds',
+    'Duration of ResultsDB requests, including retries.',
+    ['method'])
+responses = _counter(
+    'resultsdb_updater_responses_total',
+    'ResultsDB responses by method and status class (2xx, 4xx, 5xx).',
+    ['method', 'status'])
+retries = _counter(
+    'resultsdb_updater_retries_total',
+    'Retried ResultsDB requests ("http") and retried messages ("queue").',
+    ['source'])
+cropped_values = _counter(
+    'resultsdb_updater_cropped_values_total',
+    'Result data values cropped because they are too large.')
+bus_lag_seconds = _histogram(
+    'resultsdb_updater_bus_lag_seconds',
+    'Time from sending a message to the broker until it is received.',
+    buckets=(0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 1800, 3600, 7200))
+bus_lag = _gauge(
+    'resultsdb_updater_bus_lag_seconds_current',
+    'Lag of the last received message with a timestamp.')
+ack_seconds = _histogram(
+    'resultsdb_updater_ack_seconds',
+    'Time from receiving a message until ResultsDB accepts its results.')
+queue_depth = _gauge(
+    'resultsdb_updater_queue_depth',
+    'Messages waiting for their results to be posted.')
+queue_oldest_age = _gauge(
+    'resultsdb_updater_queue_oldest_age_seconds',
+    'Age of the oldest message waiting for its results to be posted.')
+circuit_state = _gauge(
+    'resultsdb_updater_circuit_open',
+    'Whether the circuit breaker stops requests to ResultsDB (1) or not (0).')
+circuit_opened = FunctionCounter(
+    'resultsdb_updater_circuit_opened_total',
+    'Number of times the circuit breaker opened.')
+circuit_rejected = FunctionCounter(
+    'resultsdb_updater_circuit_rejected_total',
+    'Requests rejected by the open circuit breaker.')
+group_cache_hits = FunctionCounter(
+    'resultsdb_updater_group_cache_hits_total',
+    'Groups found in the group cache.')
+group_cache_misses = FunctionCounter(
+    'resultsdb_updater_group_cache_misses_total',
+    'Groups not found in the group cache.')
+skipped_messages = FunctionCounter(
+    'resultsdb_updater_skipped_messages_total',
+    'Redelivered messages skipped by the dedup cache.')
+superseded_results = FunctionCounter(
+    'resultsdb_updater_superseded_results_total',
+    'Held results dropped in favour of a later state of the test run.')
+
+
+def observe_response(method, status):
+    """
+    Counts a ResultsDB response by status class.
+    """
+    responses.labels(method, '{0}xx'.format(status // 100)).inc()
+
+
+# Additional text pages served by the metrics HTTP server: maps path to a
+# function returning the page content.
+pages = {}
+
+
+class _MetricsServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+
+class _MetricsHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        path = self.path.split('?', 1)[0]
+        if path == '/metrics':
+            data = prometheus_client.generate_latest(registry)
+            content_type = CONTENT_TYPE
+        elif path in pages:
+            data = pages[path]().encode('utf-8')
+            content_type = 'text/plain; charset=utf-8'
+        else:
+            self.send_error(404)
+            return
+
+        self.send_response(200)
+        self.send_header('content-type', content_type)
+        self.send_header('content-length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_http_server(port, addr=''):
+    """
+    Serves metrics on http://<addr>:<port>/metrics (and pages) from a
+    background thread.
+
+    Returns the server; call shutdown() to stop it.
+    """
+    server = _MetricsServer((addr, port), _MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever, name='resultsdb-metrics')
+    thread.daemon = True
+    thread.start()
+    return server
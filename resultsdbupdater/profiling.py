@@ -0,0 +1,169 @@
+"""
+Sampling profiler for the consume path, for production environments where
+an external profiler cannot be attached.
+
+While enabled, every Nth consumed message (or results posted by submission
+worker threads) is profiled with cProfile and the statistics are
+aggregated. Profiling is toggled at runtime with a signal;
+when it stops, the statistics are written to a file.
+"""
+import cProfile
+import io
+import pstats
+import signal
+import threading
+import time
+
+from . import config
+
+# Number of functions in the text report.
+REPORT_LIMIT = 50
+
+
+class Profiler(object):
+    """
+    Profiles every Nth call while enabled, optionally only for a limited
+    time after enabling.
+    """
+
+    def __init__(self, every=1, duration=0, path=None):
+        """
+        Args:
+            every (int) - Profile every Nth call
+            duration (float) - Seconds to profile after enabling (0 to
+                profile until disabled)
+            path (string) - File to write statistics to when profiling
+                stops (in pstats format, with a text report next to it)
+        """
+        self.every = max(1, every)
+        self.duration = duration
+        self.path = path
+        self.enabled = False
+        self.profiled = 0
+        self._calls = 0
+        self._deadline = None
+        self._stats = None
+        # Reentrant, the signal handler can interrupt a locked section.
+        self._lock = threading.RLock()
+
+    def enable(self):
+        with self._lock:
+            self.enabled = True
+            self._calls = 0
+            self._deadline = time.time() + self.duration if self.duration else None
+        config.LOGGER.info('Profiling enabled')
+
+    def disable(self):
+        with self._lock:
+            if not self.enabled:
+                return
+            self.enabled = False
+        config.LOGGER.info('Profiling disabled')
+        self.dump()
+
+    def toggle(self, *args):
+        """
+        Enables or disables profiling (can be used as signal handler).
+        """
+        if self.enabled:
+            self.disable()
+        else:
+            self.enable()
+
+    def run(self, fn, *args):
+        """
+        Calls fn(*args), profiling the call if it should be sampled.
+        """
+        if not self._sample():
+            return fn(*args)
+
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler is active (e.g. concurrent call).
+            return fn(*args)
+
+        try:
+            return fn(*args)
+        finally:
+            profile.disable()
+            self._add(profile)
+
+    def _sample(self):
+        if not self.enabled:
+            return False
+
+        with self._lock:
+            expired = self._deadline is not None and time.time() > self._deadline
+            if not expired:
+                self._calls += 1
+                return self._calls % self.every == 0
+
+        self.disable()
+        return False
+
+    def _add(self, profile):
+        with self._lock:
+            self.profiled += 1
+            if self._stats is None:
+                self._stats = pstats.Stats(profile)
+            else:
+                self._stats.add(profile)
+
+    def report(self):
+        """
+        Returns text report of functions with the highest cumulative time.
+        """
+        output = io.StringIO()
+        with self._lock:
+            if self._stats is None:
+                return 'No profiled calls\n'
+            self._stats.stream = output
+            self._stats.sort_stats('cumulative').print_stats(REPORT_LIMIT)
+        return output.getvalue()
+
+    def dump(self):
+        """
+        Writes statistics to the configured path.
+        """
+        if not self.path:
+            return
+
+        with self._lock:
+            if self._stats is None:
+                return
+            self._stats.dump_stats(self.path)
+
+        with open(self.path + '.txt', 'w') as report_file:
+            report_file.write(self.report())
+
+        config.LOGGER.info(
+            'Profiling statistics of %s calls written to %s', self.profiled, self.path)
+
+
+def create_profiler():
+    """
+    Returns Profiler as configured or None if profiling is disabled.
+
+    The configured signal toggles profiling.
+    """
+    if not config.PROFILE_ENABLED and not config.PROFILE_SIGNAL:
+        return None
+
+    profiler = Profiler(
+        every=config.PROFILE_EVERY,
+        duration=config.PROFILE_DURATION,
+        path=config.PROFILE_PATH)
+
+    if config.PROFILE_SIGNAL:
+        try:
+            signal.signal(getattr(signal, config.PROFILE_SIGNAL), profiler.toggle)
+        except (AttributeError, ValueError) as e:
+            config.LOGGER.warning(
+                'Cannot toggle profiling with signal %s: %s', config.PROFILE_SIGNAL, e)
+
+    if config.PROFILE_ENABLED:
+        profiler.enable()
+
+    return profiler
@@ -0,0 +1,75 @@
+import heapq
+import itertools
+import random
+import threading
+import time
+
+from . import session
+
+
+def full_jitter_backoff(attempt):
+    """
+    Returns random seconds to wait before given retry attempt (counted from
+    1), between zero and the exponential backoff time.
+    """
+    return random.uniform(
+        0, min(session.BACKOFF_FACTOR * (2 ** attempt), session.BACKOFF_MAX))
+
+
+class RetryScheduler(object):
+    """
+    Delay queue calling functions after given time from a single background
+    thread.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._counter = itertools.count()
+        self._stopping = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name='resultsdb-retry')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def __len__(self):
+        return len(self._heap)
+
+    def call_later(self, delay, fn, *args):
+        with self._condition:
+            heapq.heappush(
+                self._heap, (time.time() + delay, next(self._counter), fn, args))
+            self._condition.notify()
+
+    def stop(self):
+        """
+        Stops the scheduler.
+
+        Returns list of arguments of calls that were not run yet.
+        """
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+        self._thread.join()
+
+        pending = [args for _, _, _, args in sorted(self._heap)]
+        self._heap = []
+        return pending
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._stopping:
+                    if self._heap:
+                        timeout = self._heap[0][0] - time.time()
+                        if timeout <= 0:
+                            break
+                    else:
+                        timeout = None
+                    self._condition.wait(timeout)
+
+                if self._stopping:
+                    return
+
+                _, _, fn, args = heapq.heappop(self._heap)
+
+            fn(*args)
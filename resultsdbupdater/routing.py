@@ -0,0 +1,145 @@
+"""
+Routing of received messages, before they are parsed.
+
+Messages from topics denied by configuration are dropped, and the format of
+other messages is recognized from the topic and the top-level keys of the
+message body. Both decisions are cached, so frequent messages which are not
+handled (e.g. from /topic/VirtualTopic.qe.ci.jenkins) are dropped cheaply.
+"""
+import functools
+
+from . import config
+
+# Message kinds.
+CI_METRICS = 'ci_metrics'
+CI_UMB = 'ci_umb'
+RESULTSDB_SINGLE = 'resultsdb_single'
+RESULTSDB_BULK = 'resultsdb_bulk'
+UNHANDLED = 'unhandled'
+# Message body is not a dict.
+INVALID = 'invalid'
+# Topic is denied by configuration.
+DENIED = 'denied'
+
+# Topic of legacy metrics messages.
+CI_METRICS_TOPIC = '/topic/VirtualTopic.eng.platformci.tier1.result'
+
+# "FACTORY 2.0 CI UMB messages", see: https://pagure.io/fedora-ci/messages
+CI_UMB_KEYS = frozenset(['run', 'artifact'])
+CI_UMB_CONTACT_KEYS = frozenset(['ci', 'contact'])
+
+# The "resultsdb" format, see: https://mojo.redhat.com/docs/DOC-1131637
+RESULTSDB_SINGLE_KEYS = frozenset(['data', 'outcome', 'ref_url', 'testcase'])
+RESULTSDB_BULK_KEYS = frozenset(['results', 'ref_url'])
+
+# Matches any single topic component in topic patterns.
+WILDCARD = '*'
+
+
+def classify(topic, keys):
+    """
+    Returns kind of message from its topic and top-level keys of body.
+    """
+    # First, look by topic to see if the message is one of the old formats
+    # we want to handle for legacy reasons.
+    if topic == CI_METRICS_TOPIC:
+        return CI_METRICS
+
+    if keys >= CI_UMB_KEYS and not keys.isdisjoint(CI_UMB_CONTACT_KEYS):
+        return CI_UMB
+
+    if keys >= RESULTSDB_SINGLE_KEYS:
+        return RESULTSDB_SINGLE
+
+    if keys >= RESULTSDB_BULK_KEYS:
+        return RESULTSDB_BULK
+
+    return UNHANDLED
+
+
+class TopicTrie(object):
+    """
+    Trie of topic patterns.
+
+    A pattern matches topics starting with the same components (separated
+    with "."); "*" component matches any single component.
+    """
+
+    def __init__(self, patterns=()):
+        self._root = {}
+        self._end = object()
+        for pattern in patterns:
+            self.add(pattern)
+
+    def __bool__(self):
+        return bool(self._root)
+
+    def add(self, pattern):
+        node = self._root
+        for component in pattern.split('.'):
+            node = node.setdefault(component, {})
+        node[self._end] = True
+
+    def matches(self, topic):
+        return self._matches(self._root, topic.split('.'), 0)
+
+    def _matches(self, node, components, index):
+        if self._end in node:
+            return True
+
+        if index == len(components):
+            return False
+
+        for key in (components[index], WILDCARD):
+            child = node.get(key)
+            if child is not None and self._matches(child, components, index + 1):
+                return True
+
+        return False
+
+
+class Router(object):
+    """
+    Routes messages by topic allow/deny lists and recognized format.
+    """
+
+    def __init__(self, allow=(), deny=(), cache_size=1024):
+        """
+        Args:
+            allow (list) - Topic patterns to accept (empty to accept all)
+            deny (list) - Topic patterns to drop
+            cache_size (int) - Maximum number of cached decisions
+        """
+        self.allow = TopicTrie(allow)
+        self.deny = TopicTrie(deny)
+        self.allowed = functools.lru_cache(maxsize=cache_size)(self._allowed)
+        self.classify = functools.lru_cache(maxsize=cache_size)(classify)
+
+    def _allowed(self, topic):
+        if self.deny and self.deny.matches(topic):
+            return False
+        return not self.allow or self.allow.matches(topic)
+
+    def route(self, msg_data):
+        """
+        Returns kind of the message.
+        """
+        topic = msg_data.get('topic')
+        if not isinstance(topic, str):
+            topic = ''
+        if not self.allowed(topic):
+            return DENIED
+
+        body = msg_data.get('body')
+        body = body.get('msg') if isinstance(body, dict) else None
+        if not isinstance(body, dict):
+            return INVALID
+
+        return self.classify(topic, frozenset(body))
+
+
+def create_router():
+    return Router(
+        allow=config.TOPIC_ALLOW,
+        deny=config.TOPIC_DENY,
+        cache_size=config.ROUTING_CACHE_SIZE)
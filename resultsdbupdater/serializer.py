@@ -0,0 +1,103 @@
+"""
+JSON serialization of results for ResultsDB.
+
+Request bodies are serialized with orjson or ujson if installed (see
+config.JSON_BACKEND), otherwise with json from standard library. All
+backends produce compact ASCII-only JSON with the same values, but numbers
+can be formatted differently: orjson writes 1e-07 as 1e-7, and NaN and
+infinity as null (json writes NaN and Infinity).
+
+Result data values are stored in ResultsDB as serialized, so they are
+always serialized with json from standard library and its default
+separators (see dumps_value()), regardless of the backend.
+"""
+import json
+import re
+
+from . import config
+
+# Backends in order of preference.
+BACKENDS = ('orjson', 'ujson', 'json')
+
+_NON_ASCII_REGEX = re.compile(r'[^\x00-\x7f]')
+
+# Fallback for values fast backends cannot serialize (e.g. integers larger
+# than 64 bits or lone surrogates).
+_json_encode = json.JSONEncoder(separators=(',', ':')).encode
+
+
+def _escape_non_ascii(match):
+    code = ord(match.group())
+    if code < 0x10000:
+        return '\\u{0:04x}'.format(code)
+
+    code -= 0x10000
+    return '\\u{0:04x}\\u{1:04x}'.format(0xd800 + (code >> 10), 0xdc00 + (code & 0x3ff))
+
+
+def _orjson_dumps():
+    import orjson
+
+    option = orjson.OPT_NON_STR_KEYS
+
+    def dumps(value):
+        try:
+            text = orjson.dumps(value, option=option).decode('utf-8')
+        except TypeError:
+            return _json_encode(value)
+
+        return _NON_ASCII_REGEX.sub(_escape_non_ascii, text)
+
+    return dumps
+
+
+def _ujson_dumps():
+    import ujson
+
+    def dumps(value):
+        try:
+            return ujson.dumps(value, ensure_ascii=True, escape_forward_slashes=False)
+        except (OverflowError, TypeError, ValueError):
+            return _json_encode(value)
+
+    return dumps
+
+
+def _json_dumps():
+    return _json_encode
+
+
+_LOADERS = {
+    'orjson': _orjson_dumps,
+    'ujson': _ujson_dumps,
+    'json': _json_dumps,
+}
+
+
+def select_backend(name='auto'):
+    """
+    Returns tuple (backend name, dumps function).
+
+    Args:
+        name (string) - One of BACKENDS or "auto" for the first one
+            installed
+    """
+    if name == 'auto':
+        names = BACKENDS
+    elif name in _LOADERS:
+        names = (name, 'json')
+    else:
+        raise ValueError('Unknown JSON backend "{0}"'.format(name))
+
+    for backend in names:
+        try:
+            return backend, _LOADERS[backend]()
+        except ImportError:
+            if name != 'auto':
+                config.LOGGER.warning('JSON backend %s is not installed, using json', backend)
+
+
+BACKEND, dumps = select_backend(config.JSON_BACKEND)
+
+# Serializes a result data value, e.g. '{"a": 1}' (not '{"a":1}').
+dumps_value = json.dumps
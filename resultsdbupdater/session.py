@@ -1,28 +1,113 @@
+import asyncio
+
 import requests
 from requests.adapters import HTTPAdapter
 from requests.packages.urllib3.util.retry import Retry
 
-from . import config
+from . import config, metrics
+from .circuit import CircuitBreaker
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+_CONNECTION_ERRORS = (
+    requests.exceptions.ConnectionError,
+    # Server errors after all retries of the requests session.
+    requests.exceptions.RetryError,
+    requests.exceptions.Timeout,
+    asyncio.TimeoutError,
+)
+if aiohttp is not None:
+    _CONNECTION_ERRORS += (aiohttp.ClientConnectionError,)
+
+# Retry policy for ResultsDB requests. The circuit breaker sees a failure
+# only after all retries, so retry just a few times if it is enabled.
+RETRIES = config.MAX_RETRIES
+if config.CIRCUIT_BREAKER_FAILURE_RATE:
+    RETRIES = min(RETRIES, config.CIRCUIT_BREAKER_MAX_RETRIES)
+BACKOFF_FACTOR = 0.3
+BACKOFF_MAX = 120
+RETRY_STATUS = (500, 502, 504)
+
+
+def backoff_time(retry):
+    """
+    Returns seconds to wait before given retry (counted from 1), same as
+    urllib3 Retry.
+    """
+    if retry <= 1:
+        return 0
+    return min(BACKOFF_FACTOR * (2 ** (retry - 1)), BACKOFF_MAX)
+
+
+def is_server_failure(error):
+    """
+    Returns True if exception from a request means ResultsDB is not
+    available or failing (as opposed to rejecting the request).
+    """
+    if isinstance(error, requests.exceptions.HTTPError):
+        return error.response is None or error.response.status_code >= 500
+
+    if aiohttp is not None and isinstance(error, aiohttp.ClientResponseError):
+        return error.status >= 500
+
+    return isinstance(error, _CONNECTION_ERRORS)
+
+
+class _Retry(Retry):
+    """
+    Retry policy counting retried requests.
+
+    Requests with methods not in method_whitelist are never retried (urllib3
+    would still retry their connection errors, and retry any method if
+    method_whitelist is empty).
+    """
+
+    def _is_method_retryable(self, method):
+        return method.upper() in self.method_whitelist
+
+    def increment(self, method=None, *args, **kwargs):
+        if not self._is_method_retryable(method):
+            return Retry.increment(self.new(total=0), method, *args, **kwargs)
+
+        retry = super(_Retry, self).increment(method, *args, **kwargs)
+        metrics.retries.labels('http').inc()
+        return retry
+
+
+def _retried_methods():
+    # Submission workers retry failed requests (including group lookups)
+    # themselves, so the retry deadline bounds the time spent on them.
+    uses_workers = config.SUBMIT_WORKERS and not config.SPOOL_PATH
+    if config.RETRY_DEADLINE and uses_workers and config.HTTP_CLIENT == 'requests':
+        return ()
+    return ('GET', 'POST')
 
 
 def _retry_session():
-    # This will give the total wait time in minutes:
+    # With the default 24 retries, this will give the total wait time in minutes:
     # >>> sum([min((0.3 * (2 ** (i - 1))), 120) / 60 for i in range(24)])
     # >>> 30.5575
     # This works by the using the minimum time in seconds of the backoff time
     # and the max back off time which defaults to 120 seconds. The backoff time
     # increases after every failed attempt.
     session = requests.Session()
-    retry = Retry(
-        total=24,
-        read=24,
-        connect=24,
-        status=24,
-        backoff_factor=0.3,
-        status_forcelist=(500, 502, 504),
-        method_whitelist=('GET', 'POST'),
+    retry = _Retry(
+        total=RETRIES,
+        read=RETRIES,
+        connect=RETRIES,
+        status=RETRIES,
+        backoff_factor=BACKOFF_FACTOR,
+        status_forcelist=RETRY_STATUS,
+        method_whitelist=_retried_methods(),
     )
-    adapter = HTTPAdapter(max_retries=retry)
+    # Keep a connection for each thread which can send requests in parallel.
+    pool_maxsize = max(
+        requests.adapters.DEFAULT_POOLSIZE,
+        config.POST_CONCURRENCY + config.SUBMIT_WORKERS + 1)
+    adapter = HTTPAdapter(max_retries=retry, pool_maxsize=pool_maxsize)
     session.mount('http://', adapter)
     session.mount('https://', adapter)
 
@@ -34,3 +119,10 @@ def _retry_session():
 
 
 session = _retry_session()
+
+circuit_breaker = CircuitBreaker(
+    failure_rate=config.CIRCUIT_BREAKER_FAILURE_RATE,
+    window=config.CIRCUIT_BREAKER_WINDOW,
+    min_calls=config.CIRCUIT_BREAKER_MIN_CALLS,
+    reset_timeout=config.CIRCUIT_BREAKER_RESET_TIMEOUT,
+    is_failure=is_server_failure)
@@ -0,0 +1,200 @@
+"""
+Durable spool for results waiting to be posted to ResultsDB.
+
+Results are stored in an SQLite database (write-ahead log) before they are
+posted, so they survive ResultsDB outages and service restarts. A
+background thread posts the stored results in order and removes them once
+ResultsDB accepts them.
+"""
+import json
+import sqlite3
+import threading
+import time
+
+from . import config, metrics, session, utils
+from .exceptions import CircuitOpenError, CreateResultError
+from .message import PrefixLogger
+
+# Maps fsync policy to SQLite "synchronous" setting.
+FSYNC_POLICIES = {
+    # Sync every stored message to disk.
+    'always': 'FULL',
+    # Sync only at WAL checkpoints; a power loss can lose last messages
+    # (not a process crash).
+    'normal': 'NORMAL',
+    # Leave syncing to the operating system.
+    'never': 'OFF',
+}
+
+
+class Spool(object):
+    """
+    Ordered persistent queue of message results.
+    """
+
+    def __init__(self, path, fsync='always'):
+        """
+        Args:
+            path (string) - Path to the SQLite database file
+            fsync (string) - When to sync data to disk, see FSYNC_POLICIES
+        """
+        if fsync not in FSYNC_POLICIES:
+            raise RuntimeError(
+                'Unknown spool fsync policy "{0}", expected one of: {1}'
+                .format(fsync, ', '.join(sorted(FSYNC_POLICIES))))
+
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous={0}'.format(FSYNC_POLICIES[fsync]))
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS outbox ('
+            ' id INTEGER PRIMARY KEY AUTOINCREMENT,'
+            ' msg_id TEXT,'
+            ' payloads TEXT NOT NULL,'
+            ' created REAL NOT NULL)')
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM outbox').fetchone()[0]
+
+    def append(self, msg_id, payloads, created=None):
+        with self._lock:
+            self._db.execute(
+                'INSERT INTO outbox (msg_id, payloads, created) VALUES (?, ?, ?)',
+                (msg_id, json.dumps(payloads), created or time.time()))
+
+    def first(self):
+        """
+        Returns the oldest entry as tuple (id, msg_id, payloads, created), or
+        None if the spool is empty.
+        """
+        with self._lock:
+            row = self._db.execute(
+                'SELECT id, msg_id, payloads, created FROM outbox ORDER BY id LIMIT 1'
+            ).fetchone()
+
+        if row is None:
+            return None
+
+        entry_id, msg_id, payloads, created = row
+        return entry_id, msg_id, json.loads(payloads), created
+
+    def update(self, entry_id, payloads):
+        with self._lock:
+            self._db.execute(
+                'UPDATE outbox SET payloads = ? WHERE id = ?',
+                (json.dumps(payloads), entry_id))
+
+    def remove(self, entry_id):
+        with self._lock:
+            self._db.execute('DELETE FROM outbox WHERE id = ?', (entry_id,))
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class SpoolQueue(object):
+    """
+    Stores results of messages in a Spool and posts them in order from a
+    background thread (same interface as submission.SubmissionQueue).
+
+    If ResultsDB is not available, the thread waits retry_interval seconds
+    and tries again with the same results. Results failing for any other
+    reason are dropped, so they do not block the following ones.
+    """
+
+    def __init__(self, spool, retry_interval=10, profiler=None):
+        self.spool = spool
+        self.retry_interval = retry_interval
+        self.profiler = profiler
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread = threading.Thread(target=self._replay, name='resultsdb-spool')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def put(self, log, payloads, received=None):
+        self.spool.append(log.prefix, payloads, received)
+        self._wakeup.set()
+
+    def depth(self):
+        return len(self.spool)
+
+    def oldest_age(self):
+        entry = self.spool.first()
+        return time.time() - entry[3] if entry else 0
+
+    def stop(self):
+        """
+        Stops posting results; results not yet posted stay in the spool.
+        """
+        self._stopping = True
+        self._wakeup.set()
+        self._thread.join()
+        self.spool.close()
+
+    def _replay(self):
+        while not self._stopping:
+            entry = self.spool.first()
+            if entry is None:
+                self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+
+            entry_id, msg_id, payloads, created = entry
+            stored = list(payloads)
+            posted = []
+            log = PrefixLogger(msg_id, config.LOGGER)
+            if self.profiler is not None:
+                submitted = self.profiler.run(self._submit, log, payloads, posted)
+            else:
+                submitted = self._submit(log, payloads, posted)
+
+            if submitted:
+                self.spool.remove(entry_id)
+                metrics.ack_seconds.observe(time.time() - created)
+            else:
+                metrics.retries.labels('queue').inc()
+                # Don't create already posted results again on retry, and
+                # keep group UUIDs looked up for pending results.
+                for payload in posted:
+                    payloads.remove(payload)
+                if payloads != stored:
+                    self.spool.update(entry_id, payloads)
+                self._wakeup.wait(self.retry_interval)
+                self._wakeup.clear()
+
+    def _submit(self, log, payloads, posted):
+        """
+        Returns False if posting should be retried later.
+
+        Created results are appended to the posted list.
+        """
+        try:
+            utils.post_results(log, payloads, posted)
+        except CreateResultError as e:
+            # Retrying would not help.
+            log.error('Failed to process message: %s', e)
+        except CircuitOpenError as e:
+            log.warning('Failed to post results, retrying later: %s', e)
+            return False
+        except Exception as e:
+            if not session.is_server_failure(e):
+                log.exception('Dropping %s results which cannot be posted', len(payloads))
+                return True
+
+            log.exception(
+                'Failed to post results, retrying in %s seconds', self.retry_interval)
+            return False
+
+        return True
+
+
+def create_spool_queue(profiler=None):
+    return SpoolQueue(
+        Spool(config.SPOOL_PATH, fsync=config.SPOOL_FSYNC),
+        retry_interval=config.SPOOL_RETRY_INTERVAL,
+        profiler=profiler)
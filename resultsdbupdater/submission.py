@@ -0,0 +1,323 @@
+import queue
+import threading
+import time
+
+from . import aioclient, config, exceptions, metrics, session, utils
+from .retry import RetryScheduler, full_jitter_backoff
+from .spool import Spool, create_spool_queue
+
+FULL_POLICIES = config.SUBMIT_QUEUE_FULL_POLICIES
+
+# Tells a worker thread to quit.
+_STOP = object()
+
+
+class Job(object):
+    """
+    Results of a message waiting to be posted.
+    """
+    __slots__ = ('log', 'payloads', 'deadline', 'attempts', 'queued', 'received')
+
+    def __init__(self, log, payloads, deadline=None, received=None):
+        self.log = log
+        self.payloads = payloads
+        self.deadline = deadline
+        self.attempts = 0
+        self.queued = time.time()
+        self.received = received or self.queued
+
+
+def _is_retryable(error):
+    return isinstance(error, exceptions.CircuitOpenError) or session.is_server_failure(error)
+
+
+class SubmissionQueue(object):
+    """
+    Bounded queue of results waiting to be posted to ResultsDB by a pool of
+    worker threads.
+
+    Results from a single message are queued together and posted in order by
+    a single worker.
+
+    If retry_deadline is set, results failing because ResultsDB is not
+    available are queued again after a random backoff time, so workers can
+    continue with other messages in the meantime. Results not posted until
+    the deadline are moved to the fallback spool (if any).
+    """
+
+    def __init__(self, workers, maxsize=0, full_policy='block',
+                 batch_size=1, batch_window=0, retry_deadline=0, fallback=None,
+                 profiler=None):
+        """
+        Args:
+            workers (int) - Number of worker threads
+            maxsize (int) - Maximum number of queued messages (0 is unlimited)
+            full_policy (string) - 'block' to wait for free space in full
+                queue, 'reject' to raise SubmissionQueueFull
+            batch_size (int) - Maximum number of results from multiple
+                messages a worker posts together
+            batch_window (float) - Seconds a worker waits for more messages
+                to post together (0 to post messages separately)
+            retry_deadline (float) - Seconds after queuing a message its
+                results can be retried (0 to disable retries)
+            fallback (Spool) - Spool for results not posted until deadline
+            profiler (Profiler) - Profiler sampling posted messages
+        """
+        if full_policy not in FULL_POLICIES:
+            raise RuntimeError(
+                'Unknown submission queue full policy "{0}", expected one of: {1}'
+                .format(full_policy, ', '.join(FULL_POLICIES)))
+
+        self.full_policy = full_policy
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.retry_deadline = retry_deadline
+        self.fallback = fallback
+        self.profiler = profiler
+        self.retries = RetryScheduler() if retry_deadline else None
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.workers = [
+            threading.Thread(
+                target=self._work, name='resultsdb-submit-{0}'.format(i))
+            for i in range(workers)
+        ]
+        for worker in self.workers:
+            worker.daemon = True
+            worker.start()
+
+    def put(self, log, payloads, received=None):
+        """
+        Queues results (see utils.result_payload()) for posting.
+
+        Time from received (time the message was received, by default now)
+        until the results are posted is observed in metrics.ack_seconds.
+
+        Raises SubmissionQueueFull if the queue is full and the policy is
+        'reject'.
+        """
+        deadline = time.time() + self.retry_deadline if self.retry_deadline else None
+        item = Job(log, payloads, deadline, received)
+        if self.full_policy == 'block':
+            self.queue.put(item)
+            return
+
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            raise exceptions.SubmissionQueueFull(self.queue.maxsize)
+
+    def depth(self):
+        return self.queue.qsize()
+
+    def oldest_age(self):
+        """
+        Returns seconds since the oldest queued message was first queued.
+        """
+        with self.queue.mutex:
+            queued = [job.queued for job in self.queue.queue if job is not _STOP]
+        return time.time() - min(queued) if queued else 0
+
+    def stop(self):
+        """
+        Waits until queued results are posted and stops worker threads.
+
+        Results waiting for retry are moved to the fallback spool.
+        """
+        for _ in self.workers:
+            self.queue.put(_STOP)
+
+        for worker in self.workers:
+            worker.join()
+
+        if self.retries is not None:
+            pending = [job for job, in self.retries.stop()]
+            while not self.queue.empty():
+                pending.append(self.queue.get_nowait())
+            for job in pending:
+                self._expire(job, 'service is stopping')
+
+    def _work(self):
+        item = self.queue.get()
+        while item is not _STOP:
+            items = [item]
+            item = self._gather(items)
+
+            if len(items) == 1:
+                self._run(self._submit, items[0])
+            else:
+                self._run(self._submit_batch, items)
+
+            if item is None:
+                item = self.queue.get()
+
+    def _run(self, fn, *args):
+        if self.profiler is not None:
+            self.profiler.run(fn, *args)
+        else:
+            fn(*args)
+
+    def _gather(self, items):
+        """
+        Adds more queued messages to items until the batch is full or the
+        batch window elapses.
+
+        Does not wait for more messages if results cannot be posted in bulk,
+        since that would only delay posting them.
+
+        Returns a message that did not fit into the batch, _STOP if the
+        worker should stop afterwards, or None.
+        """
+        if not self.batch_window or not utils.bulk_results_enabled():
+            return None
+
+        count = len(items[0].payloads)
+        deadline = time.time() + self.batch_window
+        while count < self.batch_size:
+            timeout = deadline - time.time()
+            if timeout <= 0:
+                break
+
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+
+            if item is _STOP or count + len(item.payloads) > self.batch_size:
+                return item
+
+            items.append(item)
+            count += len(item.payloads)
+
+        return None
+
+    def _submit(self, job):
+        log = job.log
+        posted = []
+        try:
+            utils.post_results(log, job.payloads, posted)
+        except Exception as e:
+            self._failed(job, posted, e)
+        else:
+            metrics.ack_seconds.observe(time.time() - job.received)
+
+    def _failed(self, job, posted, error):
+        """
+        Handles error from posting results of a job, retrying them if
+        possible.
+
+        Must be called from the exception handler.
+        """
+        if isinstance(error, exceptions.CreateResultError):
+            job.log.error('Failed to process message: %s', error)
+        elif self.retries is not None and _is_retryable(error):
+            self._retry(job, posted, error)
+        elif isinstance(error, exceptions.CircuitOpenError):
+            job.log.error('Failed to process message: %s', error)
+        else:
+            job.log.exception('Unexpected exception')
+
+    def _retry(self, job, posted, error):
+        """
+        Queues results not posted yet again after a backoff time.
+        """
+        for payload in posted:
+            job.payloads.remove(payload)
+
+        job.attempts += 1
+        metrics.retries.labels('queue').inc()
+        delay = full_jitter_backoff(job.attempts)
+        if isinstance(error, exceptions.CircuitOpenError):
+            delay = max(delay, error.retry_after)
+
+        if time.time() + delay > job.deadline:
+            self._expire(job, error)
+            return
+
+        job.log.warning(
+            'Failed to post results (%s), retry %s in %.1f seconds',
+            error, job.attempts, delay)
+        self.retries.call_later(delay, self._requeue, job)
+
+    def _requeue(self, job):
+        # Never block the retry scheduler on a full queue.
+        try:
+            self.queue.put_nowait(job)
+        except queue.Full:
+            self._expire(job, 'submission queue is full')
+
+    def _expire(self, job, reason):
+        if self.fallback is None:
+            job.log.error('Giving up posting %s results: %s', len(job.payloads), reason)
+            return
+
+        job.log.error(
+            'Moving %s results to fallback spool %s: %s',
+            len(job.payloads), self.fallback.path, reason)
+        self.fallback.append(job.log.prefix, job.payloads)
+
+    def _submit_batch(self, items):
+        """
+        Posts results from multiple messages in bulk.
+
+        If bulk posting is not available or some results are rejected,
+        results are posted separately for each message so any failure is
+        reported for the right message.
+        """
+        try:
+            for job in items:
+                utils.resolve_payloads(job.payloads)
+            payloads = [payload for job in items for payload in job.payloads]
+            posted_in_bulk = utils.post_results_bulk(config.LOGGER, payloads)
+        except Exception as e:
+            for job in items:
+                self._failed(job, [], e)
+            return
+
+        if not posted_in_bulk:
+            for job in items:
+                self._submit(job)
+            return
+
+        now = time.time()
+        for job in items:
+            metrics.ack_seconds.observe(now - job.received)
+
+
+def create_submission_queue(profiler=None):
+    """
+    Returns SubmissionQueue as configured or None if results should be posted
+    directly.
+
+    Posting results from worker threads is sampled by profiler, if set.
+    """
+    if config.SPOOL_PATH:
+        return create_spool_queue(profiler)
+
+    if not config.SUBMIT_WORKERS:
+        return None
+
+    if config.HTTP_CLIENT == 'asyncio':
+        if config.RETRY_DEADLINE or config.RETRY_FALLBACK_PATH:
+            config.LOGGER.warning(
+                'Options retry_deadline and retry_fallback_path are ignored with '
+                'the asyncio HTTP client, which retries failed requests itself')
+        return aioclient.AsyncSubmissionQueue(
+            aioclient.get_client(),
+            maxsize=config.SUBMIT_QUEUE_SIZE,
+            full_policy=config.SUBMIT_QUEUE_FULL_POLICY,
+            resolve_payloads=utils.resolve_payloads)
+
+    if config.BATCH_WINDOW and not config.BULK_RESULTS_PATH:
+        config.LOGGER.warning(
+            'Option batch_window is ignored without bulk_results_path, '
+            'results are posted one by one')
+
+    return SubmissionQueue(
+        workers=config.SUBMIT_WORKERS,
+        maxsize=config.SUBMIT_QUEUE_SIZE,
+        full_policy=config.SUBMIT_QUEUE_FULL_POLICY,
+        batch_size=config.BATCH_SIZE,
+        batch_window=config.BATCH_WINDOW,
+        retry_deadline=config.RETRY_DEADLINE,
+        fallback=Spool(config.RETRY_FALLBACK_PATH) if config.RETRY_FALLBACK_PATH else None,
+        profiler=profiler)
@@ -0,0 +1,98 @@
+"""
+Supersede mode: collapses bursts of queued/running/complete messages for the
+same test run.
+
+Results with a transient outcome (QUEUED, RUNNING) are held for a short
+window. If a later state for the same test run arrives within the window,
+the held result is dropped and only the later one is posted. Other outcomes
+(e.g. ERROR and outcomes of complete messages) are never held or dropped.
+"""
+import threading
+
+from . import config
+from .retry import RetryScheduler
+
+# Outcomes of results that can be superseded by a later state.
+TRANSIENT_OUTCOMES = ('QUEUED', 'RUNNING')
+
+
+class _Held(object):
+    __slots__ = ('log', 'payload')
+
+    def __init__(self, log, payload):
+        self.log = log
+        self.payload = payload
+
+
+class SupersedeBuffer(object):
+    """
+    Holds results with transient outcomes for window seconds before passing
+    them to the submit function, unless they are superseded by a later
+    result with the same key.
+
+    Counts dropped results for monitoring.
+    """
+
+    def __init__(self, window, submit):
+        """
+        Args:
+            window (float) - Seconds to hold results with transient outcome
+            submit (callable) - Called with (log, payloads) to post held
+                results after the window elapses
+        """
+        self.window = window
+        self.submit = submit
+        self.superseded = 0
+        self._held = {}
+        self._lock = threading.Lock()
+        self._scheduler = RetryScheduler()
+
+    def __len__(self):
+        return len(self._held)
+
+    def hold(self, key, log, payload, outcome):
+        """
+        Returns True if the result is held, otherwise the caller should post
+        it immediately.
+
+        Any result held for the same key is dropped.
+        """
+        with self._lock:
+            previous = self._held.pop(key, None)
+            if previous is not None:
+                self.superseded += 1
+                previous.log.debug('Result superseded by a later state (%s)', outcome)
+
+            if outcome not in TRANSIENT_OUTCOMES:
+                return False
+
+            held = self._held[key] = _Held(log, payload)
+
+        self._scheduler.call_later(self.window, self._release, key, held)
+        return True
+
+    def stop(self):
+        """
+        Posts all held results immediately.
+        """
+        for key, held in self._scheduler.stop():
+            self._release(key, held)
+
+    def _release(self, key, held):
+        with self._lock:
+            if self._held.get(key) is not held:
+                # Already superseded.
+                return
+            del self._held[key]
+
+        self.submit(held.log, [held.payload])
+
+
+def create_supersede_buffer(submit):
+    """
+    Returns SupersedeBuffer as configured or None if disabled.
+    """
+    if not config.SUPERSEDE_WINDOW:
+        return None
+
+    return SupersedeBuffer(config.SUPERSEDE_WINDOW, submit)
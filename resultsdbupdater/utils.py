@@ -1,25 +1,49 @@
-import json
+import concurrent.futures
+import contextlib
+import threading
 import uuid
 import re
 
-from .session import session
+from .session import circuit_breaker, session
 
-from . import config, exceptions
+from . import aioclient, artifacts, config, exceptions, metrics, serializer
+from .cache import SingleFlight, TTLCache
+from .message import debug_payload
 
 
-# Maximum length of a text value for result data.
+# Maximum size of a text value for result data in bytes.
 MAX_RESULT_DATA_SIZE = 8192
 
+# HTTP status codes meaning bulk results endpoint cannot be used.
+BULK_RESULTS_UNSUPPORTED_STATUS = (404, 405, 501)
+
+# Holds payloads collected by collect_results() in current thread.
+_collector = threading.local()
+
+# Set to False once ResultsDB responds that bulk results are not supported.
+_bulk_results_supported = True
+
+# Groups by description, to avoid looking up groups for each result of a
+# test run.
+group_cache = TTLCache(config.GROUP_CACHE_SIZE, config.GROUP_CACHE_TTL)
+
+# Shares group lookups in progress between threads.
+group_lookups = SingleFlight()
+
+# Thread pool for posting results concurrently, created on first use.
+_executor = None
+_executor_lock = threading.Lock()
+
 
 def json_serialize_data_item(item):
     if isinstance(item, list):
         return [
-            json.dumps(v) if isinstance(v, dict) else v
+            serializer.dumps_value(v) if isinstance(v, dict) else v
             for v in item
         ]
 
     if isinstance(item, dict):
-        return json.dumps(item)
+        return serializer.dumps_value(item)
 
     return item
 
@@ -37,6 +61,97 @@ def json_serialize_data(data):
     }
 
 
+def _too_large(text):
+    """
+    Returns True if UTF-8 encoded text is larger than MAX_RESULT_DATA_SIZE
+    bytes.
+
+    Text is encoded only if its length does not decide it (a character is
+    encoded in one to four bytes).
+    """
+    length = len(text)
+    if length > MAX_RESULT_DATA_SIZE:
+        return True
+
+    if length * 4 <= MAX_RESULT_DATA_SIZE:
+        return False
+
+    return len(text.encode('utf-8')) > MAX_RESULT_DATA_SIZE
+
+
+def _crop_text(log, key, text):
+    if len(text) * 4 <= MAX_RESULT_DATA_SIZE:
+        return text
+
+    encoded = text.encode('utf-8')
+    if len(encoded) <= MAX_RESULT_DATA_SIZE:
+        return text
+
+    log.warning('Cropping large value for field %s', key)
+    metrics.cropped_values.inc()
+    # Do not split multi-byte characters.
+    return encoded[:MAX_RESULT_DATA_SIZE - 3].decode('utf-8', 'ignore') + "..."
+
+
+def _check_items(key, items):
+    if any(_too_large(item if isinstance(item, str) else str(item)) for item in items):
+        raise exceptions.InvalidMessageError(
+            'Result value "{0}" contains items that are too large'.format(key))
+
+
+def _check_value(key, value):
+    if _too_large(str(value)):
+        raise exceptions.InvalidMessageError(
+            'Result value "{0}" is too large'.format(key))
+
+
+def crop_value(log, key, value):
+    """
+    Returns serialized result data value cropped to MAX_RESULT_DATA_SIZE
+    bytes if it is a large string (see crop_data()).
+
+    Raises InvalidMessageError if non-string value is too large.
+    """
+    if isinstance(value, str):
+        return _crop_text(log, key, value)
+
+    if isinstance(value, list):
+        _check_items(key, value)
+    else:
+        _check_value(key, value)
+
+    return value
+
+
+def serialize_value(log, key, value):
+    """
+    Returns result data value serialized (see json_serialize_data()) and
+    cropped (see crop_data()) in a single pass.
+
+    Sizes are checked on the serialized text. Serialized dicts are ASCII-only,
+    so their size is their length.
+
+    Raises InvalidMessageError if non-string value is too large.
+    """
+    if isinstance(value, str):
+        return _crop_text(log, key, value)
+
+    if isinstance(value, dict):
+        text = serializer.dumps_value(value)
+        if len(text) > MAX_RESULT_DATA_SIZE:
+            raise exceptions.InvalidMessageError(
+                'Result value "{0}" is too large'.format(key))
+        return text
+
+    if isinstance(value, list):
+        items = json_serialize_data_item(value)
+        _check_items(key, items)
+        return items
+
+    _check_value(key, value)
+    return value
+
+
 def crop_data(log, data):
     """
     Crops large data values so they can be stored in ResultsDB.
@@ -48,17 +163,7 @@ def crop_data(log, data):
     Raises InvalidMessageError if non-string value is too large.
     """
     for k, v in data.items():
-        if isinstance(v, str):
-            if len(v) > MAX_RESULT_DATA_SIZE:
-                log.warning('Cropping large value for field %s', k)
-                data[k] = v[:MAX_RESULT_DATA_SIZE - 3] + "..."
-        elif isinstance(v, list):
-            if any(len(str(item)) > MAX_RESULT_DATA_SIZE for item in v):
-                raise exceptions.InvalidMessageError(
-                    'Result value "{0}" contains items that are too large'.format(k))
-        elif len(str(v)) > MAX_RESULT_DATA_SIZE:
-            raise exceptions.InvalidMessageError(
-                'Result value "{0}" is too large'.format(k))
+        data[k] = crop_value(log, k, v)
 
 
 def update_publisher_id(data, msg):
@@ -71,47 +176,310 @@ def update_publisher_id(data, msg):
         data['publisher_id'] = msg_publisher_id
 
 
-def create_result(log, testcase, outcome, ref_url, data, groups=None, note=None):
-    data = json_serialize_data(data)
-    crop_data(log, data)
+def pending_result_payload(log, testcase, outcome, ref_url, data, groups=None, note=None):
+    """
+    Returns request body for a new ResultsDB result, not serialized yet.
 
-    payload = json.dumps({
+    Groups without "uuid" get the UUID of a group with the same description
+    right before the result is posted (see resolve_payloads()), so messages
+    can be transformed without waiting for ResultsDB.
+
+    Each data value is serialized and size-checked once (see
+    serialize_value()).
+    """
+    data = {k: serialize_value(log, k, v) for k, v in data.items()}
+
+    return {
         'testcase': testcase,
         'groups': groups or [],
         'outcome': outcome,
         'ref_url': ref_url,
         'note': note or '',
         'data': data
-    })
+    }
+
+
+def result_payload(log, testcase, outcome, ref_url, data, groups=None, note=None):
+    """
+    Returns serialized request body for a new ResultsDB result.
+    """
+    return serializer.dumps(
+        pending_result_payload(log, testcase, outcome, ref_url, data, groups, note))
+
+
+def resolve_payloads(payloads):
+    """
+    Serializes pending payloads (see pending_result_payload()) in place,
+    looking up UUIDs of their groups.
+
+    Returns the payloads.
+    """
+    for i, payload in enumerate(payloads):
+        if isinstance(payload, str):
+            continue
+
+        groups = [
+            group if 'uuid' in group else dict(group, uuid=group_uuid(group['description']))
+            for group in payload['groups']
+        ]
+        payloads[i] = serializer.dumps(dict(payload, groups=groups))
+
+    return payloads
+
+
+def post_result(log, payload):
+    """
+    Posts a serialized result (see result_payload()) to ResultsDB.
+
+    Raises CreateResultError if ResultsDB rejects the result.
+    """
+    debug_payload(log, 'Requesting new result: %s', payload)
+
+    with circuit_breaker.guard():
+        with metrics.request_seconds.labels('POST').time():
+            post_req = session.post(
+                '{0}/results'.format(config.RESULTSDB_API_URL),
+                data=payload,
+                headers={
+                    'content-type': 'application/json',
+                },
+                auth=config.RESULTSDB_AUTH,
+                timeout=config.TIMEOUT,
+                verify=config.TRUSTED_CA)
+        metrics.observe_response('POST', post_req.status_code)
+
+        log.debug('New result requested (HTTP %s)', post_req.status_code)
+
+        if post_req.status_code == 400:
+            message = post_req.json().get('message')
+            raise exceptions.CreateResultError(message, payload)
 
-    log.debug('Requesting new result: %s', payload)
+        post_req.raise_for_status()
 
-    post_req = session.post(
-        '{0}/results'.format(config.RESULTSDB_API_URL),
-        data=payload,
-        headers={
-            'content-type': 'application/json',
-        },
-        auth=config.RESULTSDB_AUTH,
-        timeout=config.TIMEOUT,
-        verify=config.TRUSTED_CA)
 
-    log.debug('New result requested (HTTP %s)', post_req.status_code)
+def bulk_results_enabled():
+    """
+    Returns True if results can be posted in bulk (see post_results_bulk()).
+    """
+    return bool(config.BULK_RESULTS_PATH) and _bulk_results_supported
+
+
+def post_results_bulk(log, payloads):
+    """
+    Posts multiple serialized results to ResultsDB with a single request.
+
+    Returns False if the results need to be posted one by one instead, i.e.
+    bulk endpoint is not configured or available, or some of the results
+    were rejected (posting them separately tells which one).
+    """
+    global _bulk_results_supported
+
+    if not bulk_results_enabled():
+        return False
+
+    log.debug('Requesting %s new results in bulk', len(payloads))
+
+    with circuit_breaker.guard():
+        with metrics.request_seconds.labels('POST').time():
+            post_req = session.post(
+                '{0}{1}'.format(config.RESULTSDB_API_URL, config.BULK_RESULTS_PATH),
+                data='[{0}]'.format(','.join(payloads)),
+                headers={
+                    'content-type': 'application/json',
+                },
+                auth=config.RESULTSDB_AUTH,
+                timeout=config.TIMEOUT,
+                verify=config.TRUSTED_CA)
+        metrics.observe_response('POST', post_req.status_code)
+        if post_req.status_code >= 500:
+            post_req.raise_for_status()
+
+    log.debug('New results requested in bulk (HTTP %s)', post_req.status_code)
+
+    if post_req.status_code in BULK_RESULTS_UNSUPPORTED_STATUS:
+        log.warning(
+            'Bulk results endpoint is not available (HTTP %s), '
+            'posting results one by one from now on', post_req.status_code)
+        _bulk_results_supported = False
+        return False
 
     if post_req.status_code == 400:
-        message = post_req.json().get('message')
-        raise exceptions.CreateResultError(message, payload)
+        log.warning(
+            'Bulk results rejected, posting results one by one: %s',
+            post_req.json().get('message'))
+        return False
 
     post_req.raise_for_status()
+    return True
+
+
+def _post_concurrently(log, payloads, posted):
+    """
+    Posts serialized results using up to config.POST_CONCURRENCY parallel
+    requests.
+
+    Raises the first error after all requests finish; other failures are
+    logged.
+    """
+    if config.POST_CONCURRENCY <= 1 or len(payloads) <= 1:
+        for payload in payloads:
+            post_result(log, payload)
+            posted.append(payload)
+        return
+
+    futures = [
+        _get_executor().submit(post_result, log, payload)
+        for payload in payloads
+    ]
+    errors = []
+    for i, (payload, future) in enumerate(zip(payloads, futures), 1):
+        error = future.exception()
+        if error is None:
+            posted.append(payload)
+        else:
+            errors.append(error)
+            log.error('Failed to post result %s of %s: %s', i, len(futures), error)
+
+    if errors:
+        raise errors[0]
+
+
+def _get_executor():
+    global _executor
+
+    with _executor_lock:
+        if _executor is None:
+            _executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=config.POST_CONCURRENCY)
+        return _executor
+
+
+def post_results(log, payloads, posted=None):
+    """
+    Posts serialized results of a message to ResultsDB, using as few
+    requests as possible.
+
+    The last result (e.g. overall result for the other results) is posted
+    only after all others are created.
+
+    Created results are appended to the posted list, if given, so only the
+    remaining results can be posted again on failure.
+
+    Pending payloads are serialized in place first (see resolve_payloads()).
+
+    Raises CreateResultError if ResultsDB rejects a result.
+    """
+    if posted is None:
+        posted = []
+
+    resolve_payloads(payloads)
+
+    if config.HTTP_CLIENT == 'asyncio':
+        client = aioclient.get_client()
+        client.run(client.create_results(log, payloads, posted))
+        return
+
+    start = 0
+    while len(payloads) - start > 1:
+        batch = payloads[start:start + config.BATCH_SIZE]
+        if not post_results_bulk(log, batch):
+            break
+        posted.extend(batch)
+        start += len(batch)
+
+    pending = payloads[start:]
+    if pending:
+        _post_concurrently(log, pending[:-1], posted)
+        post_result(log, pending[-1])
+        posted.append(pending[-1])
+
+
+def write_results(log, payloads):
+    """
+    Posts serialized results to ResultsDB or adds them to payloads collected
+    with collect_results().
+    """
+    collected = getattr(_collector, 'payloads', None)
+    if collected is not None:
+        collected.extend(payloads)
+        return
+
+    post_results(log, payloads)
+
+
+@contextlib.contextmanager
+def collect_results():
+    """
+    Collects payloads from create_result() and write_results() in current
+    thread instead of posting them.
+
+    Yields list of collected payloads.
+    """
+    previous = getattr(_collector, 'payloads', None)
+    payloads = []
+    _collector.payloads = payloads
+    try:
+        yield payloads
+    finally:
+        _collector.payloads = previous
+
+
+def create_result(log, testcase, outcome, ref_url, data, groups=None, note=None):
+    payload = result_payload(log, testcase, outcome, ref_url, data, groups, note)
+    write_results(log, [payload])
 
 
 def get_first_group(description):
-    get_req = session.get(
-        '{0}/groups?description={1}'.format(config.RESULTSDB_API_URL, description),
-        timeout=config.TIMEOUT,
-        verify=config.TRUSTED_CA,
-    )
-    get_req.raise_for_status()
+    """
+    Returns first group with given description or an empty dict.
+
+    Found groups are cached in group_cache.
+    """
+    group = group_cache.get(description)
+    if group is not None:
+        return group
+
+    if config.HTTP_CLIENT == 'asyncio':
+        client = aioclient.get_client()
+        group = client.run(client.get_first_group(description))
+    else:
+        group = _get_first_group(description)
+
+    if group:
+        group_cache.set(description, group)
+
+    return group
+
+
+def group_uuid(description):
+    """
+    Returns UUID of the first group with given description, or a new UUID if
+    there is no such group yet.
+
+    Concurrent calls for the same description share a single lookup and
+    return the same UUID. New UUIDs are cached, so results posted later for
+    the same description are added to the same group.
+    """
+    def lookup():
+        group = get_first_group(description)
+        if not group:
+            group = {'uuid': str(uuid.uuid4()), 'description': description}
+            group_cache.set(description, group)
+        return group['uuid']
+
+    return group_lookups.do(description, lookup)
+
+
+def _get_first_group(description):
+    with circuit_breaker.guard():
+        with metrics.request_seconds.labels('GET').time():
+            get_req = session.get(
+                '{0}/groups?description={1}'.format(config.RESULTSDB_API_URL, description),
+                timeout=config.TIMEOUT,
+                verify=config.TRUSTED_CA,
+            )
+        metrics.observe_response('GET', get_req.status_code)
+        get_req.raise_for_status()
     if len(get_req.json()['data']) > 0:
         return get_req.json()['data'][0]
 
@@ -156,6 +524,7 @@ def handle_ci_metrics(msg):
         'ref_url': group_ref_url
     }]
     overall_outcome = 'PASSED'
+    payloads = []
 
     for test in tests:
         if 'failed' in test and int(test['failed']) == 0:
@@ -178,7 +547,8 @@ def handle_ci_metrics(msg):
         test['brew_task_id'] = brew_task_id
 
         update_publisher_id(data=test, msg=msg)
-        create_result(msg.log, testcase, outcome, group_tests_ref_url, test, groups)
+        payloads.append(result_payload(
+            msg.log, testcase, outcome, group_tests_ref_url, test, groups))
 
     # Create the overall test result
     testcase = {
@@ -196,7 +566,10 @@ def handle_ci_metrics(msg):
     }
 
     update_publisher_id(data=result_data, msg=msg)
-    create_result(msg.log, testcase, overall_outcome, group_tests_ref_url, result_data, groups)
+    payloads.append(result_payload(
+        msg.log, testcase, overall_outcome, group_tests_ref_url, result_data, groups))
+
+    write_results(msg.log, payloads)
 
 
 def _test_result_outcome(topic, outcome):
@@ -306,12 +679,15 @@ def verify_topic_and_testcase_name(topic, testcase_name):
             topic_namespace=topic_namespace)
 
 
-def handle_ci_umb(msg):
+def handle_ci_umb(msg, supersede=None):
     #
     # Handle messages in Fedora CI messages format
     #
     # https://pagure.io/fedora-ci/messages
     #
+    # If supersede (SupersedeBuffer) is set, queued and running results are
+    # held so later states of the same test run can replace them.
+    #
 
     # check if required version is provided in the message
     if msg.get('version', default=None) is None:
@@ -334,234 +710,9 @@ def handle_ci_umb(msg):
         'url': test_run_url
     }]
 
-    if item_type == 'productmd-compose':
-        architecture = msg.system('architecture')
-        variant = msg.system('variant', default=None)
-        # Field compose_id in artifacts is deprecated.
-        compose_id = msg.get('artifact', 'id', default=None) or msg.get('artifact', 'compose_id')
-        item = '{0}/{1}/{2}'.format(compose_id, variant or 'unknown', architecture)
-        result_data = {
-            key: value for key, value in (
-                ('item', item),
-
-                ('log', msg.get('run', 'log')),
-
-                ('type', item_type),
-                ('productmd.compose.id', compose_id),
-
-                ('system_provider', msg.system('provider')),
-                ('system_architecture', architecture),
-                ('system_variant', variant),
-
-                ('category', msg.result.category),
-            ) if value is not None
-        }
-
-    elif item_type == 'product-build':
-        product = msg.get('artifact', 'name')
-        version = msg.get('artifact', 'version')
-        release = msg.get('artifact', 'release')
-        item = '{0}-{1}-{2}'.format(product, version, release)
-        result_data = {
-            key: value for key, value in (
-                ('item', item),
-                ('product', product),
-                ('version', version),
-                ('release', release),
-                ('log', msg.get('run', 'log')),
-                ('type', item_type),
-                ('system_architecture', msg.system('architecture')),
-                ('category', msg.result.category),
-            ) if value is not None
-        }
-
-    elif item_type == 'component-version':
-        component = msg.get('artifact', 'component')
-        version = msg.get('artifact', 'version')
-        item = '{0}-{1}'.format(component, version)
-        result_data = {
-            key: value for key, value in (
-                ('item', item),
-
-                ('log', msg.get('run', 'log')),
-
-                ('type', item_type),
-                ('component', component),
-                ('version', version),
-
-                ('category', msg.result.category),
-            ) if value is not None
-        }
-
-    elif item_type == 'container-image':
-        repo = msg.get('artifact', 'repository')
-        digest = msg.get('artifact', 'digest')
-        item = '{0}@{1}'.format(repo, digest)
-        result_data = {
-            key: value for key, value in (
-                ('item', item),
-
-                ('log', msg.get('run', 'log')),
-                ('rebuild', msg.get('run', 'rebuild', default=None)),
-                ('xunit', msg.result.xunit),
-
-                ('type', item_type),
-                ('repository', msg.get('artifact', 'repository', default=None)),
-                ('digest', msg.get('artifact', 'digest', default=None)),
-                ('format', msg.get('artifact', 'format', default=None)),
-                ('pull_ref', msg.get('artifact', 'pull_ref', default=None)),
-                ('scratch', msg.get('artifact', 'scratch', default=None)),
-                ('nvr', msg.get('artifact', 'nvr', default=None)),
-                ('issuer', msg.get('artifact', 'issuer', default=None)),
-
-                ('system_os', msg.system('os', default=None)),
-                ('system_provider', msg.system('provider', default=None)),
-                ('system_architecture', msg.system('architecture', default=None)),
-
-                ('category', msg.result.category),
-            ) if value is not None
-        }
-
-    elif item_type == 'redhat-container-image':
-        result_data = {
-            'item': msg.get('artifact', 'id'),
-            'type': item_type,
-            'brew_task_id': msg.get('artifact', 'task_id', default=None),
-            'brew_build_id': msg.get('artifact', 'build_id', default=None),
-            'category': msg.result.category,
-            'full_names': msg.get('artifact', 'full_names'),
-            'registry_url': msg.get('artifact', 'registry_url', default=None),
-            'tag': msg.get('artifact', 'tag', default=None),
-            'issuer': msg.get('artifact', 'issuer'),
-            'component': msg.get('artifact', 'component'),
-            'name': msg.get('artifact', 'name', default=None),
-            'namespace': msg.get('artifact', 'namespace'),
-            'scratch': msg.get('artifact', 'scratch'),
-            'nvr': msg.get('artifact', 'nvr'),
-            'source': msg.get('artifact', 'source'),
-            'rebuild': msg.get('run', 'rebuild', default=None),
-            'log': msg.get('run', 'log'),
-        }
-
-    elif item_type == 'redhat-module':
-        # The pagure.io/messages spec defines the NSVC delimited with ':' and the stream name can
-        # contain '-', which MBS changes to '_' when importing to koji.
-        # See https://github.com/release-engineering/resultsdb-updater/pull/73
-        nsvc_regex = re.compile('^(.*):(.*):(.*):(.*)')
-        nsvc = msg.get('artifact', 'nsvc')
-        try:
-            name, stream, version, context = re.match(nsvc_regex, nsvc).groups()
-            stream = stream.replace('-', '_')
-        except AttributeError:
-            raise exceptions.InvalidMessageError('Invalid nsvc "%s" encountered' % nsvc)
-
-        nsvc = '{}-{}-{}.{}'.format(name, stream, version, context)
-
-        result_data = {
-            'item': nsvc,
-            'type': item_type,
-            'mbs_id': msg.get('artifact', 'id', default=None),
-            'category': msg.result.category,
-            'context': msg.get('artifact', 'context'),
-            'name': msg.get('artifact', 'name'),
-            'nsvc': nsvc,
-            'stream': msg.get('artifact', 'stream'),
-            'version': msg.get('artifact', 'version'),
-            'issuer': msg.get('artifact', 'issuer', default=None),
-            'rebuild': msg.get('run', 'rebuild', default=None),
-            'log': msg.get('run', 'log'),
-            'system_os': msg.system('os', default=None),
-            'system_provider': msg.system('provider', default=None),
-        }
-
-    elif item_type == 'redhat-advisory':
-        item = msg.get('artifact', 'id')
-        result_data = {
-            'item': item,
-            'type': item_type,
-            'category': msg.result.category,
-            'numeric_id': msg.get('artifact', 'numeric_id', default=None),
-
-            'pipeline_id': msg.get('pipeline', 'id'),
-            'pipeline_name': msg.get('pipeline', 'name'),
-            'pipeline_build': msg.get('pipeline', 'build', default=None),
-            'pipeline_stage': msg.get('pipeline', 'stage', 'name', default=None),
-
-            'log': msg.get('run', 'log'),
-            'log_raw': msg.get('run', 'log_raw', default=None),
-            'log_stream': msg.get('run', 'log_stream', default=None),
-
-            'system_os': msg.system('os', default=None),
-            'system_provider': msg.system('provider', default=None),
-        }
-
-    elif item_type == 'brew-build':
-        item = msg.get('artifact', 'nvr')
-        component = msg.get('artifact', 'component')
-        scratch = msg.get('artifact', 'scratch', default='')
-        brew_task_id = msg.get('artifact', 'id', default=None)
-
-        # scratch is supposed to be a bool but some messages in the wild
-        # use a string instead
-        if not isinstance(scratch, bool):
-            try:
-                scratch = scratch.lower() == 'true'
-            except AttributeError:
-                scratch = False
-
-        # we need to differentiate between scratch and non-scratch builds
-        if scratch:
-            item_type += '_scratch'
-
-        result_data = {
-            'item': item,
-            'type': item_type,
-            'brew_task_id': brew_task_id,
-            'category': msg.result.category,
-            'component': component,
-            'scratch': scratch,
-            'issuer': msg.get('artifact', 'issuer', default=None),
-            'rebuild': msg.get('run', 'rebuild', default=None),
-            'log': msg.get('run', 'log'),
-            'system_os': msg.system('os', default=None),
-            'system_provider': msg.system('provider', default=None),
-        }
-
-    elif item_type == 'brew-build-group':
-        item = msg.get('artifact', 'id')
-        repository = msg.get('artifact', 'repository')
-        builds = msg.get('artifact', 'builds')
-
-        result_data = {
-            'item': item,
-            'type': item_type,
-            'category': msg.result.category,
-            'repository': repository,
-            'builds': builds,
-            'rebuild': msg.get('run', 'rebuild', default=None),
-            'log': msg.get('run', 'log'),
-            'system_os': msg.system('os', default=None),
-            'system_provider': msg.system('provider', default=None),
-        }
+    result_data = artifacts.extract_result_data(msg, item_type)
 
-    elif item_type == 'product-scenario':
-        product_scenario = msg.get('artifact', 'id')
-        products = msg.get('artifact', 'products')
-        products_data = [json.dumps(product) for product in products]
-        item = [product.get('nvr', product['id']) for product in products]
-        item.insert(0, product_scenario)
-        result_data = {
-            'item': item,
-            'type': item_type,
-            'rebuild': msg.get('run', 'rebuild', default=None),
-            'log': msg.get('run', 'log'),
-            'system_os': msg.system('os', default=None),
-            'system_provider': msg.system('provider', default=None),
-            'products': products_data,
-        }
-
-    else:
-        raise exceptions.InvalidMessageError('Unknown artifact type "%s"' % item_type)
+    metrics.artifact_messages.labels(item_type).inc()
 
     result_data.update(msg.contact_dict)
     result_data['recipients'] = msg.recipients
@@ -590,7 +741,16 @@ def handle_ci_umb(msg):
         if issue_url:
             result_data['issue_url'] = issue_url
 
-    create_result(msg.log, testcase, outcome, test_run_url, result_data, groups, msg.result.note)
+    if supersede is None:
+        create_result(
+            msg.log, testcase, outcome, test_run_url, result_data, groups, msg.result.note)
+        return
+
+    payload = result_payload(
+        msg.log, testcase, outcome, test_run_url, result_data, groups, msg.result.note)
+    key = (testcase['name'], str(result_data.get('item')), test_run_url)
+    if not supersede.hold(key, msg.log, payload, outcome):
+        write_results(msg.log, [payload])
 
 
 def handle_resultsdb_format(msg):
@@ -618,10 +778,11 @@ def handle_resultsdb_format(msg):
             'ref_url': group_ref_url
         }]
 
+        payloads = []
         for testcase, result in results.items():
             result_data = result.get('data', {})
             update_publisher_id(data=result_data, msg=msg)
-            create_result(
+            payloads.append(result_payload(
                 msg.log,
                 testcase,
                 result['outcome'],
@@ -629,14 +790,14 @@ def handle_resultsdb_format(msg):
                 result_data,
                 groups,
                 result.get('note', ''),
-            )
+            ))
+
+        write_results(msg.log, payloads)
 
     else:
         groups = [{
-            # Check to see if there is a group already for these sets of tests,
-            # otherwise, generate a UUID
-            'uuid': get_first_group(group_ref_url).get(
-                'uuid', str(uuid.uuid4())),
+            # The UUID of a group already existing for these sets of tests,
+            # or a new one, is looked up when the result is posted
             'ref_url': group_ref_url,
             # Set the description to the ref_url so that we can query for the
             # group by it later
@@ -646,7 +807,7 @@ def handle_resultsdb_format(msg):
         result_data = msg.get('data')
         update_publisher_id(data=result_data, msg=msg)
 
-        create_result(
+        payload = pending_result_payload(
             msg.log,
             msg.get('testcase'),
             msg.get('outcome'),
@@ -655,3 +816,4 @@ def handle_resultsdb_format(msg):
             groups,
             msg.get('note', default='')
         )
+        write_results(msg.log, [payload])
@@ -13,6 +13,9 @@ setup(
     author_email='mprahl@redhat.com',
     url='https://github.com/release-engineering/resultsdb-updater',
     install_requires=requirements,
+    extras_require={
+        'asyncio': ['aiohttp'],
+    },
     packages=find_packages(),
     entry_points="""
     [moksha.consumer]
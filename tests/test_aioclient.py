@@ -0,0 +1,164 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import mock
+import pytest
+
+from resultsdbupdater import aioclient, exceptions, session
+
+aiohttp = pytest.importorskip('aiohttp')
+
+
+class FakeResultsDB(BaseHTTPRequestHandler):
+    # List of (status, body) for next responses
+    responses = []
+    requests = []
+
+    def _reply(self):
+        length = int(self.headers.get('content-length', 0))
+        body = self.rfile.read(length) if length else None
+        self.requests.append((self.command, self.path, body))
+
+        status, reply = self.responses.pop(0) if self.responses else (201, {})
+        data = json.dumps(reply).encode('utf-8')
+        self.send_response(status)
+        self.send_header('content-type', 'application/json')
+        self.send_header('content-length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    do_GET = _reply
+    do_POST = _reply
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def resultsdb():
+    FakeResultsDB.responses = []
+    FakeResultsDB.requests = []
+    server = HTTPServer(('127.0.0.1', 0), FakeResultsDB)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield server
+    server.shutdown()
+
+
+@pytest.fixture
+def client(resultsdb):
+    # Skip waiting between retries
+    with mock.patch.object(session, 'backoff_time', return_value=0):
+        client = aioclient.AsyncResultsDBClient(
+            'http://127.0.0.1:{0}/api/v2.0'.format(resultsdb.server_port))
+        yield client
+        client.close()
+
+
+def test_create_result(client):
+    log = mock.Mock()
+    client.run(client.create_result(log, '{"testcase": "a"}'))
+    assert FakeResultsDB.requests == [
+        ('POST', '/api/v2.0/results', b'{"testcase": "a"}'),
+    ]
+
+
+def test_create_result_failure(client):
+    FakeResultsDB.responses = [(400, {'message': 'Bad'})]
+    log = mock.Mock()
+    message = 'Failed to create result: Bad; Payload: {"testcase": "a"}'
+    with pytest.raises(exceptions.CreateResultError, match=message):
+        client.run(client.create_result(log, '{"testcase": "a"}'))
+
+
+def test_create_result_retry(client):
+    FakeResultsDB.responses = [(500, {}), (502, {}), (201, {})]
+    log = mock.Mock()
+    client.run(client.create_result(log, '{"testcase": "a"}'))
+    assert len(FakeResultsDB.requests) == 3
+
+
+def test_create_results_overall_last(client):
+    log = mock.Mock()
+    payloads = ['{{"testcase": "{0}"}}'.format(i) for i in range(5)]
+    client.run(client.create_results(log, payloads))
+    assert len(FakeResultsDB.requests) == 5
+    assert FakeResultsDB.requests[-1][2] == b'{"testcase": "4"}'
+
+
+def test_get_first_group(client):
+    group = {'uuid': '529da400-fc74-4b28-af81-52f56816a2cb'}
+    FakeResultsDB.responses = [(200, {'data': [group]}), (200, {'data': []})]
+    assert client.run(client.get_first_group('https://example.com/run/1')) == group
+    assert client.run(client.get_first_group('https://example.com/run/2')) == {}
+    assert FakeResultsDB.requests[0][:2] == (
+        'GET', '/api/v2.0/groups?description=https://example.com/run/1')
+
+
+def test_get_first_group_bad_request(client):
+    FakeResultsDB.responses = [(400, {'message': 'Bad'})]
+    with pytest.raises(aiohttp.ClientResponseError):
+        client.run(client.get_first_group('https://example.com/run/1'))
+
+
+def test_async_submission_queue_bad_policy(client):
+    with pytest.raises(RuntimeError, match='Unknown submission queue full policy'):
+        aioclient.AsyncSubmissionQueue(client, full_policy='drop')
+
+
+def test_async_submission_queue(client):
+    FakeResultsDB.responses = [(201, {}), (400, {'message': 'Bad'})]
+    log = mock.Mock()
+    submission_queue = aioclient.AsyncSubmissionQueue(client, maxsize=10)
+    submission_queue.put(log, ['{"testcase": "a"}'])
+    submission_queue.put(log, ['{"testcase": "b"}'])
+    submission_queue.stop()
+    assert submission_queue.depth() == 0
+    assert len(FakeResultsDB.requests) == 2
+    log.error.assert_called_once_with('Failed to process message: %s', mock.ANY)
+
+
+def test_async_submission_queue_resolves_payloads(client):
+    def resolve_payloads(payloads):
+        payloads[0] = '{"testcase": "%s"}' % payloads[0]['testcase']
+
+    submission_queue = aioclient.AsyncSubmissionQueue(
+        client, resolve_payloads=resolve_payloads)
+    submission_queue.put(mock.Mock(), [{'testcase': 'a'}])
+    submission_queue.stop()
+    assert FakeResultsDB.requests == [
+        ('POST', '/api/v2.0/results', b'{"testcase": "a"}'),
+    ]
+
+
+def test_async_submission_queue_stop_timeout(client):
+    release = threading.Event()
+    submission_queue = aioclient.AsyncSubmissionQueue(
+        client, resolve_payloads=lambda payloads: release.wait())
+    submission_queue.put(mock.Mock(), [{'testcase': 'a'}])
+    with mock.patch('resultsdbupdater.config.LOGGER') as mock_log:
+        submission_queue.stop(timeout=0.1)
+    release.set()
+    mock_log.error.assert_called_once_with(
+        'Dropping results of %s messages not posted in %s seconds', 1, 0.1)
+
+
+def test_client_default_ca():
+    client = aioclient.AsyncResultsDBClient('https://example.com', trusted_ca=True)
+    try:
+        assert client.ssl is None
+    finally:
+        client.close()
+
+
+def test_close_client(resultsdb):
+    urls = ['http://127.0.0.1:{0}/api/v{1}'.format(resultsdb.server_port, v) for v in (1, 2)]
+    for url in urls:
+        with mock.patch('resultsdbupdater.config.RESULTSDB_API_URL', url):
+            client = aioclient.get_client()
+            assert client.api_url == url
+            aioclient.close_client()
+    assert aioclient._client is None
+    assert client.http.closed
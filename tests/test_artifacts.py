@@ -0,0 +1,113 @@
+import mock
+import pytest
+
+from resultsdbupdater import artifacts, exceptions, utils
+from resultsdbupdater.message import create_message
+
+
+def ci_message(artifact, **body):
+    body.update({
+        'version': '0.2.1',
+        'artifact': artifact,
+        'run': {'url': 'https://ci/1', 'log': 'https://ci/1/log'},
+        'contact': {'name': 'CI', 'team': 'team', 'email': 'ci@example.com'},
+        'test': {
+            'namespace': 'test-ci', 'type': 'tier1', 'category': 'functional',
+            'result': 'passed'},
+        'system': [{'os': 'rhel', 'architecture': 'x86_64'}],
+    })
+    return create_message({
+        'topic': '/topic/VirtualTopic.eng.ci.test-ci.koji-build.test.complete',
+        'headers': {'message-id': 'ID:1'},
+        'body': {'msg': body},
+    })
+
+
+KOJI_BUILD_MAPPING = {
+    'omit_none': True,
+    'fields': [
+        {'key': 'name', 'path': 'artifact.name'},
+        {'key': 'version', 'path': ['artifact.version', 'artifact.ver']},
+        {'key': 'item', 'format': '{0}-{1}', 'args': ['data.name', 'data.version']},
+        {'key': 'type', 'value': 'koji-build'},
+        {'key': 'scratch', 'path': 'artifact.scratch', 'required': False, 'default': 'no',
+         'transform': 'scratch'},
+        {'key': 'issuer', 'path': 'artifact.issuer', 'required': False},
+        {'key': 'system_os', 'path': 'system.os'},
+        {'key': 'category', 'path': 'result.category'},
+    ],
+}
+
+
+def test_compile_mapping():
+    extract = artifacts.compile_mapping('koji-build', KOJI_BUILD_MAPPING)
+    msg = ci_message({'type': 'koji-build', 'name': 'bash', 'ver': '5.0'})
+
+    assert extract(msg) == {
+        'name': 'bash',
+        'version': '5.0',
+        'item': 'bash-5.0',
+        'type': 'koji-build',
+        'scratch': False,
+        'system_os': 'rhel',
+        'category': 'functional',
+    }
+
+
+def test_compile_mapping_required_field():
+    extract = artifacts.compile_mapping('koji-build', KOJI_BUILD_MAPPING)
+    msg = ci_message({'type': 'koji-build', 'name': 'bash'})
+
+    with pytest.raises(exceptions.MissingMessageField, match='artifact.ver'):
+        extract(msg)
+
+
+def test_compile_mapping_keeps_none():
+    extract = artifacts.compile_mapping('koji-build', KOJI_BUILD_MAPPING['fields'])
+    msg = ci_message({'type': 'koji-build', 'name': 'bash', 'version': '5.0'})
+    assert extract(msg)['issuer'] is None
+
+
+def test_compile_mapping_unknown_transform():
+    with pytest.raises(RuntimeError, match='Unknown transform "upper"'):
+        artifacts.compile_mapping('koji-build', [
+            {'key': 'item', 'path': 'artifact.nvr', 'transform': 'upper'},
+        ])
+
+
+def test_configured_mapping():
+    msg = ci_message({'type': 'koji-build', 'name': 'bash', 'version': '5.0'})
+    with mock.patch('resultsdbupdater.config.ARTIFACT_MAPPINGS',
+                    {'koji-build': KOJI_BUILD_MAPPING}):
+        extractors = artifacts.compile_mappings(artifacts._configured_mappings())
+
+    with mock.patch.object(artifacts, 'extractors', extractors):
+        with mock.patch('resultsdbupdater.utils.create_result') as create_result:
+            utils.handle_ci_umb(msg)
+
+    result_data = create_result.call_args[0][4]
+    assert result_data['item'] == 'bash-5.0'
+    assert result_data['type'] == 'koji-build'
+    assert result_data['ci_name'] == 'CI'
+    assert 'brew-build' in extractors
+
+
+@pytest.mark.parametrize('item_type', ('mysterious-artifact', None, ['list']))
+def test_unknown_artifact_type(item_type):
+    msg = ci_message({'type': item_type})
+    with pytest.raises(exceptions.InvalidMessageError, match='Unknown artifact type'):
+        artifacts.extract_result_data(msg, item_type)
+
+
+@pytest.mark.parametrize(('scratch', 'expected_type'), (
+    (True, 'brew-build_scratch'),
+    ('True', 'brew-build_scratch'),
+    ('false', 'brew-build'),
+    (None, 'brew-build'),
+))
+def test_brew_build_scratch(scratch, expected_type):
+    msg = ci_message({
+        'type': 'brew-build', 'nvr': 'bash-5.0-1', 'component': 'bash', 'scratch': scratch})
+    result_data = artifacts.extract_result_data(msg, 'brew-build')
+    assert result_data['type'] == expected_type
+    assert result_data['scratch'] is (expected_type == 'brew-build_scratch')
@@ -0,0 +1,142 @@
+import argparse
+import json
+import logging
+import tracemalloc
+
+import mock
+import pytest
+import requests
+
+from benchmarks import corpus, loadgen, soak, throughput
+from benchmarks.stub_resultsdb import StubResultsDB
+from resultsdbupdater import utils
+from resultsdbupdater.message import create_message
+
+
+def test_stub_resultsdb():
+    with StubResultsDB(bad_request_rate=1) as stub:
+        response = requests.post(stub.url + '/results', data='{}')
+        assert response.status_code == 400
+        assert stub.rejected == 1
+
+        stub.bad_request_rate = 0
+        group = {'uuid': 'abc', 'description': 'https://ci/1'}
+        response = requests.post(stub.url + '/results', data=json.dumps({'groups': [group]}))
+        assert response.status_code == 201
+        response = requests.get(stub.url + '/groups?description=https://ci/1')
+        assert response.json()['data'] == [group]
+
+    assert stub.requests == {'GET': 1, 'POST': 2}
+    assert stub.results == 1
+
+
+def test_replay_unique_message_ids():
+    messages = list(corpus.replay(100, noise_rate=0.5))
+    assert len({msg['headers']['message-id'] for msg in messages}) == 100
+    assert any(msg['topic'] == corpus.NOISE_TOPIC for msg in messages)
+
+
+def test_throughput_benchmark(tmpdir):
+    output = str(tmpdir.join('benchmark.json'))
+    report = throughput.main(['--messages', '50', '--output', output])
+
+    results = report['results']
+    assert results['messages'] == 50
+    assert results['results_created'] > 0
+    assert results['requests_per_message'] > 0
+    with open(output) as output_file:
+        assert json.load(output_file) == report
+
+    assert throughput.compare(report, report)[0].endswith('(+0.0%)')
+
+
+@pytest.mark.parametrize('version', loadgen.CI_UMB_VERSIONS)
+@pytest.mark.parametrize('item_type', loadgen.ITEM_TYPES)
+def test_loadgen_ci_umb_message(item_type, version):
+    generator = loadgen.MessageGenerator(payload_size=10, xunit_size=10)
+    msg = create_message(generator.ci_umb_message(item_type, version))
+
+    with mock.patch('resultsdbupdater.utils.create_result') as create_result:
+        utils.handle_ci_umb(msg)
+
+    assert create_result.call_count == 1
+    testcase, outcome, ref_url, result_data = create_result.call_args[0][1:5]
+    assert testcase['name'] == 'baseos-ci.tier1.' + msg.result.category
+    assert outcome in ('PASSED', 'FAILED', 'INFO', 'NEEDS_INSPECTION')
+    assert result_data['type'].startswith(item_type)
+    assert result_data['item']
+
+
+def test_loadgen_cardinality():
+    generator = loadgen.MessageGenerator(
+        mix={'ci_umb': 1}, items=3, run_urls=5, xunit_size=100, seed=1)
+    messages = list(generator.generate(200))
+
+    assert len({msg['headers']['message-id'] for msg in messages}) == 200
+    assert len({msg['body']['msg']['run']['url'] for msg in messages}) == 5
+    assert {
+        loadgen.ITEM_TYPES.index(msg['body']['msg']['artifact']['type'])
+        for msg in messages
+    } == set(range(len(loadgen.ITEM_TYPES)))
+    for msg in messages:
+        body = msg['body']['msg']
+        xunit = body['xunit'] if body['version'] == '0.1.0' else body['test']['xunit']
+        assert len(xunit) == 100 + len('<testsuite></testsuite>')
+
+
+def test_loadgen_parse_mix():
+    assert loadgen.parse_mix('ci_umb=3,resultsdb') == {'ci_umb': 3, 'resultsdb': 1}
+    with pytest.raises(argparse.ArgumentTypeError):
+        loadgen.parse_mix('unknown=1')
+
+
+def test_loadgen_jsonl_replay(tmpdir, caplog):
+    path = str(tmpdir.join('messages.jsonl'))
+    loadgen.main(['--count', '100', '--payload-size', '100', '--output', path])
+
+    messages = list(corpus.load_jsonl(path))
+    assert len(messages) == 100
+    assert {msg['topic'].split('.')[2] for msg in messages} == {'ci', 'example', 'platformci'}
+
+    report = throughput.main(['--messages', '100', '--input', path])
+    assert report['params']['input'] == path
+    assert report['results']['messages'] == 100
+    assert report['results']['results_created'] > 100
+    assert report['results']['results_rejected'] == 0
+    assert not [record for record in caplog.records if record.levelno >= logging.ERROR]
+
+
+def test_loadgen_consume():
+    results = loadgen.main(['--count', '20', '--rate', '1000', '--consume'])
+    assert results['messages'] == 20
+    assert results['results_created'] >= 20
+
+
+def test_soak_parse_duration():
+    assert soak.parse_duration('90') == 90
+    assert soak.parse_duration('1.5m') == 90
+    assert soak.parse_duration('4h') == 4 * 3600
+
+
+def test_soak_slope():
+    assert soak.slope([0, 1, 2, 3], [5, 7, 9, 11]) == 2
+    assert soak.slope([0, 1], [3, 3]) == 0
+    assert soak.slope([1], [3]) == 0
+
+
+def test_soak():
+    generator = loadgen.MessageGenerator(mix={'ci_umb': 1, 'resultsdb': 1})
+    with StubResultsDB() as stub:
+        report = soak.soak(generator, stub, duration=0.6, interval=0.1, top=5)
+
+    assert not tracemalloc.is_tracing()
+    assert report['messages'] > 0
+    assert report['results_created'] >= report['messages']
+    assert len(report['samples']) >= 5
+    sample = report['samples'][-1]
+    assert sample['rss'] > 0
+    assert sample['fds'] > 0
+    assert sample['connections'] == 1
+    assert set(report['growth']) == {
+        'rss_bytes_per_hour', 'fds_per_hour', 'connections_per_hour'}
+    assert len(report['top_allocators']) == 5
@@ -0,0 +1,87 @@
+import threading
+import time
+
+import mock
+import pytest
+
+from resultsdbupdater.cache import SingleFlight, TTLCache
+
+
+def test_cache_hit_and_miss():
+    cache = TTLCache(maxsize=10, ttl=60)
+    assert cache.get('a') is None
+    cache.set('a', 1)
+    assert cache.get('a') == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_cache_lru_eviction():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+    assert len(cache) == 2
+
+
+def test_cache_expiration():
+    cache = TTLCache(maxsize=10, ttl=60)
+    with mock.patch('resultsdbupdater.cache.time.time', return_value=1000):
+        cache.set('a', 1)
+    with mock.patch('resultsdbupdater.cache.time.time', return_value=1059):
+        assert cache.get('a') == 1
+    with mock.patch('resultsdbupdater.cache.time.time', return_value=1061):
+        assert cache.get('a') is None
+    assert len(cache) == 0
+
+
+def test_cache_disabled():
+    cache = TTLCache(maxsize=0, ttl=60)
+    cache.set('a', 1)
+    assert cache.get('a') is None
+
+
+def test_single_flight_shares_call():
+    single_flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def lookup():
+        calls.append(1)
+        started.set()
+        release.wait()
+        return 'uuid-1'
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(single_flight.do('a', lookup)))
+        for _ in range(5)
+    ]
+    threads[0].start()
+    started.wait()
+    for thread in threads[1:]:
+        thread.start()
+    while single_flight.shared < 4:
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert calls == [1]
+    assert results == ['uuid-1'] * 5
+
+
+def test_single_flight_error():
+    single_flight = SingleFlight()
+
+    def lookup():
+        raise RuntimeError('lookup failed')
+
+    with pytest.raises(RuntimeError, match='lookup failed'):
+        single_flight.do('a', lookup)
+
+    assert single_flight.do('a', lambda: 'uuid-1') == 'uuid-1'
@@ -0,0 +1,89 @@
+import mock
+import pytest
+import requests
+
+from resultsdbupdater import circuit, exceptions, session, utils
+
+
+def failing_call(breaker, error=RuntimeError):
+    with pytest.raises(error):
+        with breaker.guard():
+            raise error()
+
+
+def test_circuit_opens_on_failure_rate():
+    breaker = circuit.CircuitBreaker(failure_rate=0.5, window=4, min_calls=4)
+    with breaker.guard():
+        pass
+    failing_call(breaker)
+    with breaker.guard():
+        pass
+    assert breaker.state == circuit.CLOSED
+
+    failing_call(breaker)
+    assert breaker.state == circuit.OPEN
+    with pytest.raises(exceptions.CircuitOpenError):
+        breaker.allow()
+    assert breaker.stats() == {'state': 'open', 'opened': 1, 'rejected': 1}
+
+
+def test_circuit_half_open_probe():
+    breaker = circuit.CircuitBreaker(failure_rate=1, min_calls=1, reset_timeout=30)
+    with mock.patch('resultsdbupdater.circuit.time.time', return_value=1000):
+        failing_call(breaker)
+    assert breaker.state == circuit.OPEN
+
+    with mock.patch('resultsdbupdater.circuit.time.time', return_value=1031):
+        # Only a single probe is allowed
+        breaker.allow()
+        assert breaker.state == circuit.HALF_OPEN
+        with pytest.raises(exceptions.CircuitOpenError):
+            breaker.allow()
+
+        breaker.record(False)
+        assert breaker.state == circuit.OPEN
+
+    with mock.patch('resultsdbupdater.circuit.time.time', return_value=1062):
+        with breaker.guard():
+            pass
+    assert breaker.state == circuit.CLOSED
+
+
+def test_circuit_ignores_non_failures():
+    breaker = circuit.CircuitBreaker(
+        failure_rate=0.5, min_calls=1, is_failure=session.is_server_failure)
+    failing_call(breaker, exceptions.InvalidMessageError)
+    assert breaker.state == circuit.CLOSED
+    failing_call(breaker, requests.exceptions.ConnectionError)
+    assert breaker.state == circuit.OPEN
+
+
+def test_circuit_disabled():
+    breaker = circuit.CircuitBreaker(failure_rate=0, min_calls=1)
+    for _ in range(10):
+        failing_call(breaker)
+    breaker.allow()
+    assert breaker.state == circuit.CLOSED
+
+
+@pytest.mark.parametrize(('status_code', 'failure'), [
+    (400, False),
+    (404, False),
+    (500, True),
+    (503, True),
+])
+def test_is_server_failure(status_code, failure):
+    response = requests.Response()
+    response.status_code = status_code
+    error = requests.exceptions.HTTPError(response=response)
+    assert session.is_server_failure(error) == failure
+
+
+def test_post_result_fails_fast():
+    breaker = circuit.CircuitBreaker(failure_rate=1, min_calls=1)
+    failing_call(breaker)
+    with mock.patch('resultsdbupdater.utils.circuit_breaker', breaker), \
+            mock.patch('resultsdbupdater.utils.session') as mock_session:
+        with pytest.raises(exceptions.CircuitOpenError):
+            utils.post_result(mock.Mock(), '{}')
+        mock_session.post.assert_not_called()
@@ -24,3 +24,26 @@ def test_get_http_auth(user, password, url, result, error):
     else:
         auth = config.get_http_auth(user, password, url)
         assert auth == result
+
+
+@pytest.mark.parametrize(
+    ('failure_rate', 'spool_path', 'workers', 'deadline', 'client', 'error'),
+    [
+        # Circuit breaker disabled
+        (0, None, 0, 0, 'requests', None),
+        # Rejected results stay in the spool
+        (0.5, '/spool.db', 0, 0, 'requests', None),
+        # Rejected results are retried by workers
+        (0.5, None, 2, 600, 'requests', None),
+        # Rejected results would be lost
+        (0.5, None, 0, 0, 'requests', RuntimeError),
+        (0.5, None, 2, 0, 'requests', RuntimeError),
+        (0.5, None, 2, 600, 'asyncio', RuntimeError),
+    ])
+def test_check_circuit_breaker(failure_rate, spool_path, workers, deadline, client, error):
+    args = (failure_rate, spool_path, workers, deadline, client)
+    if error:
+        with pytest.raises(error, match='Circuit breaker requires'):
+            config.check_circuit_breaker(*args)
+    else:
+        config.check_circuit_breaker(*args)
@@ -1,13 +1,17 @@
 from __future__ import unicode_literals
 from os import path
 import json
+import threading
+import time
 
 import pytest
 import mock
 import requests
 
 import resultsdbupdater.utils
+from resultsdbupdater import metrics
 from resultsdbupdater.message import create_message
+from resultsdbupdater.spool import Spool
 
 from resultsdbupdater import consumer as ciconsumer
 
@@ -24,6 +28,11 @@ uuid_patcher = mock.patch(
 uuid_patcher.start()
 
 
+@pytest.fixture(autouse=True)
+def clear_group_cache():
+    resultsdbupdater.utils.group_cache.clear()
+
+
 @pytest.fixture
 def mock_session():
     with mock.patch('resultsdbupdater.utils.session') as mocked:
@@ -1178,8 +1187,10 @@ def test_full_consume_post_timeout(mock_session):
 
 
 def test_consume_no_exception_on_bad_message(caplog):
+    caplog.set_level('DEBUG')
     consumer.consume({})
-    assert 'Failed to parse message version' in caplog.text
+    assert 'Dropping non-dict message' in caplog.text
+    assert 'Failed to parse message version' not in caplog.text
 
 
 def test_fedora_ci_message_brew_build_test_complete_version_2(mock_session):
@@ -1389,3 +1400,284 @@ def test_unsupported_version(caplog):
         assert any(
             'Unsupported version: 1.0.0' in rec.message
             for rec in caplog.records)
+
+
+def test_consume_with_submission_queue(mock_session):
+    fake_msg = get_fake_msg('message')
+
+    with mock.patch('resultsdbupdater.config.SUBMIT_WORKERS', 2):
+        queued_consumer = ciconsumer.CIConsumer(FakeHub())
+
+    queued_consumer.consume(fake_msg)
+    queued_consumer.stop()
+
+    assert mock_session.post.call_count == 2
+    testcase_names = [
+        json.loads(args[1]['data'])['testcase']['name']
+        for args in mock_session.post.call_args_list
+    ]
+    # Overall result is posted last
+    assert testcase_names == [
+        'baseos.ci-libreswan-brew-rhel-6.9-z-candidate-2-runtest.CI_OSP',
+        'baseos.ci-libreswan-brew-rhel-6.9-z-candidate-2-runtest',
+    ]
+
+
+def test_group_lookup_deferred_to_submission_queue(mock_session):
+    group = {
+        'description': 'https://domain.local/run/12345',
+        'uuid': '529da400-fc74-4b28-af81-52f56816a2cb'
+    }
+    lookup_threads = []
+
+    def get(*args, **kwargs):
+        lookup_threads.append(threading.current_thread())
+        return mock.Mock(status_code=200, **{'json.return_value': {'data': [group]}})
+
+    mock_session.get.side_effect = get
+
+    with mock.patch('resultsdbupdater.config.SUBMIT_WORKERS', 1):
+        queued_consumer = ciconsumer.CIConsumer(FakeHub())
+
+    queued_consumer.consume(get_fake_msg('rpmdiff_message'))
+    queued_consumer.stop()
+
+    # Group is looked up by the worker, not the consumer
+    assert lookup_threads == queued_consumer.submission_queue.workers
+    assert mock_session.post.call_count == 1
+    data = json.loads(mock_session.post.call_args_list[0][1]['data'])
+    assert data['groups'][0]['uuid'] == group['uuid']
+
+
+def test_spool_keeps_result_when_group_lookup_fails(mock_session, tmpdir):
+    spool_path = str(tmpdir.join('spool.db'))
+    mock_session.get.side_effect = requests.exceptions.ConnectionError()
+
+    with mock.patch('resultsdbupdater.config.SPOOL_PATH', spool_path), \
+            mock.patch('resultsdbupdater.config.SPOOL_RETRY_INTERVAL', 60):
+        spool_consumer = ciconsumer.CIConsumer(FakeHub())
+
+    spool_consumer.consume(get_fake_msg('rpmdiff_message'))
+    while not mock_session.get.called:
+        time.sleep(0.01)
+    spool_consumer.stop()
+
+    # Result stays in the spool until its group can be looked up
+    results_spool = Spool(spool_path)
+    _, _, payloads, _ = results_spool.first()
+    assert len(results_spool) == 1
+    assert payloads[0]['groups'][0]['description'] == 'https://domain.local/run/12345'
+    mock_session.post.assert_not_called()
+
+
+def test_group_cache(mock_session):
+    group = {
+        'description': 'https://domain.local/run/12345',
+        'uuid': '529da400-fc74-4b28-af81-52f56816a2cb'
+    }
+    mock_session.get.return_value.json.return_value = {'data': [group]}
+
+    consumer.consume(get_fake_msg('rpmdiff_message'))
+    consumer.consume(get_fake_msg('rpmdiff_message_two'))
+
+    mock_session.get.assert_called_once()
+    assert mock_session.post.call_count == 2
+    for args in mock_session.post.call_args_list:
+        assert json.loads(args[1]['data'])['groups'][0]['uuid'] == group['uuid']
+
+
+def test_group_cache_created_group(mock_session):
+    mock_session.get.return_value.json.return_value = {'data': []}
+
+    consumer.consume(get_fake_msg('rpmdiff_message'))
+    consumer.consume(get_fake_msg('rpmdiff_message_two'))
+
+    # The group created with the first result is used for the second one
+    mock_session.get.assert_called_once()
+    assert resultsdbupdater.utils.group_cache.hits == 1
+
+
+def test_group_lookup_shared_by_concurrent_messages(mock_session):
+    lookup_started = threading.Event()
+    release = threading.Event()
+
+    def get(*args, **kwargs):
+        lookup_started.set()
+        release.wait()
+        return mock.Mock(status_code=200, **{'json.return_value': {'data': []}})
+
+    mock_session.get.side_effect = get
+    shared = resultsdbupdater.utils.group_lookups.shared
+
+    threads = [
+        threading.Thread(target=consumer.consume, args=(get_fake_msg(name),))
+        for name in ('rpmdiff_message', 'rpmdiff_message_two')
+    ]
+    threads[0].start()
+    lookup_started.wait()
+    threads[1].start()
+    while resultsdbupdater.utils.group_lookups.shared == shared:
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    mock_session.get.assert_called_once()
+    assert mock_session.post.call_count == 2
+
+
+def test_skip_redelivered_message(mock_session):
+    fake_msg = get_fake_msg('message')
+
+    with mock.patch('resultsdbupdater.config.DEDUP_CACHE_SIZE', 10):
+        dedup_consumer = ciconsumer.CIConsumer(FakeHub())
+
+    dedup_consumer.consume(fake_msg)
+    dedup_consumer.consume(fake_msg)
+    dedup_consumer.stop()
+
+    assert mock_session.post.call_count == 2
+    assert dedup_consumer.dedup_cache.skipped == 1
+
+
+def test_redeliver_failed_message(mock_session):
+    fake_msg = get_fake_msg('message')
+    mock_session.post.side_effect = [
+        requests.exceptions.ConnectionError(),
+        mock.Mock(status_code=201),
+        mock.Mock(status_code=201),
+    ]
+
+    with mock.patch('resultsdbupdater.config.DEDUP_CACHE_SIZE', 10):
+        dedup_consumer = ciconsumer.CIConsumer(FakeHub())
+
+    dedup_consumer.consume(fake_msg)
+    dedup_consumer.consume(fake_msg)
+    dedup_consumer.stop()
+
+    assert mock_session.post.call_count == 3
+    assert dedup_consumer.dedup_cache.skipped == 0
+
+
+def test_supersede_queued_by_running_message(mock_session):
+    queued_msg = get_fake_msg('platformci_queued_message')
+    running_msg = get_fake_msg('platformci_queued_message')
+    running_msg['topic'] = running_msg['topic'].replace('.queued', '.running')
+
+    with mock.patch('resultsdbupdater.config.SUPERSEDE_WINDOW', 60):
+        supersede_consumer = ciconsumer.CIConsumer(FakeHub())
+
+    acked = metrics.sample('resultsdb_updater_ack_seconds_count')
+    supersede_consumer.consume(queued_msg)
+    supersede_consumer.consume(running_msg)
+    mock_session.post.assert_not_called()
+    # Held results are not acknowledged yet
+    assert metrics.sample('resultsdb_updater_ack_seconds_count') == acked
+    supersede_consumer.stop()
+
+    mock_session.post.assert_called_once()
+    assert metrics.sample('resultsdb_updater_ack_seconds_count') == acked + 1
+    assert json.loads(mock_session.post.call_args[1]['data'])['outcome'] == 'RUNNING'
+    assert supersede_consumer.supersede_buffer.superseded == 1
+
+
+def test_metrics(mock_session):
+    samples = (
+        ('resultsdb_updater_messages_handled_total', {'handler': 'handle_ci_umb'}),
+        ('resultsdb_updater_messages_handled_total', {'handler': 'unhandled'}),
+        ('resultsdb_updater_artifact_messages_total', {'artifact_type': 'brew-build'}),
+        ('resultsdb_updater_responses_total', {'method': 'POST', 'status': '2xx'}),
+        ('resultsdb_updater_request_seconds_count', {'method': 'POST'}),
+        ('resultsdb_updater_ack_seconds_count', {}),
+    )
+    mock_session.post.return_value.status_code = 201
+    before = [metrics.sample(name, **labels) for name, labels in samples]
+
+    consumer.consume(get_fake_msg('platformci_success_message'))
+    consumer.consume(get_fake_msg('bogus'))
+
+    after = [metrics.sample(name, **labels) for name, labels in samples]
+    assert [a - b for a, b in zip(after, before)] == [1] * len(samples)
+    assert metrics.sample('resultsdb_updater_queue_depth') == 0
+
+
+def test_metrics_queue_depth(mock_session):
+    release = threading.Event()
+    mock_session.post.side_effect = lambda *args, **kwargs: release.wait()
+
+    with mock.patch('resultsdbupdater.config.SUBMIT_WORKERS', 1):
+        queued_consumer = ciconsumer.CIConsumer(FakeHub())
+
+    queued_consumer.consume(get_fake_msg('platformci_success_message'))
+    queued_consumer.consume(get_fake_msg('platformci_success_message'))
+    while mock_session.post.call_count == 0:
+        time.sleep(0.01)
+    assert metrics.sample('resultsdb_updater_queue_depth') == 1
+    assert metrics.sample('resultsdb_updater_queue_oldest_age_seconds') > 0
+    release.set()
+    queued_consumer.stop()
+
+
+def test_profile_consume(mock_session):
+    with mock.patch('resultsdbupdater.config.PROFILE_ENABLED', True):
+        profiled_consumer = ciconsumer.CIConsumer(FakeHub())
+
+    profiled_consumer.consume(get_fake_msg('message'))
+    profiled_consumer.stop()
+
+    assert mock_session.post.call_count == 2
+    assert profiled_consumer.profiler.profiled == 1
+    assert 'handle_ci_metrics' in metrics.pages['/profile']()
+
+
+def test_unhandled_message_not_parsed(mock_session, caplog):
+    fake_msg = get_fake_msg('bogus')
+    name = 'resultsdb_updater_messages_handled_total'
+    unhandled = metrics.sample(name, handler='unhandled')
+
+    with mock.patch('resultsdbupdater.consumer.create_message') as mock_create_message, \
+            mock.patch('resultsdbupdater.consumer.PrefixLogger',
+                       side_effect=ciconsumer.PrefixLogger) as mock_prefix_logger:
+        consumer.consume(fake_msg)
+        # Logger is not created for muted unhandled messages
+        mock_prefix_logger.assert_not_called()
+        fake_msg['topic'] = '/topic/VirtualTopic.eng.ci.bogus'
+        consumer.consume(fake_msg)
+
+    mock_create_message.assert_not_called()
+    mock_prefix_logger.assert_called_once_with(
+        fake_msg['headers']['message-id'], mock.ANY, {'topic': fake_msg['topic']})
+    mock_session.post.assert_not_called()
+    assert metrics.sample(name, handler='unhandled') == unhandled + 2
+    assert caplog.text.count('Received unhandled message') == 1
+
+
+@pytest.mark.parametrize('msg_data', (
+    {'topic': '/topic/VirtualTopic.eng.ci.bogus', 'body': None},
+    {'topic': '/topic/VirtualTopic.eng.ci.bogus', 'body': {'msg': 'text'}},
+))
+def test_invalid_message_not_parsed(mock_session, msg_data):
+    failures = metrics.sample('resultsdb_updater_version_parse_failures_total')
+
+    with mock.patch('resultsdbupdater.consumer.create_message') as mock_create_message:
+        consumer.consume(msg_data)
+
+    mock_create_message.assert_not_called()
+    mock_session.post.assert_not_called()
+    assert metrics.sample('resultsdb_updater_version_parse_failures_total') == failures
+
+
+def test_denied_topic(mock_session):
+    fake_msg = get_fake_msg('platformci_success_message')
+    filtered = metrics.sample('resultsdb_updater_messages_filtered_total')
+
+    with mock.patch('resultsdbupdater.config.TOPIC_DENY', ['/topic/VirtualTopic.eng']):
+        filtering_consumer = ciconsumer.CIConsumer(FakeHub())
+
+    with mock.patch('resultsdbupdater.consumer.create_message') as mock_create_message:
+        filtering_consumer.consume(fake_msg)
+    filtering_consumer.stop()
+
+    mock_create_message.assert_not_called()
+    mock_session.post.assert_not_called()
+    assert metrics.sample('resultsdb_updater_messages_filtered_total') == filtered + 1
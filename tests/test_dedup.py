@@ -0,0 +1,47 @@
+from resultsdbupdater import dedup
+
+
+def test_dedup_cache():
+    cache = dedup.DedupCache(2)
+    assert not cache.seen('ID:1')
+    cache.add('ID:1')
+    cache.add('ID:2')
+    assert cache.seen('ID:1')
+    assert cache.seen('ID:2')
+    assert cache.skipped == 2
+
+    # Oldest ID is dropped
+    cache.add('ID:3')
+    assert len(cache) == 2
+    assert not cache.seen('ID:1')
+    assert cache.seen('ID:3')
+
+
+def test_dedup_cache_ignores_unknown_id():
+    cache = dedup.DedupCache(2)
+    cache.add(dedup.UNKNOWN_MSG_ID)
+    assert not cache.seen(dedup.UNKNOWN_MSG_ID)
+    assert len(cache) == 0
+
+
+def test_dedup_cache_persistence(tmpdir):
+    path = str(tmpdir.join('processed.db'))
+    cache = dedup.DedupCache(2, path=path)
+    for msg_id in ('ID:1', 'ID:2', 'ID:3'):
+        cache.add(msg_id)
+    cache.close()
+
+    cache = dedup.DedupCache(2, path=path)
+    assert len(cache) == 2
+    assert not cache.seen('ID:1')
+    assert cache.seen('ID:2')
+    assert cache.seen('ID:3')
+
+    # Most recently added IDs are kept
+    cache.add('ID:2')
+    cache.add('ID:4')
+    cache.close()
+    cache = dedup.DedupCache(2, path=path)
+    assert not cache.seen('ID:3')
+    assert cache.seen('ID:2')
+    assert cache.seen('ID:4')
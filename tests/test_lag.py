@@ -0,0 +1,60 @@
+import mock
+
+from resultsdbupdater import lag, metrics
+from resultsdbupdater.message import Message
+
+
+def create_message(timestamp_header=None, timestamp=None):
+    msg_data = {'headers': {'message-id': 'ID:1'}, 'body': {'msg': {}}}
+    if timestamp_header is not None:
+        msg_data['headers']['timestamp'] = timestamp_header
+    if timestamp is not None:
+        msg_data['timestamp'] = timestamp
+    return Message(msg_data)
+
+
+def test_message_timestamp():
+    assert create_message('1521074210015').timestamp == 1521074210.015
+    # Zero broker timestamp means it was not set
+    assert create_message('0', timestamp=1521074210).timestamp == 1521074210
+    assert create_message('bad').timestamp is None
+    assert create_message().timestamp is None
+
+
+def test_lag_observed():
+    count = metrics.sample('resultsdb_updater_bus_lag_seconds_count')
+    monitor = lag.LagMonitor()
+    assert monitor.observe(create_message('100000'), received=105) == 5
+    assert metrics.sample('resultsdb_updater_bus_lag_seconds_current') == 5
+    assert metrics.sample('resultsdb_updater_bus_lag_seconds_count') == count + 1
+
+
+def test_lag_without_timestamp():
+    count = metrics.sample('resultsdb_updater_bus_lag_seconds_count')
+    monitor = lag.LagMonitor()
+    assert monitor.observe(create_message(), received=105) is None
+    assert metrics.sample('resultsdb_updater_bus_lag_seconds_count') == count
+
+
+def test_lag_clock_skew():
+    monitor = lag.LagMonitor()
+    assert monitor.observe(create_message('100000'), received=99) == 0
+
+
+def test_lag_warning():
+    monitor = lag.LagMonitor(warning_threshold=60)
+    msg = create_message('100000')
+    msg.log = mock.Mock()
+
+    monitor.observe(msg, received=130)
+    msg.log.warning.assert_not_called()
+
+    # Warn only once while lagging
+    monitor.observe(msg, received=200)
+    monitor.observe(msg, received=300)
+    msg.log.warning.assert_called_once()
+    assert monitor.lagging
+
+    monitor.observe(msg, received=110)
+    msg.log.info.assert_called_once()
+    assert not monitor.lagging
@@ -0,0 +1,95 @@
+import io
+import json
+import logging
+
+import pytest
+
+from resultsdbupdater import logs
+from resultsdbupdater.message import PrefixLogger
+
+
+@pytest.fixture
+def logger():
+    logger = logging.getLogger('test_logs')
+    yield logger
+    logger.handlers = []
+    logger.setLevel(logging.NOTSET)
+
+
+def test_json_formatter(logger):
+    stream = io.StringIO()
+    logs.configure_logging('%(message)s', level='INFO', json_format=True,
+                           logger=logger, stream=stream)
+    log = PrefixLogger('ID:1', logger, {'topic': '/topic/test'})
+    log.extra['received'] = 0
+    log.extra['handler'] = 'handle_test'
+    log.info('Processed %s results', 2)
+
+    data = json.loads(stream.getvalue())
+    assert data['logger'] == 'test_logs'
+    assert data['level'] == 'INFO'
+    assert data['message'] == '[ID:1]: Processed 2 results'
+    assert data['msg_id'] == 'ID:1'
+    assert data['topic'] == '/topic/test'
+    assert data['handler'] == 'handle_test'
+    assert data['elapsed'] > 0
+
+
+def test_json_formatter_exception(logger):
+    stream = io.StringIO()
+    logs.configure_logging('%(message)s', json_format=True, logger=logger, stream=stream)
+    try:
+        raise RuntimeError('failure')
+    except RuntimeError:
+        logger.exception('Unexpected exception')
+
+    data = json.loads(stream.getvalue())
+    assert data['message'] == 'Unexpected exception'
+    assert 'RuntimeError: failure' in data['exception']
+    assert 'msg_id' not in data
+
+
+def test_queue_handler(logger):
+    stream = io.StringIO()
+    listener = logs.configure_logging(
+        '%(levelname)s %(message)s', use_queue=True, logger=logger, stream=stream)
+    logger.warning('Queued %s', 'warning')
+    listener.queue.join()
+
+    assert stream.getvalue() == 'WARNING Queued warning\n'
+
+
+def test_configure_logging_keeps_existing_handlers(logger):
+    handler = logging.NullHandler()
+    logger.addHandler(handler)
+    assert logs.configure_logging('%(message)s', use_queue=True, logger=logger) is None
+    assert logger.handlers == [handler]
+
+
+def test_rate_limit(logger, monkeypatch):
+    stream = io.StringIO()
+    logs.configure_logging(
+        '%(message)s', level='INFO', rate_limit=60, logger=logger, stream=stream)
+    now = [1000.0]
+    monkeypatch.setattr('time.time', lambda: now[0])
+
+    for msg_id in ('ID:1', 'ID:2', 'ID:3'):
+        PrefixLogger(msg_id, logger).warning('Received unhandled message %s', msg_id)
+    logger.warning('Other warning')
+    logger.info('Info is not rate limited')
+    logger.info('Info is not rate limited')
+    for msg_id in ('ID:1', 'ID:2'):
+        PrefixLogger(msg_id, logger).error('Failed to process message: %s', 'Bad')
+
+    now[0] += 61
+    PrefixLogger('ID:4', logger).warning('Received unhandled message %s', 'ID:4')
+
+    assert stream.getvalue().splitlines() == [
+        '[ID:1]: Received unhandled message ID:1',
+        'Other warning',
+        'Info is not rate limited',
+        'Info is not rate limited',
+        '[ID:1]: Failed to process message: Bad',
+        '[ID:2]: Failed to process message: Bad',
+        '[ID:4]: Received unhandled message ID:4 (2 similar messages suppressed)',
+    ]
@@ -0,0 +1,194 @@
+import logging
+import subprocess
+import sys
+
+import mock
+import pytest
+
+from resultsdbupdater import config, exceptions, message, metrics
+from resultsdbupdater.message import (
+    LoggedPayload,
+    Message,
+    MessageV2,
+    MessageV2_1,
+    PrefixLogger,
+    Result,
+    ResultV2,
+    create_message,
+    debug_payload,
+)
+
+
+def test_prefix_logger(caplog):
+    log = PrefixLogger('ID:1', logging.getLogger('test_prefix_logger'))
+    with caplog.at_level(logging.INFO):
+        log.info('Hello %s', 'world')
+        log.warning('Extra', extra={'handler': 'test'})
+
+    first, second = caplog.records
+    assert first.getMessage() == '[ID:1]: Hello world'
+    assert first.msg_id == 'ID:1'
+    assert second.msg_id == 'ID:1'
+    assert second.handler == 'test'
+
+
+def test_prefix_logger_skips_disabled_levels():
+    logger = logging.getLogger('test_prefix_logger_disabled')
+    logger.setLevel(logging.INFO)
+    log = PrefixLogger('ID:1', logger)
+
+    with mock.patch.object(PrefixLogger, 'process') as process:
+        log.debug('Hidden %s', 'message')
+
+    process.assert_not_called()
+
+
+@mock.patch.object(config, 'LOG_PAYLOAD_LIMIT', 10)
+def test_logged_payload_cropped():
+    assert str(LoggedPayload('short')) == 'short'
+    assert str(LoggedPayload('x' * 25)) == 'x' * 10 + '... (15 characters cropped)'
+    text = str(LoggedPayload({'key': 'x' * 10000}))
+    assert text.startswith("{'key': 'x")
+    assert text.endswith(' characters cropped)')
+    assert len(text) < 50
+
+
+@mock.patch.object(config, 'LOG_PAYLOAD_LIMIT', 0)
+def test_logged_payload_unlimited():
+    payload = {'key': 'x' * 10000}
+    assert str(LoggedPayload(payload)) == str(payload)
+
+
+@mock.patch.object(config, 'LOG_PAYLOAD_EVERY', 3)
+def test_debug_payload_sampled():
+    log = mock.Mock()
+    log.isEnabledFor.return_value = True
+    for i in range(9):
+        debug_payload(log, 'Payload: %s', i)
+
+    assert log.debug.call_count == 3
+
+
+def test_debug_payload_disabled():
+    log = mock.Mock()
+    log.isEnabledFor.return_value = False
+    debug_payload(log, 'Payload: %s', 'data')
+    log.debug.assert_not_called()
+
+
+def message_data(version='0.2.1', **body):
+    body.setdefault('version', version)
+    return {
+        'topic': '/topic/VirtualTopic.eng.ci.test.brew-build.test.complete',
+        'headers': {'message-id': 'ID:1'},
+        'body': {'msg': body},
+    }
+
+
+def test_message_get_cached():
+    msg = create_message(message_data(artifact={'type': 'brew-build', 'id': None}))
+
+    assert msg.get('artifact', 'type') == 'brew-build'
+    assert msg.get('artifact', 'id', default='unknown') is None
+    assert msg.get('artifact', 'nvr', default='unknown') == 'unknown'
+    assert msg.get('artifact', 'type', 'nested', default=None) is None
+    with pytest.raises(exceptions.MissingMessageField, match='artifact.nvr'):
+        msg.get('artifact', 'nvr')
+    # Missing field is cached too.
+    with pytest.raises(exceptions.MissingMessageField, match='artifact.nvr'):
+        msg.get('artifact', 'nvr')
+
+    msg.body['artifact'] = {'type': 'changed'}
+    assert msg.get('artifact', 'type') == 'brew-build'
+
+
+def test_message_slots():
+    msg = create_message(message_data())
+    assert not hasattr(msg, '__dict__')
+    assert not hasattr(msg.result, '__dict__')
+    assert msg.result is msg.result
+    assert msg.msg_id == 'ID:1'
+
+
+@pytest.mark.parametrize('system', (
+    {'os': 'rhel'},
+    [{'os': 'rhel'}],
+))
+def test_message_system(system):
+    msg = create_message(message_data(system=system))
+    assert msg.system('os') == 'rhel'
+    assert msg.system('provider', default=None) is None
+    with pytest.raises(exceptions.MissingMessageField, match='system.provider'):
+        msg.system('provider')
+
+
+def test_message_system_missing():
+    msg = create_message(message_data(system=[]))
+    assert msg.system('os', default='unknown') == 'unknown'
+
+
+@pytest.mark.parametrize(('version', 'message_class', 'result_class', 'contact_field'), (
+    ('0.1.0', Message, Result, 'ci'),
+    ('0.2.0', MessageV2, ResultV2, 'ci'),
+    ('0.2.1', MessageV2_1, ResultV2, 'contact'),
+))
+def test_message_versions(version, message_class, result_class, contact_field):
+    msg = create_message(message_data(version, **{contact_field: {'name': 'CI'}}))
+    assert type(msg) is message_class
+    assert type(msg.result) is result_class
+    assert msg.contact('name') == 'CI'
+    assert msg.contact('irc', default=None) is None
+
+
+def test_message_without_body():
+    failures = metrics.sample('resultsdb_updater_version_parse_failures_total')
+    msg = create_message({'body': {'msg': None}})
+    assert type(msg) is Message
+    assert metrics.sample('resultsdb_updater_version_parse_failures_total') == failures
+    with pytest.raises(exceptions.MissingMessageField):
+        msg.get('version')
+
+
+@pytest.mark.parametrize(('version', 'expected_class'), (
+    ('0.1.0', Message),
+    ('0.1.99', Message),
+    ('0.2.0', MessageV2),
+    ('0.2.1', MessageV2_1),
+    ('0.3.0', MessageV2_1),
+))
+def test_message_class(version, expected_class):
+    assert message.message_class(version) is expected_class
+
+
+def test_message_class_cached():
+    message.message_class.cache_clear()
+    for _ in range(3):
+        create_message(message_data('0.2.0'))
+        create_message(message_data('0.2.1'))
+
+    info = message.message_class.cache_info()
+    assert info.misses == 2
+    assert info.hits == 4
+
+
+@pytest.mark.parametrize('version', ('bad', '', ['0.2.0']))
+def test_message_version_parse_failure(version, caplog):
+    failures = metrics.sample('resultsdb_updater_version_parse_failures_total')
+    message.message_class.cache_clear()
+
+    for _ in range(2):
+        msg = create_message(message_data(version))
+        assert type(msg) is Message
+
+    assert metrics.sample('resultsdb_updater_version_parse_failures_total') == failures + 2
+    assert message.message_class.cache_info().currsize == 0
+    assert 'Failed to parse message version' in caplog.text
+
+
+def test_semantic_version_imported_lazily():
+    code = (
+        'import sys; import resultsdbupdater.message as m; '
+        'assert "semantic_version" not in sys.modules; '
+        'm.message_class("0.2.0"); '
+        'assert "semantic_version" in sys.modules')
+    subprocess.check_call([sys.executable, '-c', code])
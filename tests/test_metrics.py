@@ -0,0 +1,52 @@
+import urllib.error
+import urllib.request
+
+import prometheus_client
+import pytest
+
+from resultsdbupdater import metrics
+
+
+@pytest.fixture
+def registry():
+    return prometheus_client.CollectorRegistry()
+
+
+def test_function_counter(registry):
+    counter = metrics.FunctionCounter('test_total', 'Test counter.', registry=registry)
+    assert registry.get_sample_value('test_total') is None
+    counter.set_function(lambda: 4)
+    assert registry.get_sample_value('test_total') == 4
+    assert '# TYPE test_total counter' in prometheus_client.generate_latest(
+        registry).decode('utf-8')
+
+
+def test_observe_response():
+    created = metrics.sample('resultsdb_updater_responses_total', method='POST', status='2xx')
+    metrics.observe_response('POST', 201)
+    assert metrics.sample(
+        'resultsdb_updater_responses_total', method='POST', status='2xx') == created + 1
+
+
+def test_sample_missing():
+    assert metrics.sample('resultsdb_updater_missing_total') == 0
+
+
+def test_http_server():
+    metrics.messages_received.inc()
+    metrics.pages['/test'] = lambda: 'test page'
+    server = metrics.start_http_server(0, '127.0.0.1')
+    try:
+        url = 'http://127.0.0.1:{0}'.format(server.server_port)
+        with urllib.request.urlopen(url + '/metrics') as response:
+            assert response.headers['content-type'] == metrics.CONTENT_TYPE
+            body = response.read().decode('utf-8')
+        with urllib.request.urlopen(url + '/test') as response:
+            assert response.read() == b'test page'
+        with pytest.raises(urllib.error.HTTPError):
+            urllib.request.urlopen(url + '/missing')
+    finally:
+        server.shutdown()
+        del metrics.pages['/test']
+
+    assert '# TYPE resultsdb_updater_messages_received_total counter' in body
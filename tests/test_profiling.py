@@ -0,0 +1,70 @@
+import os
+import pstats
+import signal
+
+import mock
+
+from resultsdbupdater import profiling
+
+
+def work(value):
+    return sum(range(value))
+
+
+def test_profile_every_nth_call():
+    profiler = profiling.Profiler(every=2)
+    profiler.enable()
+    results = [profiler.run(work, 10) for _ in range(5)]
+    assert results == [45] * 5
+    assert profiler.profiled == 2
+    assert 'work' in profiler.report()
+
+
+def test_profiler_disabled():
+    profiler = profiling.Profiler()
+    assert profiler.run(work, 10) == 45
+    assert profiler.profiled == 0
+    assert profiler.report() == 'No profiled calls\n'
+
+
+def test_profiler_duration():
+    profiler = profiling.Profiler(duration=60)
+    with mock.patch('resultsdbupdater.profiling.time.time', return_value=1000):
+        profiler.enable()
+        profiler.run(work, 10)
+    with mock.patch('resultsdbupdater.profiling.time.time', return_value=1061):
+        profiler.run(work, 10)
+    assert profiler.profiled == 1
+    assert not profiler.enabled
+
+
+def test_profiler_dump(tmpdir):
+    path = str(tmpdir.join('profile.stats'))
+    profiler = profiling.Profiler(path=path)
+    profiler.enable()
+    profiler.run(work, 10)
+    profiler.disable()
+
+    stats = pstats.Stats(path)
+    assert any(name == 'work' for _, _, name in stats.stats)
+    with open(path + '.txt') as report:
+        assert 'work' in report.read()
+
+
+def test_profiler_signal_toggle():
+    with mock.patch.multiple(
+            'resultsdbupdater.config', PROFILE_ENABLED=False, PROFILE_SIGNAL='SIGUSR1'):
+        previous = signal.getsignal(signal.SIGUSR1)
+        try:
+            profiler = profiling.create_profiler()
+            assert not profiler.enabled
+            os.kill(os.getpid(), signal.SIGUSR1)
+            assert profiler.enabled
+            os.kill(os.getpid(), signal.SIGUSR1)
+            assert not profiler.enabled
+        finally:
+            signal.signal(signal.SIGUSR1, previous)
+
+
+def test_profiler_not_configured():
+    assert profiling.create_profiler() is None
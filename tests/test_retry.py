@@ -0,0 +1,39 @@
+import threading
+import time
+
+import mock
+
+from resultsdbupdater import retry, session
+
+
+def test_full_jitter_backoff():
+    with mock.patch('resultsdbupdater.retry.random.uniform') as mock_uniform:
+        retry.full_jitter_backoff(1)
+        mock_uniform.assert_called_with(0, session.BACKOFF_FACTOR * 2)
+        retry.full_jitter_backoff(100)
+        mock_uniform.assert_called_with(0, session.BACKOFF_MAX)
+
+    for attempt in range(1, 10):
+        assert 0 <= retry.full_jitter_backoff(attempt) <= session.BACKOFF_MAX
+
+
+def test_retry_scheduler_runs_calls_in_time_order():
+    scheduler = retry.RetryScheduler()
+    calls = []
+    done = threading.Event()
+    scheduler.call_later(0.2, lambda value: (calls.append(value), done.set()), 'late')
+    scheduler.call_later(0.05, calls.append, 'early')
+    done.wait(5)
+    assert calls == ['early', 'late']
+    assert scheduler.stop() == []
+
+
+def test_retry_scheduler_stop_returns_pending_calls():
+    scheduler = retry.RetryScheduler()
+    fn = mock.Mock()
+    scheduler.call_later(60, fn, 'b')
+    scheduler.call_later(30, fn, 'a')
+    start = time.time()
+    assert scheduler.stop() == [('a',), ('b',)]
+    assert time.time() - start < 5
+    fn.assert_not_called()
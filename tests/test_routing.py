@@ -0,0 +1,80 @@
+import pytest
+
+from resultsdbupdater import routing
+
+
+@pytest.mark.parametrize(('topic', 'expected'), (
+    ('/topic/VirtualTopic.qe.ci.jenkins', True),
+    ('/topic/VirtualTopic.qe.ci.jenkins.build', True),
+    ('/topic/VirtualTopic.qe.ci', False),
+    ('/topic/VirtualTopic.qe.ci.jenkinsx', False),
+    ('/topic/VirtualTopic.eng.ci.osci.brew-build.test.complete', True),
+    ('/topic/VirtualTopic.eng.ci.osci.brew-build.test.error', False),
+    ('/topic/VirtualTopic.eng.ci.osci.brew-build', False),
+    ('', False),
+))
+def test_topic_trie(topic, expected):
+    trie = routing.TopicTrie([
+        '/topic/VirtualTopic.qe.ci.jenkins',
+        '/topic/VirtualTopic.eng.ci.*.*.test.complete',
+    ])
+    assert trie.matches(topic) is expected
+
+
+def test_topic_trie_empty():
+    trie = routing.TopicTrie()
+    assert not trie
+    assert not trie.matches('/topic/VirtualTopic.qe.ci.jenkins')
+
+
+@pytest.mark.parametrize(('topic', 'keys', 'expected'), (
+    (routing.CI_METRICS_TOPIC, {'team'}, routing.CI_METRICS),
+    ('/topic/ci', {'run', 'artifact', 'ci', 'version'}, routing.CI_UMB),
+    ('/topic/ci', {'run', 'artifact', 'contact'}, routing.CI_UMB),
+    ('/topic/ci', {'run', 'artifact'}, routing.UNHANDLED),
+    ('/topic/result', {'data', 'outcome', 'ref_url', 'testcase'}, routing.RESULTSDB_SINGLE),
+    ('/topic/result', {'results', 'ref_url'}, routing.RESULTSDB_BULK),
+    ('/topic/result', {'results'}, routing.UNHANDLED),
+))
+def test_classify(topic, keys, expected):
+    assert routing.classify(topic, frozenset(keys)) == expected
+
+
+def message(topic, body):
+    return {'topic': topic, 'body': {'msg': body}}
+
+
+def test_router_allow_deny():
+    router = routing.Router(
+        allow=['/topic/VirtualTopic.eng'],
+        deny=['/topic/VirtualTopic.eng.ci.noisy-ci'])
+    body = {'results': {}, 'ref_url': 'https://ci/1'}
+
+    assert router.route(message('/topic/VirtualTopic.eng.result', body)) == \
+        routing.RESULTSDB_BULK
+    assert router.route(message('/topic/VirtualTopic.qe.ci.jenkins', body)) == routing.DENIED
+    assert router.route(message('/topic/VirtualTopic.eng.ci.noisy-ci.x', body)) == \
+        routing.DENIED
+    assert router.route({'body': {'msg': body}}) == routing.DENIED
+
+
+def test_router_cache():
+    router = routing.Router()
+    body = {'build': {'number': 1}, 'job': 'noise'}
+    for i in range(3):
+        body['build']['number'] = i
+        assert router.route(message('/topic/VirtualTopic.qe.ci.jenkins', body)) == \
+            routing.UNHANDLED
+
+    assert router.classify.cache_info().hits == 2
+    assert router.classify.cache_info().misses == 1
+    assert router.allowed.cache_info().hits == 2
+
+
+@pytest.mark.parametrize('msg_data', (
+    {},
+    {'body': None},
+    {'body': {'msg': ''}},
+))
+def test_router_invalid(msg_data):
+    assert routing.Router().route(msg_data) == routing.INVALID
@@ -0,0 +1,70 @@
+import json
+
+import mock
+import pytest
+
+from resultsdbupdater import serializer
+
+VALUES = (
+    {'a': 1, 'b': [1.5, None, True, False], 'c': {'d': 'e/f'}},
+    ['text', 'café', '☃', '\U0001f600', '"quoted"\n\\'],
+    {1: 'non-string key'},
+    2 ** 70,
+    '',
+)
+
+
+def available_backends():
+    for backend in serializer.BACKENDS:
+        name, dumps = serializer.select_backend(backend)
+        if name == backend:
+            yield name, dumps
+
+
+@pytest.mark.parametrize(('backend', 'dumps'), list(available_backends()))
+@pytest.mark.parametrize('value', VALUES)
+def test_dumps_same_output(backend, dumps, value):
+    expected = json.dumps(value, separators=(',', ':'))
+    assert dumps(value) == expected
+
+
+def test_dumps_ascii():
+    text = serializer.dumps({'name': 'café \U0001f600'})
+    assert text == '{"name":"caf\\u00e9 \\ud83d\\ude00"}'
+    assert json.loads(text) == {'name': 'café \U0001f600'}
+
+
+def test_dumps_unserializable():
+    with pytest.raises(TypeError):
+        serializer.dumps({'value': object()})
+
+
+def test_select_backend_auto():
+    name, _ = serializer.select_backend()
+    assert name in serializer.BACKENDS
+    assert name == serializer.BACKEND
+
+
+def test_select_backend_json():
+    name, dumps = serializer.select_backend('json')
+    assert name == 'json'
+    assert dumps({'a': [1]}) == '{"a":[1]}'
+
+
+def test_select_backend_not_installed():
+    with mock.patch.dict('sys.modules', {'orjson': None}):
+        with mock.patch('resultsdbupdater.config.LOGGER') as mock_log:
+            name, _ = serializer.select_backend('orjson')
+
+    assert name == 'json'
+    mock_log.warning.assert_called_once_with(
+        'JSON backend %s is not installed, using json', 'orjson')
+
+
+def test_select_backend_unknown():
+    with pytest.raises(ValueError, match='Unknown JSON backend "simplejson"'):
+        serializer.select_backend('simplejson')
+
+
+def test_dumps_value_default_separators():
+    assert serializer.dumps_value({'a': [1, 'café']}) == '{"a": [1, "caf\\u00e9"]}'
@@ -0,0 +1,92 @@
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import mock
+import pytest
+import requests
+from requests.packages.urllib3.connection import HTTPConnection
+
+from resultsdbupdater import circuit, config, session, submission
+
+
+class FailingResultsDB(BaseHTTPRequestHandler):
+    requests = []
+
+    def _reply(self):
+        length = int(self.headers.get('content-length', 0))
+        if length:
+            self.rfile.read(length)
+        self.requests.append(self.command)
+        self.send_response(500)
+        self.send_header('content-length', '0')
+        self.end_headers()
+
+    do_GET = _reply
+    do_POST = _reply
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def resultsdb_url():
+    FailingResultsDB.requests = []
+    server = HTTPServer(('127.0.0.1', 0), FailingResultsDB)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield 'http://127.0.0.1:{0}/api/v2.0'.format(server.server_port)
+    server.shutdown()
+
+
+@pytest.fixture
+def retry_session():
+    # Retry twice without waiting between retries
+    with mock.patch.object(session, 'RETRIES', 2), \
+            mock.patch.object(session, 'BACKOFF_FACTOR', 0):
+        yield session._retry_session()
+
+
+def test_server_errors_open_circuit(resultsdb_url, retry_session):
+    breaker = circuit.CircuitBreaker(
+        failure_rate=1, min_calls=1, is_failure=session.is_server_failure)
+    with pytest.raises(requests.exceptions.RetryError) as e:
+        with breaker.guard():
+            retry_session.get('{0}/groups'.format(resultsdb_url))
+
+    assert FailingResultsDB.requests == ['GET'] * 3
+    assert breaker.state == circuit.OPEN
+    assert submission._is_retryable(e.value)
+
+
+@pytest.mark.parametrize('method', ['get', 'post'])
+def test_not_retried_with_retry_deadline(method):
+    # Nothing listens on the port of a closed server
+    server = HTTPServer(('127.0.0.1', 0), FailingResultsDB)
+    url = 'http://127.0.0.1:{0}/api/v2.0/results'.format(server.server_port)
+    server.server_close()
+
+    with mock.patch.object(config, 'SUBMIT_WORKERS', 1), \
+            mock.patch.object(config, 'RETRY_DEADLINE', 60), \
+            mock.patch.object(session, 'RETRIES', 2), \
+            mock.patch.object(session, 'BACKOFF_FACTOR', 0):
+        retry_session = session._retry_session()
+
+    with mock.patch.object(
+            HTTPConnection, '_new_conn', autospec=True,
+            side_effect=HTTPConnection._new_conn) as mock_new_conn:
+        with pytest.raises(requests.exceptions.ConnectionError):
+            getattr(retry_session, method)(url)
+
+    assert mock_new_conn.call_count == 1
+
+
+def test_server_errors_not_retried_with_retry_deadline(resultsdb_url):
+    with mock.patch.object(config, 'SUBMIT_WORKERS', 1), \
+            mock.patch.object(config, 'RETRY_DEADLINE', 60), \
+            mock.patch.object(session, 'RETRIES', 2):
+        retry_session = session._retry_session()
+
+    response = retry_session.get('{0}/groups'.format(resultsdb_url))
+    assert response.status_code == 500
+    assert FailingResultsDB.requests == ['GET']
@@ -0,0 +1,158 @@
+import threading
+import time
+
+import mock
+import pytest
+import requests
+
+from resultsdbupdater import exceptions, spool
+from resultsdbupdater.message import PrefixLogger
+
+
+@pytest.fixture
+def spool_path(tmpdir):
+    return str(tmpdir.join('spool.db'))
+
+
+def test_spool_order_and_persistence(spool_path):
+    results_spool = spool.Spool(spool_path)
+    results_spool.append('ID:1', ['{"a": 1}', '{"a": 2}'])
+    results_spool.append('ID:2', ['{"b": 1}'])
+    results_spool.close()
+
+    results_spool = spool.Spool(spool_path, fsync='never')
+    assert len(results_spool) == 2
+    entry_id, msg_id, payloads, _ = results_spool.first()
+    assert (msg_id, payloads) == ('ID:1', ['{"a": 1}', '{"a": 2}'])
+    results_spool.remove(entry_id)
+    assert results_spool.first()[1:3] == ('ID:2', ['{"b": 1}'])
+
+
+def test_spool_bad_fsync_policy(spool_path):
+    with pytest.raises(RuntimeError, match='Unknown spool fsync policy'):
+        spool.Spool(spool_path, fsync='sometimes')
+
+
+def test_spool_queue_replays_in_order(spool_path):
+    posted = []
+    with mock.patch('resultsdbupdater.utils.post_results') as mock_post_results:
+        mock_post_results.side_effect = lambda log, payloads, _: posted.append(payloads)
+        spool_queue = spool.SpoolQueue(spool.Spool(spool_path))
+        spool_queue.put(PrefixLogger('ID:1', mock.Mock()), ['1', '2'])
+        spool_queue.put(PrefixLogger('ID:2', mock.Mock()), ['3'])
+        while spool_queue.depth():
+            time.sleep(0.01)
+        spool_queue.stop()
+
+    assert posted == [['1', '2'], ['3']]
+
+
+def test_spool_queue_retries_when_resultsdb_down(spool_path):
+    attempts = []
+    done = threading.Event()
+
+    def post_results(log, payloads, posted):
+        attempts.append(payloads)
+        if len(attempts) < 3:
+            raise requests.exceptions.ConnectionError()
+        done.set()
+
+    with mock.patch('resultsdbupdater.utils.post_results') as mock_post_results:
+        mock_post_results.side_effect = post_results
+        spool_queue = spool.SpoolQueue(spool.Spool(spool_path), retry_interval=0.01)
+        spool_queue.put(PrefixLogger('ID:1', mock.Mock()), ['1'])
+        done.wait()
+        spool_queue.stop()
+
+    assert attempts == [['1']] * 3
+    assert len(spool.Spool(spool_path)) == 0
+
+
+def test_spool_queue_does_not_repost_created_results(spool_path):
+    created = []
+    attempts = []
+    done = threading.Event()
+
+    def post_results(log, payloads, posted):
+        attempts.append(list(payloads))
+        for payload in payloads:
+            if payload == 'c' and len(attempts) == 1:
+                raise requests.exceptions.ConnectionError()
+            created.append(payload)
+            posted.append(payload)
+        done.set()
+
+    with mock.patch('resultsdbupdater.utils.post_results') as mock_post_results:
+        mock_post_results.side_effect = post_results
+        spool_queue = spool.SpoolQueue(spool.Spool(spool_path), retry_interval=0.01)
+        spool_queue.put(PrefixLogger('ID:1', mock.Mock()), ['a', 'b', 'c'])
+        done.wait()
+        spool_queue.stop()
+
+    assert created == ['a', 'b', 'c']
+    assert attempts == [['a', 'b', 'c'], ['c']]
+    assert len(spool.Spool(spool_path)) == 0
+
+
+def test_spool_queue_drops_rejected_results(spool_path):
+    with mock.patch('resultsdbupdater.utils.post_results') as mock_post_results:
+        mock_post_results.side_effect = exceptions.CreateResultError('Bad', '1')
+        spool_queue = spool.SpoolQueue(spool.Spool(spool_path))
+        spool_queue.put(PrefixLogger('ID:1', mock.Mock()), ['1'])
+        while spool_queue.depth():
+            time.sleep(0.01)
+        spool_queue.stop()
+
+    mock_post_results.assert_called_once()
+
+
+def test_spool_queue_keeps_results_on_stop(spool_path):
+    with mock.patch('resultsdbupdater.utils.post_results') as mock_post_results:
+        mock_post_results.side_effect = requests.exceptions.ConnectionError()
+        spool_queue = spool.SpoolQueue(spool.Spool(spool_path), retry_interval=60)
+        spool_queue.put(PrefixLogger('ID:1', mock.Mock()), ['1'])
+        while not mock_post_results.called:
+            time.sleep(0.01)
+        spool_queue.stop()
+
+    assert spool.Spool(spool_path).first()[1:3] == ('ID:1', ['1'])
+
+
+def test_spool_queue_keeps_resolved_payloads(spool_path):
+    def post_results(log, payloads, posted):
+        payloads[0] = '{"groups": [{"uuid": "1"}]}'
+        raise requests.exceptions.ConnectionError()
+
+    with mock.patch('resultsdbupdater.utils.post_results') as mock_post_results:
+        mock_post_results.side_effect = post_results
+        spool_queue = spool.SpoolQueue(spool.Spool(spool_path), retry_interval=60)
+        spool_queue.put(PrefixLogger('ID:1', mock.Mock()), [{'groups': [{}]}])
+        while not mock_post_results.called:
+            time.sleep(0.01)
+        spool_queue.stop()
+
+    assert spool.Spool(spool_path).first()[2] == ['{"groups": [{"uuid": "1"}]}']
+
+
+def test_spool_queue_drops_results_failing_with_client_error(spool_path):
+    response = requests.Response()
+    response.status_code = 413
+    posted = []
+
+    def post_results(log, payloads, _):
+        if payloads == ['1']:
+            raise requests.exceptions.HTTPError(response=response)
+        posted.append(payloads)
+
+    with mock.patch('resultsdbupdater.utils.post_results') as mock_post_results:
+        mock_post_results.side_effect = post_results
+        spool_queue = spool.SpoolQueue(spool.Spool(spool_path), retry_interval=60)
+        spool_queue.put(PrefixLogger('ID:1', mock.Mock()), ['1'])
+        spool_queue.put(PrefixLogger('ID:2', mock.Mock()), ['2'])
+        while spool_queue.depth():
+            time.sleep(0.01)
+        spool_queue.stop()
+
+    # The failing entry does not block the next one
+    assert posted == [['2']]
+    assert mock_post_results.call_count == 2
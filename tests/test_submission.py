@@ -0,0 +1,303 @@
+import threading
+import time
+
+import mock
+import pytest
+import requests
+
+from resultsdbupdater import exceptions, profiling, spool, submission
+from resultsdbupdater.message import PrefixLogger
+
+
+@pytest.fixture
+def mock_post_results():
+    with mock.patch('resultsdbupdater.utils.post_results') as mocked:
+        yield mocked
+
+
+@pytest.fixture
+def bulk_results_path():
+    with mock.patch('resultsdbupdater.config.BULK_RESULTS_PATH', '/results/bulk'):
+        yield
+
+
+def test_submission_queue_posts_results(mock_post_results):
+    log = mock.Mock()
+    submission_queue = submission.SubmissionQueue(workers=2, maxsize=10)
+    submission_queue.put(log, ['{"a": 1}', '{"a": 2}'])
+    submission_queue.put(log, ['{"b": 1}'])
+    submission_queue.stop()
+
+    assert sorted(call[0][1] for call in mock_post_results.call_args_list) == [
+        ['{"a": 1}', '{"a": 2}'],
+        ['{"b": 1}'],
+    ]
+
+
+def test_submission_queue_profiles_workers(mock_post_results):
+    def post_results_in_worker(log, payloads, posted):
+        pass
+
+    mock_post_results.side_effect = post_results_in_worker
+    profiler = profiling.Profiler()
+    profiler.enable()
+    submission_queue = submission.SubmissionQueue(workers=1, profiler=profiler)
+    submission_queue.put(mock.Mock(), ['{"a": 1}'])
+    submission_queue.stop()
+
+    assert profiler.profiled == 1
+    assert 'post_results_in_worker' in profiler.report()
+
+
+def test_submission_queue_ack_time_from_received(mock_post_results):
+    submission_queue = submission.SubmissionQueue(workers=1)
+    with mock.patch('resultsdbupdater.metrics.ack_seconds') as mock_ack_seconds:
+        submission_queue.put(mock.Mock(), ['{"a": 1}'], received=time.time() - 10)
+        submission_queue.stop()
+
+    assert mock_ack_seconds.observe.call_args[0][0] >= 10
+
+
+def test_submission_queue_reject_when_full(mock_post_results):
+    posting = threading.Event()
+    release = threading.Event()
+
+    def post_results(log, payloads, posted):
+        posting.set()
+        release.wait()
+
+    mock_post_results.side_effect = post_results
+
+    log = mock.Mock()
+    submission_queue = submission.SubmissionQueue(
+        workers=1, maxsize=1, full_policy='reject')
+    submission_queue.put(log, ['1'])
+    posting.wait()
+    submission_queue.put(log, ['2'])
+    with pytest.raises(exceptions.SubmissionQueueFull):
+        submission_queue.put(log, ['3'])
+
+    release.set()
+    submission_queue.stop()
+    assert mock_post_results.call_count == 2
+
+
+def test_submission_queue_logs_errors(mock_post_results):
+    mock_post_results.side_effect = exceptions.CreateResultError('Bad result', '{}')
+    log = mock.Mock()
+    submission_queue = submission.SubmissionQueue(workers=1)
+    submission_queue.put(log, ['{}'])
+    submission_queue.stop()
+    log.error.assert_called_once_with('Failed to process message: %s', mock.ANY)
+
+
+def test_submission_queue_bad_policy():
+    with pytest.raises(RuntimeError, match='Unknown submission queue full policy'):
+        submission.SubmissionQueue(workers=1, full_policy='drop')
+
+
+def test_submission_queue_batches_messages(mock_post_results, bulk_results_path):
+    log = mock.Mock()
+    with mock.patch('resultsdbupdater.utils.post_results_bulk') as mock_post_results_bulk:
+        mock_post_results_bulk.return_value = True
+        submission_queue = submission.SubmissionQueue(
+            workers=1, batch_size=10, batch_window=0.5)
+        submission_queue.put(log, ['1', '2'])
+        submission_queue.put(log, ['3'])
+        submission_queue.stop()
+
+    mock_post_results_bulk.assert_called_once_with(mock.ANY, ['1', '2', '3'])
+    mock_post_results.assert_not_called()
+
+
+def test_submission_queue_no_batch_window_without_bulk_results(mock_post_results):
+    posted = threading.Event()
+    mock_post_results.side_effect = lambda log, payloads, posted_payloads: posted.set()
+    log = mock.Mock()
+    submission_queue = submission.SubmissionQueue(workers=1, batch_size=10, batch_window=60)
+    submission_queue.put(log, ['1', '2'])
+    # Posted without waiting for the batch window
+    assert posted.wait(5)
+    submission_queue.put(log, ['3'])
+    submission_queue.stop()
+
+    assert mock_post_results.call_args_list == [
+        mock.call(log, ['1', '2'], []),
+        mock.call(log, ['3'], []),
+    ]
+
+
+def test_batch_window_without_bulk_results_warns(caplog):
+    with mock.patch('resultsdbupdater.config.SUBMIT_WORKERS', 1), \
+            mock.patch('resultsdbupdater.config.BATCH_WINDOW', 1):
+        submission_queue = submission.create_submission_queue()
+    submission_queue.stop()
+
+    assert 'Option batch_window is ignored without bulk_results_path' in caplog.text
+
+
+def test_submission_queue_batch_fallback(mock_post_results, bulk_results_path):
+    log1 = mock.Mock()
+    log2 = mock.Mock()
+    with mock.patch('resultsdbupdater.utils.post_results_bulk') as mock_post_results_bulk:
+        mock_post_results_bulk.return_value = False
+        submission_queue = submission.SubmissionQueue(
+            workers=1, batch_size=10, batch_window=0.5)
+        submission_queue.put(log1, ['1', '2'])
+        submission_queue.put(log2, ['3'])
+        submission_queue.stop()
+
+    assert mock_post_results.call_args_list == [
+        mock.call(log1, ['1', '2'], []),
+        mock.call(log2, ['3'], []),
+    ]
+
+
+def test_submission_queue_batch_size(mock_post_results, bulk_results_path):
+    log = mock.Mock()
+    with mock.patch('resultsdbupdater.utils.post_results_bulk') as mock_post_results_bulk:
+        mock_post_results_bulk.return_value = True
+        submission_queue = submission.SubmissionQueue(
+            workers=0, batch_size=3, batch_window=0.5)
+        submission_queue.put(log, ['1', '2'])
+        submission_queue.put(log, ['3', '4'])
+        submission_queue.put(log, ['5'])
+        submission_queue.put(log, ['6', '7', '8', '9'])
+        submission_queue.put(log, ['10'])
+        worker = threading.Thread(target=submission_queue._work)
+        submission_queue.workers.append(worker)
+        worker.start()
+        submission_queue.stop()
+
+    assert mock_post_results_bulk.call_args_list == [
+        mock.call(mock.ANY, ['3', '4', '5']),
+    ]
+    assert mock_post_results.call_args_list == [
+        mock.call(log, ['1', '2'], []),
+        mock.call(log, ['6', '7', '8', '9'], []),
+        mock.call(log, ['10'], []),
+    ]
+
+
+def test_submission_queue_batch_circuit_open(mock_post_results, bulk_results_path):
+    log1 = mock.Mock()
+    log2 = mock.Mock()
+    with mock.patch('resultsdbupdater.utils.post_results_bulk') as mock_post_results_bulk:
+        mock_post_results_bulk.side_effect = exceptions.CircuitOpenError(10)
+        submission_queue = submission.SubmissionQueue(
+            workers=1, batch_size=10, batch_window=0.5)
+        submission_queue.put(log1, ['1', '2'])
+        submission_queue.put(log2, ['3'])
+        submission_queue.stop()
+
+    # Results are not posted again one by one
+    mock_post_results.assert_not_called()
+    for log in (log1, log2):
+        log.error.assert_called_once_with('Failed to process message: %s', mock.ANY)
+        log.exception.assert_not_called()
+
+
+def test_submission_queue_batch_retry(mock_post_results, bulk_results_path):
+    log1 = mock.Mock()
+    log2 = mock.Mock()
+    done = threading.Event()
+
+    def post_results_bulk(log, payloads):
+        if not done.is_set():
+            done.set()
+            raise requests.exceptions.ConnectionError()
+        return True
+
+    with mock.patch('resultsdbupdater.utils.post_results_bulk') as mock_post_results_bulk, \
+            mock.patch('resultsdbupdater.submission.full_jitter_backoff', return_value=0.01):
+        mock_post_results_bulk.side_effect = post_results_bulk
+        submission_queue = submission.SubmissionQueue(
+            workers=1, batch_size=10, batch_window=0.5, retry_deadline=5)
+        submission_queue.put(log1, ['1', '2'])
+        submission_queue.put(log2, ['3'])
+        assert done.wait(5)
+        while mock_post_results_bulk.call_count < 2:
+            time.sleep(0.01)
+        submission_queue.stop()
+
+    # Retried together, without posting results separately
+    assert mock_post_results_bulk.call_args_list == [
+        mock.call(mock.ANY, ['1', '2', '3']),
+        mock.call(mock.ANY, ['1', '2', '3']),
+    ]
+    mock_post_results.assert_not_called()
+    log1.warning.assert_called_once()
+    log2.warning.assert_called_once()
+
+
+def test_submission_queue_retries_failed_results(mock_post_results):
+    attempts = []
+    done = threading.Event()
+
+    def post_results(log, payloads, posted):
+        attempts.append(list(payloads))
+        if len(attempts) == 1:
+            # First result created, then ResultsDB fails
+            posted.append(payloads[0])
+            raise requests.exceptions.ConnectionError()
+        done.set()
+
+    mock_post_results.side_effect = post_results
+
+    log = mock.Mock()
+    with mock.patch('resultsdbupdater.submission.full_jitter_backoff', return_value=0.01):
+        submission_queue = submission.SubmissionQueue(workers=1, retry_deadline=5)
+        submission_queue.put(log, ['1', '2', '3'])
+        assert done.wait(5)
+        submission_queue.stop()
+
+    # Only results not created yet are posted again
+    assert attempts == [['1', '2', '3'], ['2', '3']]
+    log.warning.assert_called_once()
+    log.error.assert_not_called()
+
+
+def test_submission_queue_retry_deadline_fallback(mock_post_results, tmpdir):
+    mock_post_results.side_effect = requests.exceptions.ConnectionError()
+    fallback = spool.Spool(str(tmpdir.join('failed.db')))
+
+    log = PrefixLogger('ID:1', mock.Mock())
+    with mock.patch('resultsdbupdater.submission.full_jitter_backoff', return_value=10):
+        submission_queue = submission.SubmissionQueue(
+            workers=1, retry_deadline=5, fallback=fallback)
+        submission_queue.put(log, ['1', '2'])
+        submission_queue.stop()
+
+    mock_post_results.assert_called_once()
+    assert fallback.first()[1:3] == ('ID:1', ['1', '2'])
+
+
+def test_submission_queue_stop_moves_pending_retries_to_fallback(mock_post_results, tmpdir):
+    mock_post_results.side_effect = requests.exceptions.ConnectionError()
+    fallback = spool.Spool(str(tmpdir.join('failed.db')))
+
+    log = PrefixLogger('ID:1', mock.Mock())
+    with mock.patch('resultsdbupdater.submission.full_jitter_backoff', return_value=1):
+        submission_queue = submission.SubmissionQueue(
+            workers=1, retry_deadline=60, fallback=fallback)
+        submission_queue.put(log, ['1'])
+        while not len(submission_queue.retries):
+            time.sleep(0.01)
+        submission_queue.stop()
+
+    mock_post_results.assert_called_once()
+    assert fallback.first()[1:3] == ('ID:1', ['1'])
+
+
+def test_submission_queue_retry_does_not_block_on_full_queue(mock_post_results, tmpdir):
+    fallback = spool.Spool(str(tmpdir.join('failed.db')))
+    log = PrefixLogger('ID:1', mock.Mock())
+    submission_queue = submission.SubmissionQueue(
+        workers=0, maxsize=1, retry_deadline=60, fallback=fallback)
+    submission_queue.put(log, ['1'])
+
+    job = submission.Job(log, ['2'], deadline=time.time() + 60)
+    submission_queue._requeue(job)
+
+    assert fallback.first()[1:3] == ('ID:1', ['2'])
+    submission_queue.retries.stop()
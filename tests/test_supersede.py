@@ -0,0 +1,64 @@
+import threading
+
+import mock
+
+from resultsdbupdater import supersede
+
+KEY = ('baseos-ci.brew-build.tier1.functional', 'setup-2.8.71-7.el7_4', 'https://ci/1')
+
+
+def test_transient_result_released_after_window():
+    released = threading.Event()
+    submit = mock.Mock(side_effect=lambda *args: released.set())
+    log = mock.Mock()
+    buffer = supersede.SupersedeBuffer(0.05, submit)
+
+    assert buffer.hold(KEY, log, 'queued', 'QUEUED')
+    assert released.wait(5)
+    buffer.stop()
+
+    submit.assert_called_once_with(log, ['queued'])
+    assert buffer.superseded == 0
+    assert len(buffer) == 0
+
+
+def test_later_state_supersedes_held_result():
+    submit = mock.Mock()
+    log = mock.Mock()
+    buffer = supersede.SupersedeBuffer(60, submit)
+
+    assert buffer.hold(KEY, log, 'queued', 'QUEUED')
+    assert buffer.hold(KEY, log, 'running', 'RUNNING')
+    buffer.stop()
+
+    submit.assert_called_once_with(log, ['running'])
+    assert buffer.superseded == 1
+
+
+def test_final_results_are_never_held_or_dropped():
+    submit = mock.Mock()
+    log = mock.Mock()
+    buffer = supersede.SupersedeBuffer(60, submit)
+
+    assert buffer.hold(KEY, log, 'running', 'RUNNING')
+    assert not buffer.hold(KEY, log, 'error', 'ERROR')
+    assert not buffer.hold(KEY, log, 'passed', 'PASSED')
+    buffer.stop()
+
+    submit.assert_not_called()
+    assert buffer.superseded == 1
+
+
+def test_different_runs_are_not_superseded():
+    submit = mock.Mock()
+    log = mock.Mock()
+    buffer = supersede.SupersedeBuffer(60, submit)
+
+    other_key = KEY[:2] + ('https://ci/2',)
+    assert buffer.hold(KEY, log, 'queued 1', 'QUEUED')
+    assert buffer.hold(other_key, log, 'queued 2', 'QUEUED')
+    buffer.stop()
+
+    assert sorted(call[0][1] for call in submit.call_args_list) == [
+        ['queued 1'], ['queued 2']]
+    assert buffer.superseded == 0
@@ -1,3 +1,5 @@
+import json
+
 import mock
 import pytest
 import requests
@@ -114,6 +116,75 @@ def test_list_too_large():
         utils.crop_data(log, data)
 
 
+def test_multibyte_string_too_large():
+    """
+    Size of result data values is limited in bytes.
+    """
+    data = {'reason': 'x' + '\u00e9' * 4096}
+    log = mock.Mock()
+    utils.crop_data(log, data)
+    assert len(data['reason'].encode('utf-8')) == 8192
+    assert data['reason'] == 'x' + '\u00e9' * 4094 + '...'
+    log.warning.assert_called_with('Cropping large value for field %s', 'reason')
+
+    data = {'reason': '\u00e9' * 4096}
+    log = mock.Mock()
+    utils.crop_data(log, data)
+    assert data == {'reason': '\u00e9' * 4096}
+    log.warning.assert_not_called()
+
+
+def test_result_payload():
+    data = {
+        'item': 'package-1.0-1.el8',
+        'log': 'x' * 8193,
+        'builds': [{'nvr': 'package-1.0-1.el8'}, 'text'],
+        'metadata': {'key': 'caf\u00e9'},
+        'number': 1,
+    }
+    log = mock.Mock()
+    payload = utils.result_payload(log, 'testcase', 'PASSED', 'https://ci/1', data, ['uuid'])
+
+    assert all(ord(c) < 128 for c in payload)
+    assert json.loads(payload) == {
+        'testcase': 'testcase',
+        'groups': ['uuid'],
+        'outcome': 'PASSED',
+        'ref_url': 'https://ci/1',
+        'note': '',
+        'data': {
+            'item': 'package-1.0-1.el8',
+            'log': 'x' * 8189 + '...',
+            'builds': ['{"nvr": "package-1.0-1.el8"}', 'text'],
+            'metadata': '{"key": "caf\\u00e9"}',
+            'number': 1,
+        },
+    }
+    log.warning.assert_called_once_with('Cropping large value for field %s', 'log')
+
+
+def test_result_payload_list_too_large():
+    data = {'builds': [{'nvr': 'x' * 8192}]}
+    message = 'Result value "builds" contains items that are too large'
+    with pytest.raises(exceptions.InvalidMessageError, match=message):
+        utils.result_payload(mock.Mock(), 'testcase', 'PASSED', 'https://ci/1', data)
+
+
+def test_result_payload_serializes_values_once():
+    data = {
+        'metadata': {'key': '\u00e9' * 4096},
+        'builds': [{'nvr': 'package-1.0-1.el8'}],
+    }
+    with mock.patch.object(
+            utils.serializer, 'dumps_value',
+            side_effect=utils.serializer.dumps_value) as mock_dumps_value:
+        with pytest.raises(exceptions.InvalidMessageError, match='"metadata" is too large'):
+            utils.result_payload(mock.Mock(), 'testcase', 'PASSED', 'https://ci/1', data)
+
+    # Escaped characters of the serialized value count towards its size
+    mock_dumps_value.assert_called_once_with({'key': '\u00e9' * 4096})
+
+
 @pytest.mark.parametrize(
     ('status_code', 'exception', 'message'),
     [
@@ -128,3 +199,91 @@ def test_create_results_failure(status_code, exception, message):
         log = mock.Mock()
         with pytest.raises(exception, match=message):
             utils.create_result(log, 'testcase', 'PASSED', 'http://example.com', {})
+
+
+@pytest.fixture
+def bulk_results():
+    with mock.patch('resultsdbupdater.config.BULK_RESULTS_PATH', '/results/bulk'), \
+            mock.patch('resultsdbupdater.utils._bulk_results_supported', True):
+        yield '{0}/results/bulk'.format(utils.config.RESULTSDB_API_URL)
+
+
+def test_post_results_bulk(bulk_results):
+    payloads = ['{"testcase": "a"}', '{"testcase": "b"}']
+    with requests_mock.Mocker() as mocked_requests:
+        mocked_requests.post(bulk_results, status_code=201)
+        utils.post_results(mock.Mock(), payloads)
+        assert mocked_requests.call_count == 1
+        assert mocked_requests.last_request.json() == [{'testcase': 'a'}, {'testcase': 'b'}]
+
+
+def test_post_results_bulk_rejected(bulk_results):
+    url = '{0}/results'.format(utils.config.RESULTSDB_API_URL)
+    payloads = ['{"testcase": "a"}', '{"testcase": "b"}']
+    with requests_mock.Mocker() as mocked_requests:
+        mocked_requests.post(bulk_results, json={'message': 'Bad'}, status_code=400)
+        mocked_requests.post(url, [
+            {'status_code': 201},
+            {'json': {'message': 'Bad'}, 'status_code': 400},
+        ])
+        message = 'Failed to create result: Bad; Payload: {"testcase": "b"}'
+        with pytest.raises(exceptions.CreateResultError, match=message):
+            utils.post_results(mock.Mock(), payloads)
+        assert mocked_requests.call_count == 3
+
+
+def test_post_results_bulk_unsupported(bulk_results):
+    url = '{0}/results'.format(utils.config.RESULTSDB_API_URL)
+    payloads = ['{"testcase": "a"}', '{"testcase": "b"}']
+    with requests_mock.Mocker() as mocked_requests:
+        mocked_requests.post(bulk_results, status_code=404)
+        mocked_requests.post(url, status_code=201)
+        utils.post_results(mock.Mock(), payloads)
+        utils.post_results(mock.Mock(), payloads)
+        assert [request.url for request in mocked_requests.request_history] == [
+            bulk_results, url, url, url, url]
+
+
+def test_collect_results():
+    log = mock.Mock()
+    with utils.collect_results() as outer:
+        utils.create_result(log, 'a', 'PASSED', 'http://example.com', {})
+        with utils.collect_results() as inner:
+            utils.write_results(log, ['{"testcase": "b"}'])
+        utils.write_results(log, inner)
+
+    assert [json.loads(payload)['testcase'] for payload in outer] == ['a', 'b']
+
+
+def test_post_results_concurrently():
+    url = '{0}/results'.format(utils.config.RESULTSDB_API_URL)
+    payloads = ['{{"testcase": "{0}"}}'.format(i) for i in range(10)]
+    with requests_mock.Mocker() as mocked_requests, \
+            mock.patch('resultsdbupdater.config.POST_CONCURRENCY', 4):
+        mocked_requests.post(url, status_code=201)
+        utils.post_results(mock.Mock(), payloads)
+        assert mocked_requests.call_count == 10
+        # The last (overall) result is always posted last
+        assert mocked_requests.last_request.json() == {'testcase': '9'}
+
+
+def test_post_results_concurrently_failure():
+    url = '{0}/results'.format(utils.config.RESULTSDB_API_URL)
+    payloads = ['{"testcase": "a"}', '{"testcase": "b"}', '{"testcase": "overall"}']
+
+    def reply(request, context):
+        context.status_code = 400 if request.json()['testcase'] == 'b' else 201
+        return {'message': 'Bad'}
+
+    log = mock.Mock()
+    with requests_mock.Mocker() as mocked_requests, \
+            mock.patch('resultsdbupdater.config.POST_CONCURRENCY', 4):
+        mocked_requests.post(url, json=reply)
+        message = 'Failed to create result: Bad; Payload: {"testcase": "b"}'
+        with pytest.raises(exceptions.CreateResultError, match=message):
+            utils.post_results(log, payloads)
+        # The overall result is not posted if any other result fails
+        assert mocked_requests.call_count == 2
+
+    log.error.assert_called_once_with(
+        'Failed to post result %s of %s: %s', 2, 2, mock.ANY)